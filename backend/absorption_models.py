@@ -0,0 +1,198 @@
+import numpy as np
+from functools import lru_cache
+from typing import Callable, Dict, Sequence, Tuple
+
+# Registry of sales absorption models.
+# A model is the closed-form cumulative share of a unit type sold after x months of selling, F(x),
+# with F(0) = 0 and F(duration) = 1 (manual curves may stop short of 1). Monthly sales are
+# count * (F(p + 1) - F(p)); every function takes NumPy arrays so a whole unit mix (or many
+# scenarios, or many what-if paths) is evaluated in one call. Fractional x is allowed: velocity
+# shocks in simulations rescale selling time.
+#
+# units_mix.absorption_model (falling back to financial_scenarios.absorption_model) accepts
+# `name` or `name:p1,p2,...`:
+#   linear              constant sales_velocity_per_month, the last month takes the remainder (default)
+#   bell[:spread]       truncated normal monthly sales over the months linear would take;
+#                       spread = sigma / duration (default 0.25)
+#   logistic[:k]        logistic (S-shaped) cumulative sales over the same months, steepness k (default 8)
+#   manual              financial_scenarios.manual_absorption_curve: % of the units sold in each month
+#   inventory[:rate]    rate % of the remaining inventory each month (default absorption_rate_monthly,
+#                       else 5); the month the last unit would go sells the remainder
+
+ModelSpec = Tuple[str, Tuple[float, ...]]
+
+_CUMULATIVE: Dict[str, Callable[..., np.ndarray]] = {}
+_DURATION: Dict[str, Callable[..., np.ndarray]] = {}
+_DEFAULTS: Dict[str, Tuple[float, ...]] = {}
+
+
+def register_model(name: str, duration: Callable[..., np.ndarray], defaults: Tuple[float, ...] = ()):
+    """
+    Decorator: registers cumulative(x, rows, data, *params) -> F(x) for rows `rows` of `data`,
+    with duration(rows, data, *params) -> whole months until the row is sold out.
+    """
+    def decorator(cumulative):
+        _CUMULATIVE[name] = cumulative
+        _DURATION[name] = duration
+        _DEFAULTS[name] = defaults
+        return cumulative
+    return decorator
+
+
+def available_models() -> Sequence[str]:
+    return sorted(_CUMULATIVE)
+
+
+@lru_cache(maxsize=1024)
+def parse_model(value: str) -> ModelSpec:
+    """'bell:0.2' -> ('bell', (0.2,)). Unknown names and malformed params fall back to linear."""
+    name, _, raw_params = (value or "linear").strip().lower().partition(":")
+    name = name.strip()
+    if name not in _CUMULATIVE:
+        return ("linear", ())
+    try:
+        params = tuple(float(p) for p in raw_params.split(",") if p.strip())
+    except ValueError:
+        return ("linear", ())
+    defaults = _DEFAULTS[name]
+    return (name, params + defaults[len(params):])
+
+
+def absorption_data(count: np.ndarray, velocity: np.ndarray, rates: Sequence, curves: Sequence) -> Dict[str, np.ndarray]:
+    """
+    Per-row inputs of the models: unit count, velocity, default inventory rate (percent, NaN when
+    unset) and the manual curves as one padded matrix of cumulative shares (column 0 = 0).
+    """
+    # Rows of a scenario share its curve: accumulate each distinct curve once
+    index: Dict[tuple, int] = {}
+    ids = np.array([index.setdefault(tuple(c) if c else (), len(index)) for c in curves], dtype=np.int64)
+    width = max((len(c) for c in index), default=0)
+    distinct = np.zeros((len(index), width + 1))
+    for i, curve in enumerate(index):
+        if curve:
+            shares = np.maximum(np.asarray(curve, dtype=float), 0.0) / 100
+            distinct[i, 1:len(shares) + 1] = np.minimum(np.cumsum(shares), 1.0)
+            distinct[i, len(shares) + 1:] = distinct[i, len(shares)]
+    lengths = np.array([len(c) for c in index], dtype=np.int64)
+    return {
+        "count": np.asarray(count, dtype=float),
+        "velocity": np.asarray(velocity, dtype=float),
+        "rate": np.array([float(r) if r is not None else np.nan for r in rates], dtype=float),
+        "curve": distinct[ids],
+        "curve_length": lengths[ids]
+    }
+
+
+def _groups(models: Sequence[str]):
+    """Distinct parsed specs -> boolean row masks."""
+    index: Dict[ModelSpec, int] = {}
+    ids = np.array([index.setdefault(parse_model(m), len(index)) for m in models], dtype=np.int64)
+    for spec, i in index.items():
+        yield spec, ids == i
+
+
+def durations(models: Sequence[str], data: Dict[str, np.ndarray]) -> np.ndarray:
+    """Whole months each row sells for (0 for rows with nothing to sell)."""
+    result = np.zeros(len(models), dtype=np.int64)
+    for (name, params), mask in _groups(models):
+        rows = np.flatnonzero(mask)
+        result[rows] = _DURATION[name](rows, data, *params)
+    result[data['count'] <= 0] = 0
+    return result
+
+
+def cumulative_share(models: Sequence[str], x: np.ndarray, rows: np.ndarray, data: Dict[str, np.ndarray]) -> np.ndarray:
+    """F(x) for entries (x, row); x and rows broadcast together (e.g. flat segments or K x months)."""
+    x, rows = np.asarray(x, dtype=float), np.asarray(rows, dtype=np.int64)
+    groups = list(_groups(models))
+    if len(groups) == 1:
+        # One model for every row: no masking, rows stay as given (e.g. a scalar for one unit type)
+        (name, params), _ = groups[0]
+        share = _CUMULATIVE[name](x, rows, data, *params)
+        return np.clip(np.broadcast_to(share, np.broadcast(x, rows).shape), 0.0, 1.0)
+
+    x, rows = np.broadcast_arrays(x, rows)
+    share = np.zeros(x.shape)
+    for (name, params), mask in groups:
+        selected = mask[rows]
+        if selected.any():
+            share[selected] = _CUMULATIVE[name](x[selected], rows[selected], data, *params)
+    return np.clip(share, 0.0, 1.0)
+
+
+def _velocity_duration(rows, data, *_):
+    count, velocity = data['count'][rows], data['velocity'][rows]
+    active = (count > 0) & (velocity > 0)
+    return np.where(active, np.ceil(count / np.where(active, velocity, 1.0)), 0).astype(np.int64)
+
+
+def _erf(x: np.ndarray) -> np.ndarray:
+    """Abramowitz & Stegun 7.1.26 (|error| < 1.5e-7), vectorized; no SciPy."""
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1 - poly * np.exp(-x * x))
+
+
+def _truncated(cdf, x, duration):
+    """Rescales a CDF to [0, duration] so F(0) = 0 and F(duration) = 1."""
+    low, high = cdf(np.zeros_like(duration)), cdf(duration)
+    return np.where(duration > 0, (cdf(np.minimum(x, duration)) - low) / np.maximum(high - low, 1e-12), 1.0)
+
+
+@register_model("linear", duration=_velocity_duration)
+def _linear(x, rows, data):
+    count = data['count'][rows]
+    return np.minimum(x * data['velocity'][rows] / np.maximum(count, 1e-12), 1.0)
+
+
+@register_model("bell", duration=_velocity_duration, defaults=(0.25,))
+def _bell(x, rows, data, spread):
+    duration = _velocity_duration(rows, data).astype(float)
+    sigma = np.maximum(spread * duration, 1e-6)
+    return _truncated(lambda v: 0.5 * (1 + _erf((v - duration / 2) / (sigma * np.sqrt(2)))), x, duration)
+
+
+@register_model("logistic", duration=_velocity_duration, defaults=(8.0,))
+def _logistic(x, rows, data, steepness):
+    duration = _velocity_duration(rows, data).astype(float)
+    scale = np.maximum(duration, 1e-6)
+    return _truncated(lambda v: 1 / (1 + np.exp(-steepness * (v - duration / 2) / scale)), x, duration)
+
+
+def _manual_duration(rows, data):
+    # Months up to the one that completes 100%, or the whole curve when it never does
+    complete = data['curve'][rows] >= 1.0 - 1e-9
+    return np.where(complete.any(axis=1), complete.argmax(axis=1), data['curve_length'][rows]).astype(np.int64)
+
+
+@register_model("manual", duration=_manual_duration)
+def _manual(x, rows, data):
+    # Piecewise-linear in x between the month boundaries of the cumulative curve
+    curve = data['curve']
+    last = curve.shape[1] - 1
+    month = np.clip(np.floor(x).astype(np.int64), 0, max(last - 1, 0))
+    low = curve[rows, month]
+    high = curve[rows, np.minimum(month + 1, last)]
+    return np.where(x >= last, curve[rows, last], low + (np.clip(x, 0, last) - month) * (high - low))
+
+
+def _inventory_rate(rows, data, rate):
+    # Per-row absorption_rate_monthly when the spec has no rate of its own (rate 0)
+    explicit = np.where(rate > 0, rate, data['rate'][rows])
+    return np.clip(np.where(np.isnan(explicit) | (explicit <= 0), 5.0, explicit) / 100, 1e-6, 1.0)
+
+
+def _inventory_duration(rows, data, rate):
+    count, r = data['count'][rows], _inventory_rate(rows, data, rate)
+    # First month in which less than one unit would remain
+    months = np.ceil(np.log(1 / np.maximum(count, 1.0)) / np.log(np.maximum(1 - r, 1e-12)))
+    return np.where(r >= 1.0, 1, np.maximum(months, 1)).astype(np.int64)
+
+
+@register_model("inventory", duration=_inventory_duration, defaults=(0.0,))
+def _inventory(x, rows, data, rate):
+    r = _inventory_rate(rows, data, rate)
+    duration = _inventory_duration(rows, data, rate)
+    return np.where(x >= duration, 1.0, 1 - (1 - r) ** x)
@@ -0,0 +1,109 @@
+import os
+import asyncio
+from datetime import date
+from typing import Dict, List, Optional
+from finance_engine import FinancialEngine
+from db_utils import reconcile_actuals, fetch_monitoring_flows, store_monitoring_metrics
+from workers import run_db, run_engine
+from telemetry import stage_timer
+
+# Feasibility vs monitoring.
+# A trigger queues every (project, month) whose actual_cashflow_entries change (migration 39);
+# reconciliation re-aggregates only those months into monthly_cashflow_report.actual_* and then
+# refreshes the variance metrics of the scenarios whose actuals moved.
+# The sweep also picks up entries written straight to the table (e.g. by the frontend); 0 disables it.
+ACTUALS_RECONCILE_INTERVAL_SECONDS = float(os.getenv("ACTUALS_RECONCILE_INTERVAL_SECONDS", "60"))
+
+
+def monitoring_inputs(rows: List[Dict], as_of: Optional[date] = None):
+    """
+    Report rows -> (projected, actual, current_month) for compare_viability_vs_monitoring.
+    current_month is the first month still taken from projections: the month after the last one
+    with actuals, or with `as_of` the first month dated after it.
+    """
+    projected = {row['project_month_index']: float(row['projected_net_flow'] or 0) for row in rows}
+    actual = {row['project_month_index']: float(row['actual_net_flow'] or 0) for row in rows}
+    end = max(projected, default=-1) + 1
+
+    if as_of is not None:
+        cutoff = as_of.replace(day=1)
+        current_month = next((row['project_month_index'] for row in rows if row['month_date'] > cutoff), end)
+    else:
+        with_actuals = [row['project_month_index'] for row in rows if row['actual_income'] or row['actual_costs']]
+        current_month = max(with_actuals, default=-1) + 1
+    return projected, actual, current_month
+
+
+def compare_scenarios(inputs: Dict[str, tuple]) -> Dict[str, Dict]:
+    """Engine-pool entry point: compare_viability_vs_monitoring for many scenarios in one call."""
+    return {
+        scenario_id: FinancialEngine.compare_viability_vs_monitoring(projected, actual, current_month)
+        for scenario_id, (projected, actual, current_month) in inputs.items()
+    }
+
+
+class ActualsReconciler:
+    """Applies queued actual months and keeps each scenario's monitoring_metrics current."""
+
+    def __init__(self, interval: float = ACTUALS_RECONCILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def reconcile(self, project_id: Optional[str] = None, full: bool = False) -> Dict:
+        """
+        Folds the queued months (one project's, or every project's) into the report and refreshes
+        the variance metrics of the affected scenarios. full=True re-aggregates all of the project's months.
+        """
+        with stage_timer("actuals_reconcile"):
+            summary = await run_db(reconcile_actuals, project_id, full)
+        snapshots = await self.refresh(summary['scenario_ids']) if summary['scenario_ids'] else {}
+        summary['scenarios_refreshed'] = len(snapshots)
+        return summary
+
+    async def refresh(self, scenario_ids: List[str], as_of: Optional[date] = None, store: bool = True) -> Dict[str, Dict]:
+        """
+        Recomputes the feasibility-vs-monitoring comparison from the report rows.
+        Scenarios without report rows are skipped. Only as_of=None snapshots are stored.
+        """
+        with stage_timer("monitoring_metrics"):
+            flows = await run_db(fetch_monitoring_flows, scenario_ids)
+            inputs = {
+                scenario_id: monitoring_inputs(rows, as_of) for scenario_id, rows in flows.items() if rows
+            }
+            if not inputs:
+                return {}
+            snapshots = await run_engine(compare_scenarios, inputs)
+
+        for scenario_id, snapshot in snapshots.items():
+            dates = {row['project_month_index']: row['month_date'] for row in flows[scenario_id]}
+            last_actual = dates.get(snapshot['current_month'] - 1)
+            snapshot['data_through'] = last_actual.isoformat() if last_actual else None
+        if store and as_of is None:
+            await run_db(store_monitoring_metrics, snapshots)
+        return snapshots
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._sweep())
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                summary = await self.reconcile()
+                if summary['months']:
+                    print(f"📒 Reconciled {summary['months']} actual month(s), {summary['scenarios_refreshed']} scenario(s) refreshed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Actuals Reconcile Error: {e}")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+actuals_reconciler = ActualsReconciler()
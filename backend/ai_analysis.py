@@ -0,0 +1,147 @@
+import os
+import random
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+from ai_intelligence import IntelligenceBrain
+from db_utils import store_strategic_analysis
+from workers import run_db
+from telemetry import stage_timer
+
+# Background AI analysis, off the recalculation critical path.
+# Each call gets a timeout; failures retry with exponential backoff + jitter;
+# AI_MAX_CONCURRENCY bounds simultaneous model calls per process.
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "30"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "3"))
+AI_BACKOFF_BASE_SECONDS = float(os.getenv("AI_BACKOFF_BASE_SECONDS", "1.0"))
+
+# on_done(analysis, status) is called with the stored text and "ready", or None and "failed" when every
+# attempt failed, or None and "superseded" when a newer request for the scenario cancelled this one
+OnDone = Callable[[Optional[str], str], Awaitable[None]]
+
+
+class AnalysisDispatcher:
+    """
+    Schedules strategic analyses as background tasks, one in flight per scenario.
+    A newer request for the same scenario supersedes (cancels) the older one: only the latest numbers matter.
+    """
+
+    def __init__(
+        self,
+        brain: IntelligenceBrain,
+        max_concurrency: int = AI_MAX_CONCURRENCY,
+        timeout: float = AI_TIMEOUT_SECONDS,
+        max_retries: int = AI_MAX_RETRIES,
+        backoff_base: float = AI_BACKOFF_BASE_SECONDS,
+    ):
+        self.brain = brain
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._semaphore: asyncio.Semaphore = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.completed = 0
+        self.failed = 0
+        self.superseded = 0
+
+    def schedule(
+        self,
+        scenario_id: str,
+        metrics: Dict,
+        scenario_name: str,
+        costs: List[Dict],
+        health_score: int,
+        on_done: Optional[OnDone] = None,
+        refresh: bool = False,
+    ) -> str:
+        """
+        Starts the analysis in the background and returns its status ('pending' or 'unavailable').
+        refresh=True bypasses the Brain's prompt cache.
+        """
+        if not self.brain.model:
+            return "unavailable"
+        if self._semaphore is None:
+            # Created lazily so it binds to the running loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        previous = self._tasks.get(scenario_id)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+
+        task = asyncio.create_task(
+            self._run(scenario_id, metrics, scenario_name, [dict(c) for c in costs], health_score, on_done, refresh)
+        )
+        self._tasks[scenario_id] = task
+        task.add_done_callback(lambda t: self._forget(scenario_id, t))
+        return "pending"
+
+    def _forget(self, scenario_id: str, task: asyncio.Task):
+        if self._tasks.get(scenario_id) is task:
+            del self._tasks[scenario_id]
+
+    def status(self, scenario_id: str) -> Optional[str]:
+        return "pending" if scenario_id in self._tasks else None
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "superseded": self.superseded,
+        }
+
+    async def _generate(self, metrics: Dict, scenario_name: str, costs: List[Dict], refresh: bool) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                # Hold a slot only while the model is being called, not while backing off
+                async with self._semaphore:
+                    with stage_timer("ai_call"):
+                        return await self.brain.generate_analysis(
+                            metrics, scenario_name, costs, timeout=self.timeout, refresh=refresh
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+                print(f"AI Analysis Retry {attempt + 1}/{self.max_retries} in {delay:.1f}s: {e!r}")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _notify(scenario_id: str, on_done: Optional[OnDone], analysis: Optional[str], status: str):
+        if on_done:
+            try:
+                await on_done(analysis, status)
+            except Exception as e:
+                print(f"AI Analysis Callback Error ({scenario_id}): {e}")
+
+    async def _run(self, scenario_id, metrics, scenario_name, costs, health_score, on_done, refresh):
+        try:
+            analysis = await self._generate(metrics, scenario_name, costs, refresh)
+            with stage_timer("ai_store"):
+                await run_db(store_strategic_analysis, scenario_id, analysis, health_score, metrics)
+            self.completed += 1
+            status = "ready"
+        except asyncio.CancelledError:
+            # Results waiting on this analysis must not stay "pending" (callers re-dispatch superseded ones)
+            await self._notify(scenario_id, on_done, None, "superseded")
+            raise
+        except Exception as e:
+            print(f"AI Analysis Error ({scenario_id}): {e!r}")
+            self.failed += 1
+            analysis, status = None, "failed"
+
+        await self._notify(scenario_id, on_done, analysis, status)
+
+    async def stop(self, grace_seconds: float = 5.0):
+        """Gives in-flight analyses a short grace period, then cancels the rest."""
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=grace_seconds)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
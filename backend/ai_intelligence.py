@@ -1,7 +1,88 @@
 import os
-from google import generativeai as genai
-from typing import Dict, List
+import asyncio
+import hashlib
+from typing import Dict, List, Optional
 from finance_engine import FinancialEngine
+from db_utils import fetch_ai_response, store_ai_response, prune_ai_responses
+from scenario_cache import ResultCache
+from workers import run_db
+
+# Model client used by the Brain: gemini (default) or fake (offline, deterministic; dev and tests)
+AI_MODEL_CLIENT = os.getenv("AI_MODEL_CLIENT", "gemini").lower()
+
+# Prompt memoization. Metrics are bucketed before the prompt is built, so scenarios that differ only
+# in noise share one canonical prompt (and one model call).
+# Tier 1: in-process LRU. Tier 2 (optional): public.ai_prompt_cache, shared by every node.
+# Enable with AI_CACHE_SHARED=true once 38_ai_prompt_cache.sql is applied.
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "2048"))
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(7 * 86400)))
+AI_CACHE_SHARED = os.getenv("AI_CACHE_SHARED", "false").lower() == "true"
+AI_CACHE_MAX_ROWS = int(os.getenv("AI_CACHE_MAX_ROWS", "50000"))
+AI_CACHE_IRR_STEP = float(os.getenv("AI_CACHE_IRR_STEP", "0.005"))      # 0.5 pp of IRR
+AI_CACHE_ROI_STEP = float(os.getenv("AI_CACHE_ROI_STEP", "0.05"))       # 0.05x of ROI
+AI_CACHE_MONEY_DIGITS = int(os.getenv("AI_CACHE_MONEY_DIGITS", "3"))    # significant digits of NPV / costs
+# The shared table is pruned once every this many stores
+AI_CACHE_PRUNE_EVERY = 100
+
+
+def bucket(value: float, step: float) -> float:
+    """Snaps value to the nearest multiple of step (step <= 0 disables bucketing)."""
+    if step <= 0:
+        return float(value)
+    return round(round(float(value) / step) * step, 10)
+
+
+def round_significant(value: float, digits: int) -> float:
+    """Rounds to `digits` significant figures (digits <= 0 disables rounding)."""
+    if digits <= 0 or not value:
+        return float(value)
+    return float(f"{float(value):.{digits}g}")
+
+
+class GeminiClient:
+    """Google Gemini text generation."""
+
+    def __init__(self, api_key: str, model_name: str = 'gemini-1.5-flash'):
+        from google import generativeai as genai
+        genai.configure(api_key=api_key)
+        self.name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+
+class FakeModelClient:
+    """
+    Offline stand-in for the model: returns a deterministic verdict derived from the prompt.
+    `delay` simulates latency and `failures` makes the first N calls raise, to exercise timeouts and retries.
+    """
+
+    def __init__(self, delay: float = 0.0, failures: int = 0):
+        self.name = "fake"
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise RuntimeError(f"Fake model failure {self.calls}/{self.failures}")
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        return f"[fake-analysis {digest}] Verdict: Refine."
+
+
+def create_model_client():
+    if AI_MODEL_CLIENT == "fake":
+        return FakeModelClient()
+    api_key = os.getenv("GOOGLE_GENERATIVE_AI_API_KEY")
+    if api_key:
+        return GeminiClient(api_key)
+    return None
+
 
 class IntelligenceBrain:
     """
@@ -9,16 +90,16 @@ class IntelligenceBrain:
     Combines precise financial math with Generative AI for strategic insights.
     """
     
-    def __init__(self):
-        # Configure Gemini
-        api_key = os.getenv("GOOGLE_GENERATIVE_AI_API_KEY")
-        if api_key:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-        else:
-            self.model = None
-
-    async def get_strategic_analysis(self, metrics: Dict, scenario_name: str, costs: List[Dict]):
+    def __init__(self, client=None, shared_cache: bool = AI_CACHE_SHARED):
+        # Any object with `name` and `async generate(prompt) -> str` (GeminiClient, FakeModelClient, ...)
+        self.model = client if client is not None else create_model_client()
+        self.prompt_cache = ResultCache(AI_CACHE_SIZE, AI_CACHE_TTL_SECONDS)
+        self.shared_cache = shared_cache
+        self.shared_hits = 0
+        self.model_calls = 0
+        self._stores = 0
+
+    async def get_strategic_analysis(self, metrics: Dict, scenario_name: str, costs: List[Dict], refresh: bool = False):
         """
         Takes raw financial metrics and returns a strategic paragraph.
         This is the "Brain" that learns from the data.
@@ -26,6 +107,93 @@ class IntelligenceBrain:
         if not self.model:
             return "Intelligence Engine currently offline. Please check API configuration."
 
+        try:
+            return await self.generate_analysis(metrics, scenario_name, costs, refresh=refresh)
+        except Exception as e:
+            return f"Error connecting to AI Brain: {str(e)}"
+
+    async def generate_analysis(
+        self, metrics: Dict, scenario_name: str, costs: List[Dict],
+        timeout: Optional[float] = None, refresh: bool = False
+    ) -> str:
+        """
+        Same as get_strategic_analysis, but raises on model errors and timeouts (for retrying callers).
+        Responses are memoized by canonical prompt; refresh=True skips the lookup and overwrites the entry.
+        """
+        if not self.model:
+            raise RuntimeError("Intelligence Engine currently offline. Please check API configuration.")
+
+        prompt = self.build_prompt(*self.canonicalize(metrics, scenario_name, costs))
+        prompt_hash = self.prompt_hash(prompt)
+        if not refresh:
+            cached = await self._lookup(prompt_hash)
+            if cached is not None:
+                return cached
+
+        self.model_calls += 1
+        response = await asyncio.wait_for(self.model.generate(prompt), timeout)
+        await self._store(prompt_hash, prompt, response)
+        return response
+
+    def canonicalize(self, metrics: Dict, scenario_name: str, costs: List[Dict]):
+        """Buckets the prompt inputs so immaterial differences map to the same prompt."""
+        canonical_metrics = {
+            "irr": bucket(metrics.get('irr', 0), AI_CACHE_IRR_STEP),
+            "npv": round_significant(metrics.get('npv', 0), AI_CACHE_MONEY_DIGITS),
+            "roi": bucket(metrics.get('roi', 0), AI_CACHE_ROI_STEP),
+        }
+        canonical_costs = [
+            {
+                "item_name": " ".join(str(c['item_name']).split()),
+                "total_estimated": round_significant(float(c['total_estimated'] or 0), AI_CACHE_MONEY_DIGITS),
+            }
+            for c in costs[:5]
+        ]
+        return canonical_metrics, " ".join(str(scenario_name).split()), canonical_costs
+
+    def prompt_hash(self, prompt: str) -> str:
+        canonical = " ".join(prompt.split())
+        return hashlib.sha256(f"{getattr(self.model, 'name', '')}\n{canonical}".encode()).hexdigest()
+
+    async def _lookup(self, prompt_hash: str) -> Optional[str]:
+        response = self.prompt_cache.get(prompt_hash)
+        if response is None and self.shared_cache:
+            try:
+                response = await run_db(fetch_ai_response, prompt_hash, AI_CACHE_TTL_SECONDS)
+            except Exception as e:
+                print(f"AI Cache Lookup Error: {e}")
+                response = None
+            if response is not None:
+                self.shared_hits += 1
+                self.prompt_cache.put(None, prompt_hash, response)
+        return response
+
+    async def _store(self, prompt_hash: str, prompt: str, response: str):
+        self.prompt_cache.put(None, prompt_hash, response)
+        if not self.shared_cache:
+            return
+        try:
+            await run_db(store_ai_response, prompt_hash, getattr(self.model, 'name', ''), prompt, response)
+            self._stores += 1
+            if self._stores % AI_CACHE_PRUNE_EVERY == 0:
+                await run_db(prune_ai_responses, AI_CACHE_TTL_SECONDS, AI_CACHE_MAX_ROWS)
+        except Exception as e:
+            print(f"AI Cache Store Error: {e}")
+
+    def cache_stats(self) -> Dict:
+        stats = self.prompt_cache.stats()
+        # Local misses that the shared table answered are hits from the caller's point of view
+        lookups = stats['hits'] + stats['misses']
+        hits = stats['hits'] + self.shared_hits
+        return {
+            "local": stats,
+            "shared_enabled": self.shared_cache,
+            "shared_hits": self.shared_hits,
+            "model_calls": self.model_calls,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def build_prompt(self, metrics: Dict, scenario_name: str, costs: List[Dict]) -> str:
         # Prepare context for the AI
         cost_summary = ", ".join([f"{c['item_name']}: ${float(c['total_estimated']):,.2f}" for c in costs[:5]])
         
@@ -45,12 +213,7 @@ class IntelligenceBrain:
         
         Keep the tone executive, precise, and professional. Use Portuguese (BR).
         """
-        
-        try:
-            response = await self.model.generate_content_async(prompt)
-            return response.text
-        except Exception as e:
-            return f"Error connecting to AI Brain: {str(e)}"
+        return prompt
 
     def calculate_project_health_score(self, metrics: Dict) -> int:
         """
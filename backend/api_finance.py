@@ -1,109 +1,982 @@
-from fastapi import APIRouter, HTTPException
-from finance_engine import FinancialEngine
-from db_utils import fetch_scenario_data, update_cashflow_report
+import asyncio
+import numpy as np
+import json
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional, Literal
+from finance_engine import FinancialEngine, IncrementalCashFlow
+from db_utils import (
+    fetch_scenario_data, update_cashflow_report, fetch_scenarios_data, update_cashflow_reports,
+    apply_line_item_changes, fetch_strategic_analysis, fetch_monitoring_flows, fetch_actuals_by_category,
+    fetch_scenario_project_id, update_portfolio_rollups, fetch_project_scenarios
+)
 from ai_intelligence import IntelligenceBrain
-from datetime import datetime, timedelta
+from ai_analysis import AnalysisDispatcher
+from workers import run_db, run_engine
+import scenario_cache
+from recalc_jobs import job_queue, job_view, QueueFull, TERMINAL_STATUSES
+from telemetry import stage_timer, record_stage
+from ledger_export import EXPORT_FORMATS, LEDGER_LAYOUTS, iter_ledger_export, missing_dependency
+from actuals_monitor import actuals_reconciler
+from absorption_models import available_models
+from scenario_inputs import ColumnTable
+import time
+from datetime import date, datetime
 
 router = APIRouter(prefix="/api/v1/finance", tags=["Finance"])
 brain = IntelligenceBrain()
+analysis_dispatcher = AnalysisDispatcher(brain)
+
+MAX_BATCH_SCENARIOS = 500
+
+
+class BatchRecalculationRequest(BaseModel):
+    scenario_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SCENARIOS)
+    include_analysis: bool = False
+
+
+class LedgerExportRequest(BaseModel):
+    scenario_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SCENARIOS)
+    format: Literal["csv", "parquet", "xlsx"] = "csv"
+    layout: Literal["long", "wide"] = "long"
+
+
+class LineItemChanges(BaseModel):
+    costs: List[Dict[str, Any]] = []
+    units: List[Dict[str, Any]] = []
+    deleted_cost_ids: List[str] = []
+    deleted_unit_ids: List[str] = []
+
+
+class SimulationRequest(BaseModel):
+    n_paths: int = Field(10000, ge=100, le=100000)
+    seed: Optional[int] = None
+    velocity_sigma: float = Field(FinancialEngine.SIMULATION_DEFAULTS['velocity_sigma'], ge=0, le=2)
+    price_sigma: float = Field(FinancialEngine.SIMULATION_DEFAULTS['price_sigma'], ge=0, le=1)
+    cost_overrun_mean: float = Field(FinancialEngine.SIMULATION_DEFAULTS['cost_overrun_mean'], ge=-0.5, le=2)
+    cost_overrun_sigma: float = Field(FinancialEngine.SIMULATION_DEFAULTS['cost_overrun_sigma'], ge=0, le=1)
+    slip_mean_months: float = Field(FinancialEngine.SIMULATION_DEFAULTS['slip_mean_months'], ge=0, le=36)
+    discount_rate: float = Field(FinancialEngine.SIMULATION_DEFAULTS['discount_rate'], ge=0, le=1)
+
+
+SIMULATION_CHUNK_SIZE = 5000
+MAX_SENSITIVITY_VALUES = 50
+MAX_ABSORPTION_MODELS = 10
+# Status polling interval of the job SSE stream
+JOB_EVENTS_INTERVAL_SECONDS = 0.5
+
+
+class SensitivityRequest(BaseModel):
+    # tornado: any drivers, each moved alone. grid: exactly two drivers (first = x axis, second = y axis)
+    mode: Literal["tornado", "grid"] = "tornado"
+    ranges: Dict[str, List[float]] = Field(..., min_length=1)
+    discount_rate: float = Field(0.10, ge=0, le=1)
+
+
+class GoalSeekRequest(BaseModel):
+    target_metric: Literal["irr", "npv", "roi"] = "irr"
+    target_value: float
+    # Free variable: a cost line's total_estimated / start_month_offset, or a unit type's
+    # avg_price / sales_velocity_per_month / sales_start_month_offset
+    variable: Literal[
+        "total_estimated", "start_month_offset", "avg_price", "sales_velocity_per_month", "sales_start_month_offset"
+    ]
+    # cost_line_items / units_mix id; optional when the scenario has a single row of that kind
+    line_id: Optional[str] = None
+    lower: Optional[float] = None
+    upper: Optional[float] = None
+    discount_rate: float = Field(0.10, ge=0, le=1)
+
+
+def build_report_rows(income, costs, net_flow, base_date) -> list:
+    """Turns the engine's monthly arrays into monthly_cashflow_report rows."""
+    report_data = []
+    for m, (month_income, month_costs, month_net) in enumerate(zip(
+        income.tolist(), costs.tolist(), net_flow.tolist()
+    )):
+        report_date = FinancialEngine.month_date(base_date, m)
+        
+        report_data.append({
+            "index": m,
+            "date": report_date,
+            "income": month_income,
+            "costs": month_costs,
+            "net_flow": month_net
+        })
+    return report_data
+
+
+def portfolio_row(scenario_id: str, metrics: dict, health_score: int, financing: Optional[dict], income, costs, net_flow) -> dict:
+    """One scenario_portfolio_summary row from a recalculation's results."""
+    return {
+        "scenario_id": scenario_id,
+        "irr": metrics['irr'],
+        "npv": metrics['npv'],
+        "roi": metrics['roi'],
+        "irr_status": metrics.get('irr_status'),
+        "health_score": health_score,
+        "equity_required": financing['equity_required'] if financing else None,
+        "engine_version": FinancialEngine.VERSION,
+        **FinancialEngine.exposure_summary(income, costs, net_flow)
+    }
+
+
+async def persist_report(
+    scenario_id: str, input_hash: Optional[str], base_date, flow: dict, metrics: dict, intelligence: dict,
+    financing: Optional[dict]
+):
+    """Writes a recalculation's monthly report, health score and portfolio rollup, tagged with its input_hash."""
+    with stage_timer("report_build"):
+        report_data = build_report_rows(flow['income'], flow['costs'], flow['net_flow'], base_date)
+    with stage_timer("report_write"):
+        await run_db(update_cashflow_report, scenario_id, report_data, intelligence, input_hash)
+    with stage_timer("rollup_write"):
+        await run_db(update_portfolio_rollups, [
+            portfolio_row(
+                scenario_id, metrics, intelligence['health_score'], financing, flow['income'], flow['costs'], flow['net_flow']
+            )
+        ])
+
+
+# scenario_id -> input_hash of the analysis in flight (entries leave when it settles)
+_analysis_inputs: Dict[str, str] = {}
+
+
+def schedule_analysis(scenario_id: str, input_hash: str, payload: dict, data, refresh: bool = False) -> str:
+    """Queues the AI analysis for a cached recalculation payload; the cache entry follows its outcome."""
+    intelligence = payload['intelligence']
+
+    async def analysis_done(analysis: Optional[str], status: str):
+        in_flight = _analysis_inputs.get(scenario_id) == input_hash
+        if status == "superseded" and in_flight:
+            return  # the newer analysis is for the same inputs and will settle this entry
+        if in_flight:
+            del _analysis_inputs[scenario_id]
+        # Later cache hits carry the finished analysis, or re-dispatch a superseded one
+        payload['intelligence'] = {**intelligence, "strategic_analysis": analysis, "analysis_status": status}
+        await scenario_cache.store(scenario_id, input_hash, payload)
+
+    status = analysis_dispatcher.schedule(
+        scenario_id, payload['metrics'], data['scenario']['name'] or "Scenario Unnamed", data['costs'],
+        intelligence['health_score'], analysis_done, refresh=refresh
+    )
+    if status == "pending":
+        # Only tracked when a callback will come (not when the model is unavailable)
+        _analysis_inputs[scenario_id] = input_hash
+    return status
+
+
+async def run_recalculation(scenario_id: str, force: bool = False, progress=None) -> Optional[dict]:
+    """
+    The full recalculation pipeline, shared by the HTTP endpoint and the job workers.
+    Returns None when the scenario does not exist. `progress` is an optional async callback
+    receiving the current stage name. The AI analysis is only scheduled here, never awaited.
+    Unchanged inputs are served from the result cache (no engine or AI call) unless force=true,
+    which also bypasses the AI prompt cache. A cache hit still rewrites the report and rollup when
+    they were last written from other inputs (financial_scenarios.report_input_hash).
+    """
+    async def stage(name: str):
+        if progress:
+            await progress(name)
+
+    await stage("loading")
+    with stage_timer("db_fetch"):
+        data = await run_db(fetch_scenario_data, scenario_id)
+    if not data['scenario']:
+        return None
+        
+    costs = data['costs']
+    units = data['units']
+    base_date = data['scenario']['base_date'] or datetime.now().date()
+
+    # 0. Content-addressed cache: same inputs + engine version => same result
+    financing = dict(data['financing']) if data.get('financing') else None
+    input_hash = scenario_cache.scenario_fingerprint(data['scenario'], units, costs, financing)
+    if not force:
+        with stage_timer("cache_lookup"):
+            cached = await scenario_cache.lookup(input_hash)
+        # Entries cached before the flows were kept in the payload cannot rewrite the report
+        if cached is not None and 'flows' in cached:
+            if data['scenario'].get('report_input_hash') != input_hash:
+                # e.g. edited and reverted, or written by the change feed / a batch in between
+                await stage("writing")
+                await persist_report(
+                    scenario_id, input_hash, base_date,
+                    {key: np.asarray(values, dtype=float) for key, values in cached['flows'].items()},
+                    cached['metrics'], cached['intelligence'], cached.get('financing')
+                )
+            if cached['intelligence'].get('analysis_status') == "superseded":
+                # Cancelled by a newer run on other inputs before it finished; these inputs still need it
+                cached['intelligence'] = {
+                    **cached['intelligence'],
+                    "analysis_status": schedule_analysis(scenario_id, input_hash, cached, data)
+                }
+                await scenario_cache.store(scenario_id, input_hash, cached)
+            return {
+                "status": "success",
+                "message": f"Scenario {scenario_id} unchanged, served from cache",
+                "metrics": cached['metrics'],
+                "intelligence": cached['intelligence'],
+                "financing": cached.get('financing'),
+                "months_calculated": cached['months_calculated'],
+                "cached": True
+            }
+    
+    # 1-3. Assemble income, costs and net flow for every unit type and cost line in one pass
+    await stage("computing")
+    start = time.perf_counter()
+    flow = await run_engine(
+        FinancialEngine.recalculate, FinancialEngine.scheduled_units(units, data['scenario']),
+        FinancialEngine.scheduled_costs(costs, data['scenario']), financing
+    )
+    # Step timings are measured inside the engine worker; the remainder is pickling / IPC / queueing
+    for name, seconds in flow['timings'].items():
+        record_stage(name, seconds)
+    record_stage("engine_overhead", max(time.perf_counter() - start - sum(flow['timings'].values()), 0.0))
+    months_count = len(flow['net_flow'])
+    metrics = flow['metrics']
+    
+    # 4. Health score is pure math; the AI analysis runs in the background (see ai_analysis.py)
+    health_score = brain.calculate_project_health_score(metrics)
+    intelligence_data = {
+        "health_score": health_score,
+        "strategic_analysis": None,
+        "analysis_status": "pending"
+    }
+
+    # 5-6. Save report and rollup to Database (strategic_analysis is kept until the new one lands)
+    await stage("writing")
+    await persist_report(scenario_id, input_hash, base_date, flow, metrics, intelligence_data, flow['financing'])
+    payload = {
+        "scenario_id": scenario_id,
+        "metrics": metrics,
+        "intelligence": intelligence_data,
+        "financing": flow['financing'],
+        "months_calculated": months_count,
+        # Kept so a later cache hit can rewrite a report written from other inputs
+        "flows": {key: flow[key].tolist() for key in ("income", "costs", "net_flow")}
+    }
+    await scenario_cache.store(scenario_id, input_hash, payload)
+    intelligence_data['analysis_status'] = schedule_analysis(scenario_id, input_hash, payload, data, refresh=force)
+    
+    return {
+        "status": "success",
+        "message": f"Scenario {scenario_id} recalculated successfully",
+        "metrics": metrics,
+        "intelligence": intelligence_data,
+        "financing": flow['financing'],
+        "months_calculated": months_count,
+        "cached": False
+    }
+
 
 @router.post("/recalculate/{scenario_id}")
-async def recalculate_scenario(scenario_id: str):
+async def recalculate_scenario(scenario_id: str, force: bool = False):
     """
     Triggers a full recalculation of a financial scenario.
     Uses the modern FinancialEngine to distribute costs and revenues.
+    For long-running or bursty workloads prefer POST /jobs/recalculate/{scenario_id}.
+    """
+    try:
+        result = await run_recalculation(scenario_id, force)
+    except Exception as e:
+        print(f"Calculation Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    return result
+
+
+@router.post("/jobs/recalculate/{scenario_id}", status_code=202)
+async def enqueue_recalculation(scenario_id: str, force: bool = False):
+    """
+    Queues a recalculation and returns immediately with a job id.
+    A pending job for the same scenario is reused (coalesced) instead of queuing a duplicate.
+    Poll GET /jobs/{job_id} or stream GET /jobs/{job_id}/events for progress.
+    """
+    try:
+        job, coalesced = await job_queue.enqueue(scenario_id, force)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"Job Enqueue Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "status": "queued",
+        "job_id": str(job['id']),
+        "scenario_id": scenario_id,
+        "coalesced": coalesced
+    }
+
+
+@router.get("/jobs/{job_id}")
+async def get_recalculation_job(job_id: str):
+    try:
+        job = await job_queue.get(job_id)
+    except Exception as e:
+        print(f"Job Status Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_view(job)
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_recalculation_job(job_id: str):
+    """Server-Sent Events: one `progress` event per status/stage change, then a final `done` event."""
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last = None
+        while True:
+            job = await job_queue.get(job_id)
+            if job is None:
+                yield "event: done\ndata: {\"status\": \"expired\"}\n\n"
+                return
+            view = job_view(job)
+            if job['status'] in TERMINAL_STATUSES:
+                yield f"event: done\ndata: {json.dumps(view, default=str)}\n\n"
+                return
+            if (job['status'], job['stage']) != last:
+                last = (job['status'], job['stage'])
+                yield f"event: progress\ndata: {json.dumps(view, default=str)}\n\n"
+            await asyncio.sleep(JOB_EVENTS_INTERVAL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
+
+@router.patch("/scenarios/{scenario_id}/line-items")
+async def patch_line_items(scenario_id: str, changes: LineItemChanges):
+    """
+    Change feed for interactive budget editing.
+    Persists the edited cost lines / unit types and re-derives only their contribution vectors
+    (delta recalculation). Falls back to a full rebuild when the cached state no longer matches
+    the database. AI analysis is not refreshed here; use /recalculate for that.
+    """
+    try:
+        result = await run_db(
+            apply_line_item_changes, scenario_id,
+            changes.costs, changes.units, changes.deleted_cost_ids, changes.deleted_unit_ids
+        )
+        if not result['scenario']:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+
+        # Cached vectors are only valid for the rows and the schedule they were built from
+        schedule_key = FinancialEngine.schedule_key(result['scenario'])
+        state = scenario_cache.contribution_cache.get(scenario_id)
+        if state is not None and state.checksum == result['checksum_before'] and state.schedule_key == schedule_key:
+            state, flow = await run_engine(
+                IncrementalCashFlow.patch, state, result['scenario'], result['units'], result['costs'],
+                result['deleted_unit_ids'], result['deleted_cost_ids'], result['financing']
+            )
+            mode = "delta"
+        else:
+            data = await run_db(fetch_scenario_data, scenario_id)
+            state, flow = await run_engine(
+                IncrementalCashFlow.patch, None, data['scenario'], data['units'], data['costs'],
+                financing=result['financing']
+            )
+            mode = "full"
+        state.checksum = result['checksum_after']
+        state.schedule_key = schedule_key
+        scenario_cache.contribution_cache.put(scenario_id, state)
+
+        financing = flow['financing']
+        metrics = flow['metrics']
+        intelligence_data = {
+            "health_score": brain.calculate_project_health_score(metrics),
+            "strategic_analysis": None
+        }
+        base_date = result['scenario']['base_date'] or datetime.now().date()
+        report_data = build_report_rows(flow['income'], flow['costs'], flow['net_flow'], base_date)
+        # No input_hash: the report no longer matches any cached recalculation, so the next cache hit rewrites it
+        months_written = await run_db(update_cashflow_report, scenario_id, report_data, intelligence_data)
+        await run_db(update_portfolio_rollups, [
+            portfolio_row(
+                scenario_id, metrics, intelligence_data['health_score'], financing, flow['income'], flow['costs'], flow['net_flow']
+            )
+        ])
+
+        return {
+            "status": "success",
+            "mode": mode,
+            "metrics": metrics,
+            "intelligence": intelligence_data,
+            "financing": financing,
+            "months_calculated": len(report_data),
+            "months_written": months_written,
+            "rows_changed": len(result['costs']) + len(result['units'])
+                + len(result['deleted_cost_ids']) + len(result['deleted_unit_ids'])
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Delta Calculation Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/simulate/{scenario_id}")
+async def simulate_scenario(scenario_id: str, request: SimulationRequest):
+    """
+    Monte Carlo risk simulation: percentile IRR/NPV/ROI and downside probabilities.
+    Paths are split into chunks that run in parallel on the engine process pool.
+    Read-only: nothing is written back to the scenario.
     """
     try:
-        data = fetch_scenario_data(scenario_id)
+        data = await run_db(fetch_scenario_data, scenario_id)
         if not data['scenario']:
             raise HTTPException(status_code=404, detail="Scenario not found")
-            
-        costs = data['costs']
-        units = data['units']
+
+        units = FinancialEngine.scheduled_units(data['units'], data['scenario'])
+        costs = FinancialEngine.scheduled_costs(data['costs'], data['scenario'])
+        params = request.model_dump(exclude={"n_paths", "seed"})
+
+        sizes = FinancialEngine.simulation_chunks(request.n_paths, SIMULATION_CHUNK_SIZE)
+        seeds = np.random.SeedSequence(request.seed).spawn(len(sizes))
+        chunks = await asyncio.gather(*[
+            run_engine(FinancialEngine.simulate_paths, units, costs, size, child, params)
+            for size, child in zip(sizes, seeds)
+        ])
+
+        return {
+            "status": "success",
+            "scenario_id": scenario_id,
+            "assumptions": params,
+            "simulation": FinancialEngine.summarize_simulation(chunks)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Simulation Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/sensitivity/{scenario_id}")
+async def sensitivity_analysis(scenario_id: str, request: SensitivityRequest):
+    """
+    Tornado table (1-D) or price x velocity style data table (2-D) of IRR/NPV/ROI.
+    Every perturbed cash flow is built as one stacked array and solved together. Read-only.
+    """
+    unknown = set(request.ranges) - set(FinancialEngine.SENSITIVITY_PARAMETERS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sensitivity parameters: {sorted(unknown)}")
+    if any(not values or len(values) > MAX_SENSITIVITY_VALUES for values in request.ranges.values()):
+        raise HTTPException(status_code=400, detail=f"Each range needs 1-{MAX_SENSITIVITY_VALUES} values")
+    if request.mode == "grid" and len(request.ranges) != 2:
+        raise HTTPException(status_code=400, detail="Grid mode needs exactly two parameters")
+
+    try:
+        data = await run_db(fetch_scenario_data, scenario_id)
+        if not data['scenario']:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+
+        units = FinancialEngine.scheduled_units(data['units'], data['scenario'])
+        costs = FinancialEngine.scheduled_costs(data['costs'], data['scenario'])
+
+        if request.mode == "grid":
+            (x_name, x_values), (y_name, y_values) = request.ranges.items()
+            result = await run_engine(
+                FinancialEngine.data_table, units, costs,
+                x_name, x_values, y_name, y_values, request.discount_rate
+            )
+        else:
+            result = await run_engine(FinancialEngine.tornado, units, costs, request.ranges, request.discount_rate)
+
+        return {"status": "success", "scenario_id": scenario_id, "mode": request.mode, **result}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Sensitivity Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/goal-seek/{scenario_id}")
+async def goal_seek(scenario_id: str, request: GoalSeekRequest):
+    """
+    Solves for the value of one free variable that hits a target IRR / NPV / ROI
+    (e.g. the maximum land price that still returns 18%). The scenario is loaded once and
+    every trial runs on the in-memory engine; nothing is written. Returns the solved cash flow.
+    """
+    try:
+        data = await run_db(fetch_scenario_data, scenario_id)
+        if not data['scenario']:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+
+        units = FinancialEngine.scheduled_units(data['units'], data['scenario'])
+        costs = FinancialEngine.scheduled_costs(data['costs'], data['scenario'])
+        kind, _ = FinancialEngine.GOAL_SEEK_VARIABLES[request.variable]
+        rows = units if kind == "units" else costs
+        if request.line_id is not None:
+            matches = [i for i, row in enumerate(rows) if str(row.get('id')) == request.line_id]
+        else:
+            matches = [0] if len(rows) == 1 else []
+        if not matches:
+            table = "units_mix" if kind == "units" else "cost_line_items"
+            raise HTTPException(
+                status_code=400,
+                detail=f"line_id must name one of the scenario's {table} rows for {request.variable}"
+            )
+
+        with stage_timer("goal_seek"):
+            result = await run_engine(
+                FinancialEngine.goal_seek, units, costs, request.variable, matches[0],
+                request.target_metric, request.target_value, request.lower, request.upper, request.discount_rate
+            )
+
         base_date = data['scenario']['base_date'] or datetime.now().date()
-        
-        # 1. Calculate Monthly Income from Units Mix
-        max_month = 0
-        income_by_month = {}
-        
-        for unit in units:
-            # Simple linear absorption for now (extendable to bell curves)
-            absorption = FinancialEngine.calculate_absorption(
-                unit['unit_count'], 
-                unit['sales_velocity_per_month'] or 1.0, 
-                unit['sales_start_month_offset'] or 0
-            ) 
-            avg_price = float(unit['avg_price'] or 0)
-            
-            for m_idx, units_sold in enumerate(absorption):
-                income_by_month[m_idx] = income_by_month.get(m_idx, 0.0) + (units_sold * avg_price)
-                max_month = max(max_month, m_idx)
-                
-        # 2. Calculate Monthly Costs from Line Items
-        costs_by_month = {}
-        for item in costs:
-            dist = item['distribution_curve'] or 'linear'
-            total = float(item['total_estimated'] or 0)
-            duration = item['duration_months'] or 1
-            offset = item['start_month_offset'] or 0
-            
-            monthly_dist = []
-            if dist == 's-curve':
-                monthly_dist = FinancialEngine.distribute_s_curve(total, duration, offset)
-            else: # default linear
-                val = total / duration
-                monthly_dist = [0.0] * offset + [val] * duration
-                
-            for m_idx, cost_val in enumerate(monthly_dist):
-                costs_by_month[m_idx] = costs_by_month.get(m_idx, 0.0) + cost_val
-                max_month = max(max_month, m_idx)
-                
-        # 3. Calculate Final Metrics for Intelligence
-        full_cash_flow_temp = []
-        max_month_loop = max_month
-        for m in range(max_month_loop + 1):
-            full_cash_flow_temp.append(income_by_month.get(m, 0.0) - costs_by_month.get(m, 0.0))
-
-        metrics = FinancialEngine.calculate_metrics(full_cash_flow_temp)
-        
-        # 4. Generate AI Intelligence Analysis
-        analysis = await brain.get_strategic_analysis(
-            metrics, 
-            data['scenario']['name'] or "Scenario Unnamed",
-            costs
+        return {
+            "status": result['status'],
+            "scenario_id": scenario_id,
+            "line_id": str(rows[matches[0]].get('id')) if rows[matches[0]].get('id') is not None else None,
+            "target": {"metric": request.target_metric, "value": request.target_value},
+            **{key: result[key] for key in (
+                "variable", "original_value", "value", "bounds", "bracket",
+                "iterations", "evaluations", "original_metrics", "metrics", "achievable"
+            )},
+            "months_calculated": len(result['net_flow']),
+            "cash_flow": build_report_rows(result['income'], result['costs'], result['net_flow'], base_date)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Goal Seek Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/compare/{project_id}")
+async def compare_project_scenarios(project_id: str):
+    """
+    Base / optimistic / pessimistic side by side, from one snapshot of the project's scenarios.
+    The variants are the base scenario's rows with the unit mix price variations applied (the
+    variant scenarios contribute their variation_percent), evaluated as one stacked array instead
+    of recalculating each variant scenario on its own. Deltas are variant minus base.
+    """
+    try:
+        scenarios = await run_db(fetch_project_scenarios, project_id)
+        if not scenarios:
+            raise HTTPException(status_code=404, detail="Project has no scenarios")
+
+        # Base: the 'base' scenario, else the oldest one without a variant type (base sorts first)
+        base_id, base = next(
+            ((sid, data) for sid, data in scenarios.items()
+             if data['scenario'].get('scenario_type') not in ("optimistic", "pessimistic")),
+            (None, None)
         )
-        health_score = brain.calculate_project_health_score(metrics)
-        intelligence_data = {
-            "health_score": health_score,
-            "strategic_analysis": analysis
+        if base is None:
+            raise HTTPException(status_code=422, detail="Project has no base scenario")
+        by_type = {"base": (base_id, base)}
+        for sid, data in scenarios.items():
+            if sid != base_id:
+                by_type.setdefault(data['scenario'].get('scenario_type'), (sid, data))
+        variation_percent = {
+            variant: by_type[variant][1]['scenario'].get('variation_percent')
+            for variant in FinancialEngine.PRICE_VARIANTS if variant != "base" and variant in by_type
         }
 
-        # 5. Prepare Batch Data for Report
-        report_data = []
-        for m in range(max_month + 1):
-            income = income_by_month.get(m, 0.0)
-            cost = costs_by_month.get(m, 0.0)
-            report_date = (base_date + timedelta(days=30*m)).replace(day=1)
-            
-            report_data.append({
+        units = FinancialEngine.scheduled_units(base['units'], base['scenario'])
+        costs = FinancialEngine.scheduled_costs(base['costs'], base['scenario'])
+        result = await run_engine(
+            FinancialEngine.compare_variants,
+            units, costs, FinancialEngine.variant_price_factors(units, variation_percent),
+            dict(base['financing']) if base['financing'] else None
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Scenario Comparison Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    base_date = base['scenario']['base_date'] or datetime.now().date()
+    base_metrics = result['metrics'][0]
+    variants = []
+    for v, variant in enumerate(FinancialEngine.PRICE_VARIANTS):
+        sid, data = by_type.get(variant, (None, None))
+        metrics = result['metrics'][v]
+        variants.append({
+            "variant": variant,
+            "scenario_id": sid,
+            "name": data['scenario']['name'] if data else None,
+            "variation_percent": float(variation_percent.get(variant) or 0),
+            "metrics": metrics,
+            "metrics_delta": {key: metrics[key] - base_metrics[key] for key in ("irr", "npv", "roi")},
+            "summary": FinancialEngine.exposure_summary(result['income'][v], result['costs'][v], result['net_flow'][v]),
+            "financing": result['financing'][v]
+        })
+
+    income = dict(zip(FinancialEngine.PRICE_VARIANTS, result['income'].tolist()))
+    net_flow = dict(zip(FinancialEngine.PRICE_VARIANTS, result['net_flow'].tolist()))
+    costs_by_month = result['costs'][0].tolist()
+    return {
+        "project_id": project_id,
+        "base_scenario_id": base_id,
+        "months_calculated": result['months'],
+        "variants": variants,
+        "cash_flow": [
+            {
+                "index": m,
+                "date": FinancialEngine.month_date(base_date, m),
+                "costs": costs_by_month[m],
+                "income": {variant: income[variant][m] for variant in income},
+                "net_flow": {variant: net_flow[variant][m] for variant in net_flow},
+                "delta": {variant: net_flow[variant][m] - net_flow["base"][m] for variant in net_flow if variant != "base"}
+            }
+            for m in range(result['months'])
+        ]
+    }
+
+
+@router.get("/scenarios/{scenario_id}/schedule")
+async def get_scenario_schedule(scenario_id: str):
+    """
+    The scenario's compiled macro schedule: each phase's months and dates, how many cost lines and
+    unit types are anchored to it, and the phases active in each report month.
+    """
+    try:
+        data = await run_db(fetch_scenario_data, scenario_id)
+    except Exception as e:
+        print(f"Schedule Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not data['scenario']:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+
+    schedule = FinancialEngine.compile_schedule(data['scenario'])
+    base_date = FinancialEngine.schedule_key(data['scenario'])[0]
+    anchored_costs = [c.get('schedule_phase') for c in data['costs']]
+    anchored_units = [u.get('schedule_phase') for u in data['units']]
+    phases = []
+    for i, name in enumerate(schedule['phases']):
+        start, months = int(schedule['start'][i]), int(schedule['months'][i])
+        phases.append({
+            "phase": name,
+            "start_month": start,
+            "months": months,
+            "start_date": FinancialEngine.month_date(base_date, start),
+            "end_date": FinancialEngine.month_date(base_date, start + months - 1) if months else None,
+            "cost_lines": anchored_costs.count(name),
+            "unit_types": anchored_units.count(name)
+        })
+
+    return {
+        "scenario_id": scenario_id,
+        "base_date": base_date,
+        "months": schedule['horizon'],
+        "phases": phases,
+        "payment_terms": schedule['payment_terms'],
+        "timeline": [
+            {
                 "index": m,
-                "date": report_date,
-                "income": income,
-                "costs": cost,
-                "net_flow": income - cost
+                "date": FinancialEngine.month_date(base_date, m),
+                "phases": [schedule['phases'][i] for i in np.flatnonzero(schedule['mask'][:, m])]
+            }
+            for m in range(schedule['horizon'])
+        ]
+    }
+
+
+@router.get("/scenarios/{scenario_id}/absorption")
+async def get_scenario_absorption(scenario_id: str, model: List[str] = Query(default=[])):
+    """
+    Monthly units sold by the scenario's unit mix, as configured or under each `model` given
+    (e.g. ?model=linear&model=bell:0.2&model=inventory:8). All profiles are computed in one batch.
+    Dated units (sale_date) keep their month under every model.
+    """
+    unknown = [m for m in model if m.strip().lower().partition(":")[0].strip() not in available_models()]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown absorption models {unknown}; use one of {list(available_models())}")
+    if len(model) > MAX_ABSORPTION_MODELS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_ABSORPTION_MODELS} models per request")
+
+    try:
+        data = await run_db(fetch_scenario_data, scenario_id)
+        if not data['scenario']:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+
+        units = FinancialEngine.scheduled_units(data['units'], data['scenario'])
+        profiles = await run_engine(FinancialEngine.absorption_profiles, units, model or [None])
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Absorption Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    base_date = data['scenario']['base_date'] or datetime.now().date()
+    total_units = sum(float(u.get('unit_count') or 0) for u in units)
+    results = []
+    for name, sold in zip(model or [None], profiles['sold']):
+        cumulative = np.cumsum(sold)
+        sold_out = np.flatnonzero(cumulative >= total_units - 1e-6)
+        results.append({
+            "model": name,
+            "units_sold": float(cumulative[-1]) if len(cumulative) else 0.0,
+            "sell_out_month": int(sold_out[0]) if total_units > 0 and len(sold_out) else None,
+            "monthly": [
+                {"index": m, "date": FinancialEngine.month_date(base_date, m), "sold": float(v), "cumulative": float(c)}
+                for m, (v, c) in enumerate(zip(sold.tolist(), cumulative.tolist()))
+            ]
+        })
+    return {"scenario_id": scenario_id, "total_units": total_units, "months": profiles['months'], "profiles": results}
+
+
+@router.get("/scenarios/{scenario_id}/analysis")
+async def get_strategic_analysis(scenario_id: str):
+    """Latest stored AI analysis of a scenario, and whether a newer one is still being generated."""
+    try:
+        row = await run_db(fetch_strategic_analysis, scenario_id)
+    except Exception as e:
+        print(f"Analysis Fetch Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if row is None:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    return {
+        "scenario_id": scenario_id,
+        "health_score": row['health_score'],
+        "strategic_analysis": row['strategic_analysis'],
+        "analyzed_at": row['analyzed_at'],
+        "analysis_status": analysis_dispatcher.status(scenario_id)
+            or ("ready" if row['strategic_analysis'] is not None else None)
+    }
+
+
+@router.get("/ai/stats")
+async def get_ai_stats():
+    """Prompt-cache hit rate and background analysis counters for this process."""
+    return {
+        "prompt_cache": brain.cache_stats(),
+        "analysis": analysis_dispatcher.stats()
+    }
+
+
+@router.post("/actuals/reconcile")
+async def reconcile_project_actuals(project_id: Optional[str] = None, full: bool = False):
+    """
+    Folds new / changed actual entries into the cash flow report and refreshes the variance metrics.
+    Only months queued since the last run are touched; full=true (needs project_id) redoes all of them.
+    """
+    if full and not project_id:
+        raise HTTPException(status_code=400, detail="full=true requires a project_id")
+    try:
+        return await actuals_reconciler.reconcile(project_id, full)
+    except Exception as e:
+        print(f"Actuals Reconcile Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/scenarios/{scenario_id}/monitoring")
+async def get_scenario_monitoring(scenario_id: str, as_of: Optional[date] = None):
+    """
+    Feasibility vs monitoring: actuals for the elapsed months merged with the remaining projections.
+    Pending actual months of the project are reconciled first. `as_of` moves the actuals cut-off
+    (default: the last month with actuals) and is not persisted.
+    """
+    try:
+        project_id = await run_db(fetch_scenario_project_id, scenario_id)
+        if project_id is None:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+
+        summary = await actuals_reconciler.reconcile(project_id)
+        snapshots = await actuals_reconciler.refresh([scenario_id], as_of=as_of)
+        flows = await run_db(fetch_monitoring_flows, [scenario_id])
+        categories = await run_db(fetch_actuals_by_category, scenario_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Monitoring Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    snapshot = snapshots.get(scenario_id)
+    current_month = snapshot['current_month'] if snapshot else 0
+    return {
+        "scenario_id": scenario_id,
+        "project_id": project_id,
+        "as_of": as_of,
+        "months_reconciled": summary['months'],
+        "monitoring": snapshot,
+        "categories": [
+            {
+                "category": row['category'],
+                "budget": float(row['budget']),
+                "actual": float(row['actual']),
+                "variance": float(row['actual']) - float(row['budget']),
+                "entries": row['entries']
+            }
+            for row in categories
+        ],
+        "months": [
+            {
+                "index": row['project_month_index'],
+                "date": row['month_date'],
+                "projected_net_flow": float(row['projected_net_flow'] or 0),
+                "actual_income": float(row['actual_income'] or 0),
+                "actual_costs": float(row['actual_costs'] or 0),
+                "actual_net_flow": float(row['actual_net_flow'] or 0),
+                "source": "actual" if row['project_month_index'] < current_month else "projected"
+            }
+            for row in flows[scenario_id]
+        ]
+    }
+
+
+async def _ledger_response(scenario_ids: List[str], fmt: str, layout: str, filename: str):
+    if fmt not in EXPORT_FORMATS or layout not in LEDGER_LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format/layout: {fmt}/{layout}")
+    missing = missing_dependency(fmt)
+    if missing:
+        raise HTTPException(status_code=501, detail=f"{fmt} export requires the '{missing}' package (requirements-export.txt)")
+
+    data = await run_db(fetch_scenarios_data, scenario_ids)
+    scenarios = [data[sid] for sid in scenario_ids if sid in data]
+    if not scenarios:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+
+    # Sync generator: Starlette iterates it in a worker thread, one chunk at a time
+    return StreamingResponse(
+        iter_ledger_export(scenarios, fmt, layout, datetime.now().date()),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
+
+
+@router.get("/export/{scenario_id}/ledger")
+async def export_scenario_ledger(scenario_id: str, format: str = "csv", layout: str = "long"):
+    """
+    Line-item x month ledger of one scenario (revenue per unit type, spend per cost line).
+    format: csv | parquet | xlsx. layout: long (one row per line-month) | wide (one column per month).
+    """
+    try:
+        return await _ledger_response([scenario_id], format, layout, f"ledger-{scenario_id}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ledger Export Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/export/ledger")
+async def export_portfolio_ledger(request: LedgerExportRequest):
+    """Portfolio ledger: every scenario in one file, generated chunk by chunk."""
+    try:
+        scenario_ids = list(dict.fromkeys(request.scenario_ids))
+        return await _ledger_response(scenario_ids, request.format, request.layout, "ledger-portfolio")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ledger Export Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/cache/{scenario_id}")
+async def invalidate_scenario_cache(scenario_id: str):
+    """Explicitly drops every cached recalculation result for a scenario."""
+    removed = await scenario_cache.invalidate(scenario_id)
+    return {"status": "success", "invalidated": removed}
+
+
+@router.post("/recalculate:batch")
+async def recalculate_scenarios_batch(request: BatchRecalculationRequest):
+    """
+    Recalculates a portfolio of scenarios in one call.
+    One query per table for all scenarios, one vectorized engine pass, one write transaction.
+    AI analysis is opt-in (include_analysis) since it costs one model call per scenario;
+    it is scheduled in the background like the single-scenario path.
+    """
+    try:
+        scenario_ids = list(dict.fromkeys(request.scenario_ids))
+        data = await run_db(fetch_scenarios_data, scenario_ids)
+        found_ids = [sid for sid in scenario_ids if sid in data]
+
+        # 1. Stack every scenario's rows into one table each, tagged with the scenario's group index
+        unit_parts, cost_parts, unit_group, cost_group = [], [], [], []
+        for group, sid in enumerate(found_ids):
+            unit_parts.append(FinancialEngine.scheduled_units(data[sid]['units'], data[sid]['scenario']))
+            unit_group.extend([group] * len(data[sid]['units']))
+            cost_parts.append(FinancialEngine.scheduled_costs(data[sid]['costs'], data[sid]['scenario']))
+            cost_group.extend([group] * len(data[sid]['costs']))
+        units, costs = ColumnTable.concat(unit_parts), ColumnTable.concat(cost_parts)
+
+        flows = await run_engine(
+            FinancialEngine.recalculate_batch,
+            units, costs,
+            unit_group, cost_group, len(found_ids),
+            [dict(data[sid]['financing']) if data[sid]['financing'] else None for sid in found_ids]
+        )
+
+        # 2. Metrics and health per scenario
+        metrics_by_id = dict(zip(found_ids, flows['metrics']))
+
+        # 3. Build every report and write them in a single transaction
+        reports = {}
+        results = []
+        for group, sid in enumerate(found_ids):
+            months = int(flows['months'][group])
+            base_date = data[sid]['scenario']['base_date'] or datetime.now().date()
+            intelligence_data = {
+                "health_score": brain.calculate_project_health_score(metrics_by_id[sid]),
+                "strategic_analysis": None,
+                "analysis_status": None
+            }
+            reports[sid] = (
+                build_report_rows(
+                    flows['income'][group, :months],
+                    flows['costs'][group, :months],
+                    flows['net_flow'][group, :months],
+                    base_date
+                ),
+                intelligence_data,
+                scenario_cache.scenario_fingerprint(
+                    data[sid]['scenario'], data[sid]['units'], data[sid]['costs'],
+                    dict(data[sid]['financing']) if data[sid]['financing'] else None
+                )
+            )
+            results.append({
+                "scenario_id": sid,
+                "metrics": metrics_by_id[sid],
+                "intelligence": intelligence_data,
+                "financing": flows['financing'][group],
+                "months_calculated": months
             })
-            
-        # 6. Save to Database (including AI data)
-        update_cashflow_report(scenario_id, report_data, intelligence_data)
-        
+
+        await run_db(update_cashflow_reports, reports)
+        await run_db(update_portfolio_rollups, [
+            portfolio_row(
+                sid, metrics_by_id[sid], reports[sid][1]['health_score'], flows['financing'][group],
+                *(flows[key][group, :int(flows['months'][group])] for key in ('income', 'costs', 'net_flow'))
+            )
+            for group, sid in enumerate(found_ids)
+        ])
+
+        if request.include_analysis:
+            for sid, result in zip(found_ids, results):
+                intelligence_data = result['intelligence']
+                intelligence_data['analysis_status'] = analysis_dispatcher.schedule(
+                    sid,
+                    metrics_by_id[sid],
+                    data[sid]['scenario']['name'] or "Scenario Unnamed",
+                    data[sid]['costs'],
+                    intelligence_data['health_score']
+                )
+
         return {
             "status": "success",
-            "message": f"Scenario {scenario_id} recalculated successfully",
-            "metrics": metrics,
-            "intelligence": intelligence_data,
-            "months_calculated": max_month + 1
+            "recalculated": len(found_ids),
+            "not_found": [sid for sid in scenario_ids if sid not in data],
+            "results": results
         }
-        
+
     except Exception as e:
-        print(f"Calculation Error: {e}")
+        print(f"Batch Calculation Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
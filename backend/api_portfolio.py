@@ -0,0 +1,90 @@
+import json
+import base64
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from auth import get_current_user
+from db_utils import (
+    fetch_portfolio_page, fetch_organization_portfolio, fetch_project_portfolio, is_organization_member,
+    PORTFOLIO_SORT_TYPES
+)
+from workers import run_db
+
+# Portfolio dashboards read the rollup tables kept by update_portfolio_rollups (migration 40),
+# so a listing is one index range scan instead of one scenario query per project.
+# The rollups are read through the service connection (no RLS), so every endpoint scopes by the caller.
+router = APIRouter(prefix="/api/v1/portfolio", tags=["Portfolio"])
+
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(row: dict, sort: str) -> str:
+    value = row[sort]
+    if value is not None:
+        value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+    raw = json.dumps([value, str(row['project_id'])]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, project_id = json.loads(raw)
+        return value, project_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("")
+async def list_portfolio(
+    organization_id: Optional[str] = None,
+    sort: str = "calculated_at",
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: dict = Depends(get_current_user),
+):
+    """
+    Projects with their latest metrics (primary scenario), GDV, peak equity and break-even month.
+    Scoped to an organization the caller belongs to (or, without one, to the caller's own projects);
+    keyset-paginated with `next_cursor`. The organization totals come with the first page.
+    """
+    if sort not in PORTFOLIO_SORT_TYPES:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {sorted(PORTFOLIO_SORT_TYPES)}")
+
+    scope, scope_id = ("organization_id", organization_id) if organization_id else ("user_id", user['sub'])
+    after = decode_cursor(cursor) if cursor else None
+    try:
+        if organization_id and not await run_db(is_organization_member, organization_id, user['sub']):
+            raise HTTPException(status_code=403, detail="Not a member of this organization")
+        rows = await run_db(fetch_portfolio_page, scope, scope_id, sort, limit, after, status)
+        organization = None
+        if organization_id and cursor is None:
+            organization = await run_db(fetch_organization_portfolio, organization_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Portfolio Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": rows,
+        "sort": sort,
+        "next_cursor": encode_cursor(rows[-1], sort) if has_more else None,
+        "organization": organization
+    }
+
+
+@router.get("/projects/{project_id}")
+async def get_project_portfolio(project_id: str, user: dict = Depends(get_current_user)):
+    """A project's rollup and the latest results of each of its scenarios (404 unless the caller can see it)."""
+    try:
+        result = await run_db(fetch_project_portfolio, project_id, user['sub'])
+    except Exception as e:
+        print(f"Portfolio Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return result
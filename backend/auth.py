@@ -0,0 +1,71 @@
+"""
+Supabase JWT authentication dependencies, shared by main.py and the API routers.
+"""
+
+import os
+from typing import Optional
+from fastapi import Request, HTTPException
+from dotenv import load_dotenv
+
+import jwt
+
+load_dotenv()
+
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "")
+
+
+# JWT Token validation
+def verify_jwt(token: str) -> Optional[dict]:
+    """Verify Supabase JWT token"""
+    if not SUPABASE_JWT_SECRET:
+        return None
+    
+    try:
+        payload = jwt.decode(
+            token,
+            SUPABASE_JWT_SECRET,
+            algorithms=["HS256"],
+            audience="authenticated",
+        )
+        return payload
+    except jwt.InvalidTokenError as e:
+        print(f"JWT Validation Error: {e}")
+        return None
+    except Exception as e:
+        print(f"Unexpected JWT Error: {e}")
+        return None
+
+
+# Authentication dependency
+async def get_current_user(request: Request) -> dict:
+    """Extract and validate user from Authorization header"""
+    auth_header = request.headers.get("Authorization")
+    
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(
+            status_code=401,
+            detail="Missing or invalid authorization header"
+        )
+    
+    token = auth_header.split(" ")[1]
+    payload = verify_jwt(token)
+    
+    if not payload:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid or expired token"
+        )
+    
+    return payload
+
+
+# Optional authentication (for endpoints that work with or without auth)
+async def get_optional_user(request: Request) -> Optional[dict]:
+    """Extract user if token present, otherwise None"""
+    auth_header = request.headers.get("Authorization")
+    
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+    
+    token = auth_header.split(" ")[1]
+    return verify_jwt(token)
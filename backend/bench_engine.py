@@ -0,0 +1,342 @@
+"""
+FinancialEngine benchmark suite.
+
+Times the engine on synthetic small / medium / large scenarios and, when a database is configured,
+the end-to-end recalculation pipeline (run_recalculation) with the AI client replaced by the fake one.
+Results are compared against a JSON baseline; a slowdown beyond the threshold exits with status 1.
+
+    python bench_engine.py --save-baseline               # record bench_baseline.json
+    python bench_engine.py                               # compare against it (25% threshold)
+    python bench_engine.py --sizes small --threshold 0.5
+    DATABASE_URL=postgresql://... python bench_engine.py --e2e   # throwaway DB with the schema applied
+    python bench_engine.py --check-irr                   # irr_solver vs numpy_financial.irr
+
+The end-to-end benchmark inserts one synthetic project per size and deletes it afterwards.
+--check-irr needs numpy-financial (pip install numpy-financial), which the app itself does not use.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+from datetime import date
+
+# The pipeline must not call a real model or spawn engine processes while being timed
+os.environ.setdefault("AI_MODEL_CLIENT", "fake")
+os.environ.setdefault("AI_CACHE_SHARED", "false")
+os.environ.setdefault("RESULT_CACHE_SHARED", "false")
+os.environ.setdefault("ENGINE_WORKERS", "0")
+
+import numpy as np
+from finance_engine import FinancialEngine
+from irr_solver import solve_irr, RATE_GRID
+from scenario_inputs import ColumnTable, COST_COLUMNS, UNIT_COLUMNS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# (cost lines, unit types, horizon in months)
+SIZES = {
+    "small": (10, 2, 24),
+    "medium": (100, 8, 120),
+    "large": (1000, 40, 360),
+}
+
+# Each sample runs the function enough times to take at least this long (like timeit.autorange)
+MIN_SAMPLE_SECONDS = 0.02
+
+
+def make_scenario(size: str, seed: int = 42):
+    """Synthetic units_mix / cost_line_items rows whose cash flow spans the size's horizon."""
+    n_costs, n_units, horizon = SIZES[size]
+    rng = np.random.default_rng(seed)
+
+    costs = []
+    for i in range(n_costs):
+        duration = int(rng.integers(1, max(horizon // 2, 2)))
+        start = int(rng.integers(0, horizon - duration + 1))
+        costs.append({
+            "item_name": f"Cost line {i + 1}",
+            "total_estimated": round(float(rng.uniform(10_000, 2_000_000)), 2),
+            "duration_months": duration,
+            "start_month_offset": start,
+            "distribution_curve": "s-curve" if i % 3 == 0 else "linear",
+        })
+
+    units = []
+    sales_start = horizon // 3
+    for i in range(n_units):
+        unit_count = int(rng.integers(5, 60))
+        # Sell out exactly at the horizon at the latest
+        velocity = max(unit_count / (horizon - sales_start), float(rng.uniform(0.5, 4.0)))
+        units.append({
+            "unit_count": unit_count,
+            "sales_velocity_per_month": round(velocity, 2),
+            "sales_start_month_offset": sales_start,
+            "avg_price": round(float(rng.uniform(250_000, 1_500_000)), 2),
+        })
+    return units, costs
+
+
+def _measure(fn, rounds: int):
+    """Median / min seconds per call of fn()."""
+    fn()  # warm-up (imports, caches, first allocation)
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS or number >= 1_000_000:
+            break
+        number *= 10
+
+    samples = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {"median": statistics.median(samples), "min": min(samples), "rounds": rounds, "calls_per_round": number}
+
+
+def engine_benchmarks(size: str, rounds: int) -> dict:
+    units, costs = make_scenario(size)
+    flow = FinancialEngine.build_cash_flow(units, costs)
+    # Same rows as a tuple cursor returns them for fetch_scenario_data
+    unit_tuples = [tuple(u.get(column) for column in UNIT_COLUMNS) for u in units]
+    cost_tuples = [tuple(c.get(column) for column in COST_COLUMNS) for c in costs]
+    unit_table = ColumnTable.from_rows(UNIT_COLUMNS, unit_tuples)
+    cost_table = ColumnTable.from_rows(COST_COLUMNS, cost_tuples)
+    net_flow = flow["net_flow"]
+
+    # Feasibility vs monitoring: actuals for the first half, 5% off the projection
+    projected = {m: float(v) for m, v in enumerate(net_flow)}
+    current_month = len(net_flow) // 2
+    actual = {m: v * 1.05 for m, v in projected.items() if m < current_month}
+
+    cases = {
+        "calculate_absorption": lambda: [
+            FinancialEngine.calculate_absorption(
+                u["unit_count"], u["sales_velocity_per_month"], u["sales_start_month_offset"]
+            )
+            for u in units
+        ],
+        "distribute_s_curve": lambda: [
+            FinancialEngine.distribute_s_curve(c["total_estimated"], c["duration_months"], c["start_month_offset"])
+            for c in costs
+        ],
+        "build_cash_flow": lambda: FinancialEngine.build_cash_flow(units, costs),
+        "column_tables": lambda: (
+            ColumnTable.from_rows(UNIT_COLUMNS, unit_tuples), ColumnTable.from_rows(COST_COLUMNS, cost_tuples)
+        ),
+        "build_cash_flow_columnar": lambda: FinancialEngine.build_cash_flow(unit_table, cost_table),
+        "calculate_metrics": lambda: FinancialEngine.calculate_metrics(net_flow),
+        "compare_viability_vs_monitoring": lambda: FinancialEngine.compare_viability_vs_monitoring(
+            projected, actual, current_month
+        ),
+        "recalculate": lambda: FinancialEngine.recalculate(units, costs),
+    }
+    return {f"{name}[{size}]": _measure(fn, rounds) for name, fn in cases.items()}
+
+
+def _insert_scenario(cur, size: str) -> tuple:
+    units, costs = make_scenario(size)
+    cur.execute("INSERT INTO public.projects (name) VALUES (%s) RETURNING id", (f"bench-{size}",))
+    project_id = cur.fetchone()["id"]
+    cur.execute(
+        "INSERT INTO public.financial_scenarios (project_id, name, base_date) VALUES (%s, %s, %s) RETURNING id",
+        (project_id, f"Benchmark {size}", date(2026, 1, 1))
+    )
+    scenario_id = str(cur.fetchone()["id"])
+    for u in units:
+        cur.execute(
+            """
+            INSERT INTO public.units_mix (scenario_id, unit_count, sales_velocity_per_month, sales_start_month_offset, avg_price)
+            VALUES (%s, %s, %s, %s, %s)
+            """,
+            (scenario_id, u["unit_count"], u["sales_velocity_per_month"], u["sales_start_month_offset"], u["avg_price"])
+        )
+    for c in costs:
+        cur.execute(
+            """
+            INSERT INTO public.cost_line_items (scenario_id, item_name, total_estimated, duration_months, start_month_offset, distribution_curve)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            (scenario_id, c["item_name"], c["total_estimated"], c["duration_months"], c["start_month_offset"], c["distribution_curve"])
+        )
+    return project_id, scenario_id
+
+
+async def _time_pipeline(run_recalculation, scenario_id: str, rounds: int) -> dict:
+    await run_recalculation(scenario_id, True)  # warm-up; also creates the report rows
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await run_recalculation(scenario_id, True)
+        samples.append(time.perf_counter() - start)
+    return {"median": statistics.median(samples), "min": min(samples), "rounds": rounds, "calls_per_round": 1}
+
+
+def pipeline_benchmarks(sizes: list, rounds: int) -> dict:
+    """End-to-end run_recalculation against the database in DATABASE_URL (fake AI, engine in a thread)."""
+    from db_utils import get_db_cursor
+    from api_finance import run_recalculation, analysis_dispatcher
+    from workers import shutdown_executors
+
+    created = {}
+    try:
+        with get_db_cursor() as cur:
+            for size in sizes:
+                created[size] = _insert_scenario(cur, size)
+
+        async def run():
+            # One event loop for every size: the dispatcher's semaphore binds to the loop it first runs on
+            results = {}
+            for size, (_, scenario_id) in created.items():
+                results[f"run_recalculation[{size}]"] = await _time_pipeline(run_recalculation, scenario_id, rounds)
+            await analysis_dispatcher.stop()
+            return results
+
+        return asyncio.run(run())
+    finally:
+        if created:
+            with get_db_cursor() as cur:
+                cur.execute(
+                    "DELETE FROM public.projects WHERE id = ANY(%s::uuid[])",
+                    ([str(project_id) for project_id, _ in created.values()],)
+                )
+        shutdown_executors()
+
+
+def make_development_flows(count: int, seed: int = 7) -> list:
+    """
+    Net flows of small two-unit-type projects whose costs often outlast their sales, so many
+    have several IRRs (upfront outflow, sales inflows, negative tail).
+    """
+    rng = np.random.default_rng(seed)
+    flows = []
+    for _ in range(count):
+        units = [{
+            "unit_count": int(rng.integers(5, 60)),
+            "sales_velocity_per_month": float(rng.uniform(0.5, 5.0)),
+            "sales_start_month_offset": int(rng.integers(0, 18)),
+            "avg_price": float(rng.uniform(200_000, 800_000)),
+        } for _ in range(2)]
+        costs = [
+            {"item_name": "Land", "total_estimated": float(rng.uniform(1e6, 5e6)), "duration_months": 1,
+             "start_month_offset": 0},
+            {"item_name": "Construction", "total_estimated": float(rng.uniform(3e6, 2e7)),
+             "duration_months": int(rng.integers(6, 36)), "start_month_offset": int(rng.integers(0, 6)),
+             "distribution_curve": "s-curve"},
+        ]
+        flows.append(FinancialEngine.build_cash_flow(units, costs)["net_flow"])
+    return flows
+
+
+def check_irr(count: int = 300) -> int:
+    """Compares solve_irr with npf.irr (root closest to zero); returns the number of disagreements."""
+    try:
+        import numpy_financial as npf
+    except ImportError:
+        print("numpy-financial is not installed; skipping the IRR check")
+        return 0
+
+    flows = make_development_flows(count)
+    # 40 units at 3/month against 8M of costs: profitable, with a second (negative) IRR
+    flows.append(FinancialEngine.build_cash_flow(
+        [{"unit_count": 40, "sales_velocity_per_month": 3, "sales_start_month_offset": 1, "avg_price": 300_000}],
+        [{"item_name": "Land", "total_estimated": 2e6, "duration_months": 1, "start_month_offset": 0},
+         {"item_name": "Construction", "total_estimated": 6e6, "duration_months": 18, "start_month_offset": 0,
+          "distribution_curve": "s-curve"}]
+    )["net_flow"])
+
+    months = max(len(f) for f in flows)
+    solved = solve_irr(np.array([np.pad(f, (0, months - len(f))) for f in flows]))["rate"]
+    expected = np.array([npf.irr(f) for f in flows])
+    # Roots outside the bracketing grid are out of the solver's range by design
+    comparable = np.isfinite(expected) & (expected > RATE_GRID[0]) & (expected < RATE_GRID[-1])
+    mismatched = comparable & ~np.isclose(solved, expected, rtol=0, atol=1e-7)
+    for i in np.flatnonzero(mismatched):
+        print(f"flow {i}: solve_irr {solved[i]:+.6f}/month, npf.irr {expected[i]:+.6f}/month")
+    print(f"IRR check: {int(mismatched.sum())} of {int(comparable.sum())} flows disagree with npf.irr")
+    return int(mismatched.sum())
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Prints a comparison table and returns the names of benchmarks that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<48}{'median':>12}{'baseline':>12}{'ratio':>9}")
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<48}{stats['median'] * 1000:>10.3f}ms{'new':>12}")
+            continue
+        ratio = stats["median"] / base["median"] if base["median"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<48}{stats['median'] * 1000:>10.3f}ms{base['median'] * 1000:>10.3f}ms{ratio:>8.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="FinancialEngine benchmark suite")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--e2e", action="store_true", help="also benchmark run_recalculation against DATABASE_URL")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed median slowdown (0.25 = 25%%)")
+    parser.add_argument("--output", help="also write the raw results to this JSON file")
+    parser.add_argument("--check-irr", action="store_true", help="only compare solve_irr with npf.irr")
+    args = parser.parse_args(argv)
+
+    if args.check_irr:
+        return 1 if check_irr() else 0
+
+    results = {}
+    for size in args.sizes:
+        results.update(engine_benchmarks(size, args.rounds))
+    if args.e2e:
+        results.update(pipeline_benchmarks(args.sizes, args.rounds))
+
+    document = {
+        "engine_version": FinancialEngine.VERSION,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2)
+        compare(results, {}, args.threshold)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        compare(results, {}, args.threshold)
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline["results"], args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
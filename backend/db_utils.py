@@ -1,9 +1,11 @@
 import os
+import io
 import psycopg2
-from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+from psycopg2 import pool, sql
+from psycopg2.extras import RealDictCursor, Json
 from dotenv import load_dotenv
 from contextlib import contextmanager
+from scenario_inputs import ColumnTable, ScenarioInputs, COST_COLUMNS, UNIT_COLUMNS, OBJECT
 
 load_dotenv()
 
@@ -12,6 +14,8 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 # Connection Pool Settings
 # minconn: minimum idle connections
 # maxconn: maximum concurrent connections (crucial for handling 200+ users)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
 db_pool = None
 
 def get_pool():
@@ -19,7 +23,7 @@ def get_pool():
     if db_pool is None:
         try:
             db_pool = pool.ThreadedConnectionPool(
-                1, 20, # Scale this up based on your server capacity (e.g. 5, 50)
+                DB_POOL_MIN, DB_POOL_MAX, # Scale this up based on your server capacity (e.g. 5, 50)
                 dsn=DATABASE_URL or "",
                 host=os.getenv("DB_HOST"),
                 database=os.getenv("DB_NAME"),
@@ -34,12 +38,12 @@ def get_pool():
     return db_pool
 
 @contextmanager
-def get_db_cursor():
-    """Context manager for thread-safe pool management"""
+def get_db_cursor(cursor_factory=RealDictCursor):
+    """Context manager for thread-safe pool management (cursor_factory=None for a plain tuple cursor)"""
     pool = get_pool()
     conn = pool.getconn()
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur = conn.cursor(cursor_factory=cursor_factory)
         yield cur
         conn.commit()
     except Exception as e:
@@ -49,54 +53,915 @@ def get_db_cursor():
         cur.close()
         pool.putconn(conn)
 
-def fetch_scenario_data(scenario_id: str):
-    with get_db_cursor() as cur:
+def _select_columns(table: str, columns: dict, where: str, prefix: tuple = ()) -> sql.Composed:
+    return sql.SQL("SELECT {} FROM public.{} WHERE " + where).format(
+        sql.SQL(", ").join(map(sql.Identifier, (*prefix, *columns))), sql.Identifier(table)
+    )
+
+def _dict_rows(cur) -> list:
+    names = [column.name for column in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+def fetch_scenario_data(scenario_id: str) -> ScenarioInputs:
+    """
+    Engine inputs of one scenario. Costs and units only carry the columns in scenario_inputs.py and
+    are built as ColumnTables straight from a tuple cursor; scenario and financing stay dict rows.
+    """
+    with get_db_cursor(cursor_factory=None) as cur:
         # Get costs
-        cur.execute("SELECT * FROM public.cost_line_items WHERE scenario_id = %s", (scenario_id,))
-        costs = cur.fetchall()
-        
+        cur.execute(_select_columns("cost_line_items", COST_COLUMNS, "scenario_id = %s"), (scenario_id,))
+        costs = ColumnTable.from_rows(COST_COLUMNS, cur.fetchall())
+
         # Get units
-        cur.execute("SELECT * FROM public.units_mix WHERE scenario_id = %s", (scenario_id,))
-        units = cur.fetchall()
-        
+        cur.execute(_select_columns("units_mix", UNIT_COLUMNS, "scenario_id = %s"), (scenario_id,))
+        units = ColumnTable.from_rows(UNIT_COLUMNS, cur.fetchall())
+
         # Get scenario info
         cur.execute("SELECT * FROM public.financial_scenarios WHERE id = %s", (scenario_id,))
+        scenario = next(iter(_dict_rows(cur)), None)
+
+        # Get construction loan terms (optional)
+        cur.execute("SELECT * FROM public.financing_assumptions WHERE scenario_id = %s", (scenario_id,))
+        financing = next(iter(_dict_rows(cur)), None)
+
+        return ScenarioInputs(scenario, financing, costs, units)
+
+def _scenario_inputs(cur, scenarios: list) -> dict:
+    """Costs, units and financing of already-fetched scenario rows, one query per table -> {scenario_id: ScenarioInputs}."""
+    scenario_ids = [str(row['id']) for row in scenarios]
+    where = "scenario_id = ANY(%s::uuid[]) ORDER BY scenario_id"
+    tables = {}
+    for key, table, columns in (("costs", "cost_line_items", COST_COLUMNS), ("units", "units_mix", UNIT_COLUMNS)):
+        kinds = {"scenario_id": OBJECT, **columns}
+        cur.execute(_select_columns(table, columns, where, ("scenario_id",)), (scenario_ids,))
+        rows = ColumnTable.from_rows(kinds, cur.fetchall())
+        tables[key] = (rows.split("scenario_id"), rows[0:0])
+
+    cur.execute("SELECT * FROM public.financing_assumptions WHERE scenario_id = ANY(%s::uuid[])", (scenario_ids,))
+    financing = {str(row['scenario_id']): row for row in _dict_rows(cur)}
+
+    (costs, no_costs), (units, no_units) = tables["costs"], tables["units"]
+    return {
+        sid: ScenarioInputs(scenario, financing.get(sid), costs.get(sid, no_costs), units.get(sid, no_units))
+        for sid, scenario in zip(scenario_ids, scenarios)
+    }
+
+def fetch_scenarios_data(scenario_ids: list) -> dict:
+    """
+    Portfolio version of fetch_scenario_data.
+    Loads costs, units, scenario and financing rows for many scenarios with one query per table.
+    Each table is fetched sorted by scenario and split into per-scenario ColumnTable slices.
+    Returns {scenario_id: ScenarioInputs} for the scenarios that exist.
+    """
+    with get_db_cursor(cursor_factory=None) as cur:
+        cur.execute("SELECT * FROM public.financial_scenarios WHERE id = ANY(%s::uuid[])", (scenario_ids,))
+        return _scenario_inputs(cur, _dict_rows(cur))
+
+def fetch_project_scenarios(project_id: str) -> dict:
+    """
+    Every scenario of a project with its inputs, base scenario first ({scenario_id: ScenarioInputs}).
+    Read in one REPEATABLE READ transaction, so all the scenarios come from the same snapshot.
+    """
+    with get_db_cursor(cursor_factory=None) as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        cur.execute("""
+            SELECT * FROM public.financial_scenarios
+            WHERE project_id = %s
+            ORDER BY scenario_type IS DISTINCT FROM 'base', created_at
+        """, (project_id,))
+        return _scenario_inputs(cur, _dict_rows(cur))
+
+# Columns the change feed may write; everything else on the rows is owned by the app/RLS
+EDITABLE_COST_COLUMNS = (
+    "category", "item_name", "calculation_method", "input_value", "total_estimated",
+    "distribution_curve", "start_month_offset", "duration_months", "schedule_phase", "is_impact_fee", "display_order"
+)
+EDITABLE_UNIT_COLUMNS = (
+    "model_name", "unit_count", "area_sqft", "avg_price", "sales_start_month_offset",
+    "sales_velocity_per_month", "sale_date", "schedule_phase", "absorption_model", "display_order"
+)
+
+_ROWS_CHECKSUM = """
+SELECT
+    (SELECT md5(COALESCE(string_agg(c::text, '|' ORDER BY c.id), '')) FROM public.cost_line_items c WHERE c.scenario_id = %(sid)s)
+    || (SELECT md5(COALESCE(string_agg(u::text, '|' ORDER BY u.id), '')) FROM public.units_mix u WHERE u.scenario_id = %(sid)s)
+    AS checksum
+"""
+
+def _rows_checksum(cur, scenario_id: str) -> str:
+    """Server-side fingerprint of a scenario's cost and unit rows (nothing is shipped to Python)."""
+    cur.execute(_ROWS_CHECKSUM, {"sid": scenario_id})
+    return cur.fetchone()['checksum']
+
+def _upsert_rows(cur, table: str, editable: tuple, scenario_id: str, rows: list, extra: dict = None) -> list:
+    changed = []
+    for row in rows:
+        values = {k: v for k, v in row.items() if k in editable}
+        if row.get('id'):
+            if not values:
+                continue
+            query = sql.SQL("UPDATE public.{} SET {} WHERE id = %s AND scenario_id = %s RETURNING *").format(
+                sql.Identifier(table),
+                sql.SQL(", ").join(sql.SQL("{} = %s").format(sql.Identifier(k)) for k in values)
+            )
+            cur.execute(query, (*values.values(), row['id'], scenario_id))
+        else:
+            values = {**values, **(extra or {}), "scenario_id": scenario_id}
+            query = sql.SQL("INSERT INTO public.{} ({}) VALUES ({}) RETURNING *").format(
+                sql.Identifier(table),
+                sql.SQL(", ").join(map(sql.Identifier, values)),
+                sql.SQL(", ").join(sql.Placeholder() * len(values))
+            )
+            cur.execute(query, tuple(values.values()))
+        result = cur.fetchone()
+        if result:
+            changed.append(result)
+    return changed
+
+def apply_line_item_changes(
+    scenario_id: str,
+    costs: list,
+    units: list,
+    deleted_cost_ids: list,
+    deleted_unit_ids: list
+) -> dict:
+    """
+    Change feed for cost_line_items / units_mix, in one transaction.
+    Rows with an id are updated, rows without one are inserted; only editable columns are written.
+    Returns the written rows plus row checksums taken before and after the change, so callers
+    holding incremental state can tell whether it still matches the database, and the scenario's
+    financing terms.
+    """
+    with get_db_cursor() as cur:
+        cur.execute("SELECT * FROM public.financial_scenarios WHERE id = %s FOR UPDATE", (scenario_id,))
         scenario = cur.fetchone()
-        
+        if not scenario:
+            return {"scenario": None}
+
+        checksum_before = _rows_checksum(cur, scenario_id)
+        changed_costs = _upsert_rows(
+            cur, "cost_line_items", EDITABLE_COST_COLUMNS, scenario_id, costs,
+            {"organization_id": scenario.get('organization_id')}
+        )
+        changed_units = _upsert_rows(cur, "units_mix", EDITABLE_UNIT_COLUMNS, scenario_id, units)
+
+        removed_costs, removed_units = [], []
+        if deleted_cost_ids:
+            cur.execute(
+                "DELETE FROM public.cost_line_items WHERE scenario_id = %s AND id = ANY(%s::uuid[]) RETURNING id",
+                (scenario_id, deleted_cost_ids)
+            )
+            removed_costs = [str(r['id']) for r in cur.fetchall()]
+        if deleted_unit_ids:
+            cur.execute(
+                "DELETE FROM public.units_mix WHERE scenario_id = %s AND id = ANY(%s::uuid[]) RETURNING id",
+                (scenario_id, deleted_unit_ids)
+            )
+            removed_units = [str(r['id']) for r in cur.fetchall()]
+
+        cur.execute("SELECT * FROM public.financing_assumptions WHERE scenario_id = %s", (scenario_id,))
+        financing = cur.fetchone()
+
         return {
-            "costs": costs,
-            "units": units,
-            "scenario": scenario
+            "scenario": scenario,
+            "financing": dict(financing) if financing else None,
+            "costs": changed_costs,
+            "units": changed_units,
+            "deleted_cost_ids": removed_costs,
+            "deleted_unit_ids": removed_units,
+            "checksum_before": checksum_before,
+            "checksum_after": _rows_checksum(cur, scenario_id)
         }
 
-def update_cashflow_report(scenario_id: str, monthly_data: list, intelligence: dict = None):
-    with get_db_cursor() as cur:
-        # 1. Clean old report for this scenario
-        cur.execute("DELETE FROM public.monthly_cashflow_report WHERE scenario_id = %s", (scenario_id,))
-        
-        # 2. Bulk insert new report
-        insert_query = """
-        INSERT INTO public.monthly_cashflow_report 
-        (scenario_id, month_date, project_month_index, projected_income, projected_costs, projected_net_flow)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        """
-        
-        batch_data = []
+_STAGING_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS _cashflow_staging (
+    scenario_id UUID,
+    month_date DATE,
+    project_month_index INTEGER,
+    projected_income DECIMAL(15,2),
+    projected_costs DECIMAL(15,2),
+    projected_net_flow DECIMAL(15,2)
+) ON COMMIT DROP
+"""
+
+# Only months whose projected values changed produce a new row version; actual_* columns are untouched.
+_MERGE_STAGING = """
+INSERT INTO public.monthly_cashflow_report AS r
+(scenario_id, month_date, project_month_index, projected_income, projected_costs, projected_net_flow)
+SELECT scenario_id, month_date, project_month_index, projected_income, projected_costs, projected_net_flow
+FROM _cashflow_staging
+ON CONFLICT (scenario_id, project_month_index) DO UPDATE SET
+    month_date = EXCLUDED.month_date,
+    projected_income = EXCLUDED.projected_income,
+    projected_costs = EXCLUDED.projected_costs,
+    projected_net_flow = EXCLUDED.projected_net_flow,
+    updated_at = NOW()
+WHERE (r.month_date, r.projected_income, r.projected_costs, r.projected_net_flow)
+    IS DISTINCT FROM (EXCLUDED.month_date, EXCLUDED.projected_income, EXCLUDED.projected_costs, EXCLUDED.projected_net_flow)
+"""
+
+# Months past the new horizon: drop them unless they carry actuals, in which case only zero the projections.
+_HORIZON_CTE = """
+WITH horizon AS (
+    SELECT scenario_id, MAX(project_month_index) AS last_index
+    FROM _cashflow_staging GROUP BY scenario_id
+)
+"""
+
+_DROP_PAST_HORIZON = _HORIZON_CTE + """
+DELETE FROM public.monthly_cashflow_report r
+USING horizon h
+WHERE r.scenario_id = h.scenario_id
+  AND r.project_month_index > h.last_index
+  AND COALESCE(r.actual_income, 0) = 0
+  AND COALESCE(r.actual_costs, 0) = 0
+  AND COALESCE(r.actual_net_flow, 0) = 0
+"""
+
+_ZERO_PAST_HORIZON = _HORIZON_CTE + """
+UPDATE public.monthly_cashflow_report r
+SET projected_income = 0, projected_costs = 0, projected_net_flow = 0, updated_at = NOW()
+FROM horizon h
+WHERE r.scenario_id = h.scenario_id
+  AND r.project_month_index > h.last_index
+  AND (r.projected_income, r.projected_costs, r.projected_net_flow) IS DISTINCT FROM (0, 0, 0)
+"""
+
+# Re-queue months with actual entries: a new or relabelled month row must pick its actuals up again
+_MARK_REPORTED_ACTUAL_MONTHS = """
+INSERT INTO public.actual_cashflow_dirty_months (project_id, month_date)
+SELECT DISTINCT s.project_id, st.month_date
+FROM _cashflow_staging st
+JOIN public.financial_scenarios s ON s.id = st.scenario_id
+JOIN public.monthly_cashflow_report r
+    ON r.scenario_id = st.scenario_id AND r.project_month_index = st.project_month_index
+WHERE r.actual_income = 0 AND r.actual_costs = 0
+  AND EXISTS (
+      SELECT 1 FROM public.actual_cashflow_entries e
+      WHERE e.project_id = s.project_id
+        AND e.month_date >= st.month_date
+        AND e.month_date < st.month_date + INTERVAL '1 month'
+  )
+ON CONFLICT DO NOTHING
+"""
+
+def _copy_cashflow_rows(cur, reports: dict):
+    """Streams every report row into the staging table with a single COPY."""
+    buffer = io.StringIO()
+    for scenario_id, (monthly_data, *_) in reports.items():
         for item in monthly_data:
-            batch_data.append((
-                scenario_id,
-                item['date'],
-                item['index'],
-                item['income'],
-                item['costs'],
-                item['net_flow']
-            ))
-            
-        cur.executemany(insert_query, batch_data)
+            buffer.write(
+                f"{scenario_id}\t{item['date'].isoformat()}\t{int(item['index'])}\t"
+                f"{item['income']:.2f}\t{item['costs']:.2f}\t{item['net_flow']:.2f}\n"
+            )
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY _cashflow_staging (scenario_id, month_date, project_month_index, "
+        "projected_income, projected_costs, projected_net_flow) FROM STDIN",
+        buffer
+    )
+
+def _write_cashflow_reports(cur, reports: dict) -> int:
+    """
+    COPY + merge writer for monthly_cashflow_report.
+    Returns how many month rows were actually inserted or changed.
+    """
+    # 1. Stream new projections into a per-transaction staging table
+    cur.execute(_STAGING_DDL)
+    _copy_cashflow_rows(cur, reports)
 
-        # 3. Update Scenario with Intelligence (Sticky data)
+    # 2. Upsert only the months that changed, preserving actual_* columns
+    cur.execute(_MERGE_STAGING)
+    changed = cur.rowcount
+
+    # 3. Trim months beyond the new horizon
+    cur.execute(_DROP_PAST_HORIZON)
+    changed += cur.rowcount
+    cur.execute(_ZERO_PAST_HORIZON)
+    changed += cur.rowcount
+    cur.execute(_MARK_REPORTED_ACTUAL_MONTHS)
+    cur.execute("DROP TABLE _cashflow_staging")
+
+    # 4. Update Scenarios with Intelligence (Sticky data) and the inputs the report came from
+    for scenario_id, (_, intelligence, input_hash) in reports.items():
         if intelligence:
             cur.execute(
-                "UPDATE public.financial_scenarios SET health_score = %s, strategic_analysis = %s WHERE id = %s",
-                (intelligence['health_score'], intelligence['strategic_analysis'], scenario_id)
+                """
+                UPDATE public.financial_scenarios
+                SET health_score = %s, strategic_analysis = COALESCE(%s, strategic_analysis), report_input_hash = %s
+                WHERE id = %s
+                """,
+                (intelligence['health_score'], intelligence['strategic_analysis'], input_hash, scenario_id)
+            )
+        else:
+            cur.execute(
+                "UPDATE public.financial_scenarios SET report_input_hash = %s WHERE id = %s", (input_hash, scenario_id)
+            )
+    return changed
+
+def update_cashflow_report(scenario_id: str, monthly_data: list, intelligence: dict = None, input_hash: str = None) -> int:
+    """input_hash: scenario_fingerprint of the inputs the report was computed from (None when unknown)."""
+    with get_db_cursor() as cur:
+        return _write_cashflow_reports(cur, {scenario_id: (monthly_data, intelligence, input_hash)})
+
+def update_cashflow_reports(reports: dict) -> int:
+    """
+    Writes many scenario reports in a single transaction.
+    `reports` maps scenario_id -> (monthly_data, intelligence, input_hash).
+    """
+    with get_db_cursor() as cur:
+        return _write_cashflow_reports(cur, reports)
+
+def fetch_cached_result(input_hash: str):
+    with get_db_cursor() as cur:
+        cur.execute(
+            "SELECT payload FROM public.scenario_result_cache WHERE input_hash = %s AND expires_at > NOW()",
+            (input_hash,)
+        )
+        row = cur.fetchone()
+        return row['payload'] if row else None
+
+def store_cached_result(scenario_id: str, input_hash: str, payload: dict, ttl_seconds: int):
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.scenario_result_cache (input_hash, scenario_id, payload, expires_at)
+            VALUES (%s, %s, %s, NOW() + make_interval(secs => %s))
+            ON CONFLICT (input_hash) DO UPDATE SET
+                payload = EXCLUDED.payload,
+                expires_at = EXCLUDED.expires_at,
+                created_at = NOW()
+            """,
+            (input_hash, scenario_id, Json(payload), ttl_seconds)
+        )
+
+def delete_cached_results(scenario_id: str = None) -> int:
+    """Drops a scenario's cached results, or only the expired ones when no scenario is given."""
+    with get_db_cursor() as cur:
+        if scenario_id:
+            cur.execute("DELETE FROM public.scenario_result_cache WHERE scenario_id = %s", (scenario_id,))
+        else:
+            cur.execute("DELETE FROM public.scenario_result_cache WHERE expires_at <= NOW()")
+        return cur.rowcount
+
+def enqueue_recalculation_job(scenario_id: str, force: bool = False):
+    """
+    Queues a recalculation, coalescing into the scenario's pending job if there is one.
+    Returns (job, coalesced).
+    """
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.recalculation_jobs (scenario_id, force)
+            VALUES (%s, %s)
+            ON CONFLICT (scenario_id) WHERE status = 'queued' DO UPDATE SET
+                force = recalculation_jobs.force OR EXCLUDED.force
+            RETURNING *, (xmax <> 0) AS coalesced
+            """,
+            (scenario_id, force)
+        )
+        job = dict(cur.fetchone())
+        return job, job.pop('coalesced')
+
+def count_queued_recalculation_jobs() -> int:
+    with get_db_cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM public.recalculation_jobs WHERE status = 'queued'")
+        return cur.fetchone()['n']
+
+def claim_recalculation_job(worker_id: str):
+    """
+    Atomically moves the oldest queued job to 'running' and returns it (None when idle).
+    SKIP LOCKED lets any number of workers poll the same table without blocking each other;
+    scenarios that already have a running job are skipped so one scenario never runs twice at once.
+    """
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.recalculation_jobs
+            SET status = 'running', stage = 'claimed', worker_id = %s,
+                attempts = attempts + 1, started_at = NOW(), heartbeat_at = NOW()
+            WHERE id = (
+                SELECT j.id FROM public.recalculation_jobs j
+                WHERE j.status = 'queued'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM public.recalculation_jobs r
+                      WHERE r.scenario_id = j.scenario_id AND r.status = 'running'
+                  )
+                ORDER BY j.created_at
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
             )
+            RETURNING *
+            """,
+            (worker_id,)
+        )
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+def update_recalculation_job(job_id: str, stage: str = None, status: str = None, result: dict = None, error: str = None):
+    """Records progress (doubles as the worker heartbeat) and, for terminal statuses, the outcome."""
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.recalculation_jobs SET
+                stage = COALESCE(%s, stage),
+                status = COALESCE(%s, status),
+                result = COALESCE(%s, result),
+                error = COALESCE(%s, error),
+                heartbeat_at = NOW(),
+                finished_at = CASE WHEN %s IN ('succeeded', 'failed') THEN NOW() ELSE finished_at END
+            WHERE id = %s
+            """,
+            (stage, status, Json(result) if result is not None else None, error, status, job_id)
+        )
+
+def fetch_recalculation_job(job_id: str):
+    with get_db_cursor() as cur:
+        cur.execute("SELECT * FROM public.recalculation_jobs WHERE id = %s", (job_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+def recover_stale_recalculation_jobs(stale_seconds: int, max_attempts: int) -> int:
+    """
+    Returns jobs whose worker stopped heart-beating to the queue (or fails them once they have
+    used max_attempts, or when a newer job for the same scenario is already pending).
+    Also purges finished jobs older than a week.
+    """
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.recalculation_jobs j SET
+                status = 'failed', finished_at = NOW(),
+                error = 'Worker lost while running the job'
+            WHERE j.status = 'running'
+              AND j.heartbeat_at < NOW() - make_interval(secs => %s)
+              AND (j.attempts >= %s OR EXISTS (
+                  SELECT 1 FROM public.recalculation_jobs q
+                  WHERE q.scenario_id = j.scenario_id AND q.status = 'queued'
+              ))
+            """,
+            (stale_seconds, max_attempts)
+        )
+        recovered = cur.rowcount
+        cur.execute(
+            """
+            UPDATE public.recalculation_jobs
+            SET status = 'queued', stage = NULL, worker_id = NULL
+            WHERE status = 'running'
+              AND heartbeat_at < NOW() - make_interval(secs => %s)
+            """,
+            (stale_seconds,)
+        )
+        recovered += cur.rowcount
+        cur.execute(
+            """
+            DELETE FROM public.recalculation_jobs
+            WHERE status IN ('succeeded', 'failed') AND finished_at < NOW() - INTERVAL '7 days'
+            """
+        )
+        return recovered
+
+def store_strategic_analysis(scenario_id: str, analysis: str, health_score: int, metrics: dict):
+    """Saves a finished AI analysis on the scenario and appends it to the project_ai_snapshots timeline."""
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.financial_scenarios
+            SET strategic_analysis = %s, health_score = %s
+            WHERE id = %s
+            """,
+            (analysis, health_score, scenario_id)
+        )
+        cur.execute(
+            """
+            INSERT INTO public.project_ai_snapshots (
+                scenario_id, organization_id, health_score,
+                irr_at_snapshot, roi_at_snapshot, strategic_verdict, snapshot_type
+            )
+            SELECT s.id, p.organization_id, %s, %s, %s, %s, 'recalculation'
+            FROM public.financial_scenarios s
+            LEFT JOIN public.projects p ON p.id = s.project_id
+            WHERE s.id = %s
+            """,
+            (health_score, metrics.get('irr'), metrics.get('roi'), analysis, scenario_id)
+        )
+
+def fetch_strategic_analysis(scenario_id: str):
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT s.health_score, s.strategic_analysis,
+                   (SELECT MAX(created_at) FROM public.project_ai_snapshots a WHERE a.scenario_id = s.id) AS analyzed_at
+            FROM public.financial_scenarios s
+            WHERE s.id = %s
+            """,
+            (scenario_id,)
+        )
+        return cur.fetchone()
+
+def fetch_ai_response(prompt_hash: str, ttl_seconds: int):
+    """Returns a memoized model response younger than ttl_seconds (and counts the hit), or None."""
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.ai_prompt_cache
+            SET hits = hits + 1, last_hit_at = NOW()
+            WHERE prompt_hash = %s AND created_at > NOW() - make_interval(secs => %s)
+            RETURNING response
+            """,
+            (prompt_hash, ttl_seconds)
+        )
+        row = cur.fetchone()
+        return row['response'] if row else None
+
+def store_ai_response(prompt_hash: str, model: str, prompt: str, response: str):
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.ai_prompt_cache (prompt_hash, model, prompt, response)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (prompt_hash) DO UPDATE SET
+                response = EXCLUDED.response,
+                created_at = NOW(),
+                last_hit_at = NOW()
+            """,
+            (prompt_hash, model, prompt, response)
+        )
+
+def prune_ai_responses(ttl_seconds: int, max_rows: int) -> int:
+    """Evicts expired responses, then the least recently used ones beyond max_rows."""
+    with get_db_cursor() as cur:
+        cur.execute(
+            "DELETE FROM public.ai_prompt_cache WHERE created_at <= NOW() - make_interval(secs => %s)",
+            (ttl_seconds,)
+        )
+        removed = cur.rowcount
+        cur.execute(
+            """
+            DELETE FROM public.ai_prompt_cache
+            WHERE prompt_hash IN (
+                SELECT prompt_hash FROM public.ai_prompt_cache
+                ORDER BY last_hit_at DESC
+                OFFSET %s
+            )
+            """,
+            (max_rows,)
+        )
+        return removed + cur.rowcount
+
+_ACTUAL_TOTALS_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS _actual_totals (
+    project_id UUID,
+    month_date DATE,
+    income DECIMAL(15,2),
+    costs DECIMAL(15,2)
+) ON COMMIT DROP
+"""
+
+# Full reconciliation: every month with entries, plus every report month still carrying actuals
+_MARK_PROJECT_MONTHS = """
+INSERT INTO public.actual_cashflow_dirty_months (project_id, month_date)
+SELECT project_id, date_trunc('month', month_date)::date
+FROM public.actual_cashflow_entries
+WHERE project_id = %(project_id)s
+UNION
+SELECT s.project_id, r.month_date
+FROM public.monthly_cashflow_report r
+JOIN public.financial_scenarios s ON s.id = r.scenario_id
+WHERE s.project_id = %(project_id)s
+  AND (r.actual_income, r.actual_costs, r.actual_net_flow) IS DISTINCT FROM (0, 0, 0)
+ON CONFLICT DO NOTHING
+"""
+
+# Claims the dirty months and aggregates their entries (a month whose entries were all deleted sums to 0)
+_AGGREGATE_DIRTY_MONTHS = """
+WITH claimed AS (
+    DELETE FROM public.actual_cashflow_dirty_months
+    WHERE %(project_id)s::uuid IS NULL OR project_id = %(project_id)s::uuid
+    RETURNING project_id, month_date
+)
+INSERT INTO _actual_totals (project_id, month_date, income, costs)
+SELECT c.project_id, c.month_date,
+       COALESCE(SUM(e.amount) FILTER (WHERE e.type = 'income'), 0),
+       COALESCE(SUM(e.amount) FILTER (WHERE e.type IS DISTINCT FROM 'income'), 0)
+FROM claimed c
+LEFT JOIN public.actual_cashflow_entries e
+    ON e.project_id = c.project_id
+   AND e.month_date >= c.month_date
+   AND e.month_date < c.month_date + INTERVAL '1 month'
+GROUP BY c.project_id, c.month_date
+"""
+
+# Writes the totals into every scenario of the project. Reports written before month labels were
+# calendar months can still hold two rows with the same month: the first takes the actuals, the rest get 0.
+_APPLY_ACTUAL_TOTALS = """
+WITH targets AS (
+    SELECT r.id,
+           CASE WHEN ROW_NUMBER() OVER w = 1 THEN t.income ELSE 0 END AS income,
+           CASE WHEN ROW_NUMBER() OVER w = 1 THEN t.costs ELSE 0 END AS costs
+    FROM _actual_totals t
+    JOIN public.financial_scenarios s ON s.project_id = t.project_id
+    JOIN public.monthly_cashflow_report r ON r.scenario_id = s.id AND r.month_date = t.month_date
+    WINDOW w AS (PARTITION BY r.scenario_id, r.month_date ORDER BY r.project_month_index)
+)
+UPDATE public.monthly_cashflow_report r
+SET actual_income = t.income,
+    actual_costs = t.costs,
+    actual_net_flow = t.income - t.costs,
+    updated_at = NOW()
+FROM targets t
+WHERE r.id = t.id
+  AND (r.actual_income, r.actual_costs, r.actual_net_flow) IS DISTINCT FROM (t.income, t.costs, t.income - t.costs)
+RETURNING r.scenario_id
+"""
+
+# Months with actuals that fall outside a (reported) scenario's horizon
+_UNMATCHED_ACTUAL_MONTHS = """
+SELECT s.id AS scenario_id, t.month_date
+FROM _actual_totals t
+JOIN public.financial_scenarios s ON s.project_id = t.project_id
+WHERE (t.income <> 0 OR t.costs <> 0)
+  AND EXISTS (SELECT 1 FROM public.monthly_cashflow_report r WHERE r.scenario_id = s.id)
+  AND NOT EXISTS (
+      SELECT 1 FROM public.monthly_cashflow_report r
+      WHERE r.scenario_id = s.id AND r.month_date = t.month_date
+  )
+ORDER BY s.id, t.month_date
+"""
+
+def reconcile_actuals(project_id: str = None, full: bool = False) -> dict:
+    """
+    Folds changed actual_cashflow_entries months into monthly_cashflow_report.actual_*.
+    Only the months queued in actual_cashflow_dirty_months are re-aggregated (all of a project's
+    months with full=True). Returns the months processed, the rows changed, the affected scenario
+    ids and the actual months no report row could take.
+    """
+    with get_db_cursor() as cur:
+        if full and project_id:
+            cur.execute(_MARK_PROJECT_MONTHS, {"project_id": project_id})
+        cur.execute(_ACTUAL_TOTALS_DDL)
+        cur.execute(_AGGREGATE_DIRTY_MONTHS, {"project_id": project_id})
+        months = cur.rowcount
+        cur.execute(_APPLY_ACTUAL_TOTALS)
+        changed = cur.fetchall()
+        cur.execute(_UNMATCHED_ACTUAL_MONTHS)
+        unmatched = cur.fetchall()
+
+        scenario_ids = sorted({str(row['scenario_id']) for row in changed})
+        if full and project_id:
+            # Variance metrics depend on the projections too: refresh every scenario of the project
+            cur.execute("SELECT id FROM public.financial_scenarios WHERE project_id = %s", (project_id,))
+            scenario_ids = sorted({str(row['id']) for row in cur.fetchall()})
+        cur.execute("DROP TABLE _actual_totals")
+        return {
+            "months": months,
+            "rows_changed": len(changed),
+            "scenario_ids": scenario_ids,
+            "unmatched": [
+                {"scenario_id": str(row['scenario_id']), "month_date": row['month_date']} for row in unmatched
+            ]
+        }
+
+def fetch_monitoring_flows(scenario_ids: list) -> dict:
+    """{scenario_id: report rows ordered by month} with the projected and actual columns."""
+    flows = {scenario_id: [] for scenario_id in scenario_ids}
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT scenario_id, project_month_index, month_date,
+                   projected_net_flow, actual_income, actual_costs, actual_net_flow
+            FROM public.monthly_cashflow_report
+            WHERE scenario_id = ANY(%s::uuid[])
+            ORDER BY scenario_id, project_month_index
+            """,
+            (list(scenario_ids),)
+        )
+        for row in cur.fetchall():
+            flows[str(row['scenario_id'])].append(row)
+    return flows
+
+def fetch_actuals_by_category(scenario_id: str) -> list:
+    """Budget (cost_line_items) vs actual spend per cost category, plus actual income."""
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            WITH scenario AS (
+                SELECT id, project_id FROM public.financial_scenarios WHERE id = %s
+            ),
+            actuals AS (
+                SELECT CASE WHEN e.type = 'income' THEN 'INCOME'
+                            ELSE COALESCE(c.category, e.category, 'UNCATEGORIZED') END AS category,
+                       SUM(e.amount) AS actual,
+                       COUNT(*) AS entries
+                FROM public.actual_cashflow_entries e
+                JOIN scenario s ON s.project_id = e.project_id
+                LEFT JOIN public.cost_line_items c ON c.id = e.cost_item_id
+                GROUP BY 1
+            ),
+            budget AS (
+                SELECT COALESCE(c.category, 'UNCATEGORIZED') AS category, SUM(c.total_estimated) AS budget
+                FROM public.cost_line_items c
+                JOIN scenario s ON s.id = c.scenario_id
+                GROUP BY 1
+            )
+            SELECT category,
+                   COALESCE(b.budget, 0) AS budget,
+                   COALESCE(a.actual, 0) AS actual,
+                   COALESCE(a.entries, 0) AS entries
+            FROM actuals a
+            FULL JOIN budget b USING (category)
+            ORDER BY category
+            """,
+            (scenario_id,)
+        )
+        return cur.fetchall()
+
+def store_monitoring_metrics(snapshots: dict):
+    """Saves {scenario_id: compare_viability_vs_monitoring result} on the scenarios."""
+    with get_db_cursor() as cur:
+        for scenario_id, snapshot in snapshots.items():
+            cur.execute(
+                """
+                UPDATE public.financial_scenarios
+                SET monitoring_metrics = %s, monitoring_updated_at = NOW()
+                WHERE id = %s
+                """,
+                (Json(snapshot), scenario_id)
+            )
+
+def fetch_scenario_project_id(scenario_id: str):
+    with get_db_cursor() as cur:
+        cur.execute("SELECT project_id FROM public.financial_scenarios WHERE id = %s", (scenario_id,))
+        row = cur.fetchone()
+        return str(row['project_id']) if row and row['project_id'] else None
+
+# Upserts the scenario rows of a recalculation; projects of unknown or orphan scenarios are skipped
+_UPSERT_SCENARIO_SUMMARIES = """
+INSERT INTO public.scenario_portfolio_summary AS s (
+    scenario_id, project_id, irr, npv, roi, irr_status, health_score, total_gdv, total_costs,
+    peak_equity, equity_required, break_even_month, months, engine_version, calculated_at
+)
+SELECT x.scenario_id, fs.project_id, x.irr, x.npv, x.roi, x.irr_status, x.health_score, x.total_gdv,
+       x.total_costs, x.peak_equity, x.equity_required, x.break_even_month, x.months, x.engine_version, NOW()
+FROM jsonb_to_recordset(%s) AS x(
+    scenario_id UUID, irr DOUBLE PRECISION, npv DECIMAL, roi DOUBLE PRECISION, irr_status TEXT,
+    health_score INTEGER, total_gdv DECIMAL, total_costs DECIMAL, peak_equity DECIMAL,
+    equity_required DECIMAL, break_even_month INTEGER, months INTEGER, engine_version TEXT
+)
+JOIN public.financial_scenarios fs ON fs.id = x.scenario_id
+WHERE fs.project_id IS NOT NULL
+ON CONFLICT (scenario_id) DO UPDATE SET
+    project_id = EXCLUDED.project_id,
+    irr = EXCLUDED.irr,
+    npv = EXCLUDED.npv,
+    roi = EXCLUDED.roi,
+    irr_status = EXCLUDED.irr_status,
+    health_score = EXCLUDED.health_score,
+    total_gdv = EXCLUDED.total_gdv,
+    total_costs = EXCLUDED.total_costs,
+    peak_equity = EXCLUDED.peak_equity,
+    equity_required = EXCLUDED.equity_required,
+    break_even_month = EXCLUDED.break_even_month,
+    months = EXCLUDED.months,
+    engine_version = EXCLUDED.engine_version,
+    calculated_at = NOW()
+RETURNING project_id
+"""
+
+def update_portfolio_rollups(summaries: list) -> int:
+    """
+    Incremental portfolio refresh after a recalculation: upserts the scenario summaries, then
+    re-rolls only the touched projects and their organizations. Returns the projects refreshed.
+    """
+    if not summaries:
+        return 0
+    with get_db_cursor() as cur:
+        cur.execute(_UPSERT_SCENARIO_SUMMARIES, (Json(summaries),))
+        project_ids = sorted({str(row['project_id']) for row in cur.fetchall()})
+        if not project_ids:
+            return 0
+        # Sorted so concurrent refreshes lock the summary rows in the same order
+        cur.execute(
+            "SELECT public.refresh_project_portfolio(id) FROM unnest(%s::uuid[]) AS id ORDER BY id",
+            (project_ids,)
+        )
+        cur.execute(
+            """
+            SELECT public.refresh_organization_portfolio(organization_id)
+            FROM (
+                SELECT DISTINCT organization_id FROM public.projects
+                WHERE id = ANY(%s::uuid[]) AND organization_id IS NOT NULL
+            ) orgs
+            ORDER BY organization_id
+            """,
+            (project_ids,)
+        )
+        return len(project_ids)
+
+# Sortable portfolio columns and their SQL types (cursor values arrive as text)
+PORTFOLIO_SORT_TYPES = {
+    "calculated_at": "timestamptz",
+    "irr": "double precision",
+    "health_score": "integer",
+    "total_gdv": "numeric",
+    "peak_equity": "numeric",
+}
+
+def fetch_portfolio_page(scope: str, scope_id: str, sort: str, limit: int, after=None, status: str = None) -> list:
+    """
+    One keyset page of project_portfolio_summary for an organization or user (scope column),
+    ordered by `sort` descending (NULLs last) then project_id. `after` is the (sort value, project_id)
+    of the previous page's last row. Fetches limit + 1 rows so the caller can tell if more follow.
+    """
+    if scope not in ("organization_id", "user_id") or sort not in PORTFOLIO_SORT_TYPES:
+        raise ValueError(f"Unsupported portfolio scope/sort: {scope}/{sort}")
+    column = sql.Identifier(sort)
+    base = [sql.SQL("{} = %(scope_id)s AND deleted_at IS NULL").format(sql.Identifier(scope))]
+    params = {"scope_id": scope_id}
+    if status:
+        base.append(sql.SQL("status = %(status)s"))
+        params["status"] = status
+    after_value, after_id = after if after is not None else (None, None)
+    params["after_value"], params["after_id"] = after_value, after_id
+
+    # Ranked rows, then the NULL tail: two range scans instead of an OR the index cannot serve
+    parts = []
+    if after is None or after_value is not None:
+        ranked = base + [sql.SQL("{} IS NOT NULL").format(column)]
+        if after is not None:
+            ranked.append(sql.SQL("({col}, project_id) < (%(after_value)s::{type}, %(after_id)s::uuid)").format(
+                col=column, type=sql.SQL(PORTFOLIO_SORT_TYPES[sort])
+            ))
+        parts.append((ranked, sql.SQL("{} DESC, project_id DESC").format(column)))
+    tail = base + [sql.SQL("{} IS NULL").format(column)]
+    if after is not None and after_value is None:
+        tail.append(sql.SQL("project_id < %(after_id)s::uuid"))
+    parts.append((tail, sql.SQL("project_id DESC")))
+
+    rows = []
+    with get_db_cursor() as cur:
+        for conditions, order in parts:
+            params["limit"] = limit + 1 - len(rows)
+            cur.execute(
+                sql.SQL("SELECT * FROM public.project_portfolio_summary WHERE {where} ORDER BY {order} LIMIT %(limit)s")
+                .format(where=sql.SQL(" AND ").join(conditions), order=order),
+                params
+            )
+            rows.extend(cur.fetchall())
+            if len(rows) > limit:
+                break
+    return rows
+
+# Organizations a user can read: active memberships plus the ones they own (as get_my_organizations())
+_USER_ORGANIZATIONS = """
+    SELECT organization_id FROM public.organization_members WHERE member_user_id = %(user_id)s AND status = 'active'
+    UNION
+    SELECT id FROM public.organizations WHERE owner_id = %(user_id)s
+"""
+
+def is_organization_member(organization_id: str, user_id: str) -> bool:
+    with get_db_cursor() as cur:
+        cur.execute(
+            f"SELECT %(organization_id)s::uuid IN ({_USER_ORGANIZATIONS}) AS member",
+            {"organization_id": organization_id, "user_id": user_id}
+        )
+        return bool(cur.fetchone()['member'])
+
+def fetch_organization_portfolio(organization_id: str):
+    with get_db_cursor() as cur:
+        cur.execute(
+            "SELECT * FROM public.organization_portfolio_summary WHERE organization_id = %s",
+            (organization_id,)
+        )
+        return cur.fetchone()
+
+def fetch_project_portfolio(project_id: str, user_id: str):
+    """
+    A project's rollup row plus the summary of each of its scenarios (None when unknown, or when
+    the user neither created it nor belongs to its organization).
+    """
+    with get_db_cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT * FROM public.project_portfolio_summary
+            WHERE project_id = %(project_id)s
+              AND (user_id = %(user_id)s OR organization_id IN ({_USER_ORGANIZATIONS}))
+            """,
+            {"project_id": project_id, "user_id": user_id}
+        )
+        project = cur.fetchone()
+        if project is None:
+            return None
+        cur.execute(
+            """
+            SELECT fs.id AS scenario_id, fs.name, fs.scenario_type, ss.irr, ss.npv, ss.roi, ss.irr_status,
+                   ss.health_score, ss.total_gdv, ss.total_costs, ss.peak_equity, ss.equity_required,
+                   ss.break_even_month, ss.months, ss.engine_version, ss.calculated_at
+            FROM public.financial_scenarios fs
+            LEFT JOIN public.scenario_portfolio_summary ss ON ss.scenario_id = fs.id
+            WHERE fs.project_id = %s
+            ORDER BY (fs.scenario_type = 'base') DESC NULLS LAST, fs.created_at
+            """,
+            (project_id,)
+        )
+        return {"project": project, "scenarios": cur.fetchall()}
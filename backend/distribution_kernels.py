@@ -0,0 +1,170 @@
+import numpy as np
+from functools import lru_cache
+from typing import Callable, Dict, Sequence, Tuple
+
+# Registry of cost distribution shapes ("kernels").
+# A kernel is the normalized monthly weight vector of a curve over `duration` months (sums to 1).
+# It only depends on (curve, duration, shape params), so each one is built once and memoized;
+# the engine then scatters `weight * amount` for every cost line in one vectorized pass.
+#
+# cost_line_items.distribution_curve accepts `name` or `name:p1,p2,...`:
+#   linear                 equal monthly amounts (also the fallback for unknown names)
+#   s-curve                logistic ramp-up / ramp-down (classic construction curve)
+#   single                 the whole amount in the first month
+#   front-loaded[:mode]    PERT-shaped, peak early (mode as a fraction of the duration, default 0.2)
+#   back-loaded[:mode]     PERT-shaped, peak late (default mode 0.8)
+#   beta:a,b               Beta(a, b) density over the duration
+#   pert:mode[,lambda]     PERT(min=0, mode, max=1), lambda defaults to 4
+#   retention[:holdback]   linear progress payments with `holdback` (default 0.10) withheld
+#                          from each and released in the final month
+#   milestone:w1,w2,...    lump sums at evenly spaced milestones (weights are renormalized)
+
+CurveSpec = Tuple[str, Tuple[float, ...]]
+
+# Sub-samples per month when integrating continuous densities (beta / PERT)
+_SUBSAMPLES = 32
+
+_BUILDERS: Dict[str, Callable[..., np.ndarray]] = {}
+_DEFAULTS: Dict[str, Tuple[float, ...]] = {}
+
+
+def register_kernel(name: str, defaults: Tuple[float, ...] = ()):
+    """Decorator: registers builder(duration, *params) -> raw weights of length `duration`."""
+    def decorator(builder):
+        _BUILDERS[name] = builder
+        _DEFAULTS[name] = defaults
+        return builder
+    return decorator
+
+
+def available_curves() -> Sequence[str]:
+    return sorted(_BUILDERS)
+
+
+@lru_cache(maxsize=1024)
+def parse_curve(value: str) -> CurveSpec:
+    """'pert:0.3,4' -> ('pert', (0.3, 4.0)). Unknown names and malformed params fall back to linear."""
+    name, _, raw_params = (value or "linear").strip().lower().partition(":")
+    name = name.strip()
+    if name not in _BUILDERS:
+        return ("linear", ())
+    try:
+        params = tuple(float(p) for p in raw_params.split(",") if p.strip())
+    except ValueError:
+        return ("linear", ())
+    defaults = _DEFAULTS[name]
+    # Missing trailing params take their defaults
+    return (name, params + defaults[len(params):])
+
+
+@lru_cache(maxsize=4096)
+def kernel(spec: CurveSpec, duration: int) -> np.ndarray:
+    """Normalized, read-only weight vector of a curve over `duration` months (empty when duration <= 0)."""
+    if duration <= 0:
+        weights = np.zeros(0)
+    else:
+        name, params = spec
+        try:
+            weights = np.asarray(_BUILDERS[name](duration, *params), dtype=float)
+        except (ValueError, ZeroDivisionError, TypeError):
+            weights = np.ones(duration)
+        total = weights.sum()
+        if not np.isfinite(total) or total <= 0 or (weights < 0).any():
+            # Degenerate shape params: behave like the default linear curve
+            weights = np.ones(duration)
+            total = float(duration)
+        weights = weights / total
+    weights.setflags(write=False)
+    return weights
+
+
+def kernel_bank(curves: Sequence[str], durations: np.ndarray):
+    """
+    Concatenates the distinct kernels needed by a set of cost lines.
+    Returns (bank, offsets): line i's weight for month position p is bank[offsets[i] + p].
+    """
+    index: Dict[Tuple[CurveSpec, int], int] = {}
+    kernel_ids = np.empty(len(curves), dtype=np.int64)
+    for i, (curve, duration) in enumerate(zip(curves, durations)):
+        kernel_ids[i] = index.setdefault((parse_curve(curve), int(duration)), len(index))
+
+    kernels = [kernel(spec, duration) for spec, duration in index]
+    starts = np.zeros(len(kernels), dtype=np.int64)
+    if kernels:
+        starts[1:] = np.cumsum([len(k) for k in kernels])[:-1]
+    bank = np.concatenate(kernels) if kernels else np.zeros(0)
+    return bank, starts[kernel_ids]
+
+
+def _beta_weights(duration: int, a: float, b: float) -> np.ndarray:
+    """Monthly mass of a Beta(a, b) density stretched over the duration (midpoint rule, no SciPy)."""
+    if a <= 0 or b <= 0:
+        raise ValueError("beta shape params must be positive")
+    x = (np.arange(duration * _SUBSAMPLES) + 0.5) / (duration * _SUBSAMPLES)
+    density = np.exp((a - 1) * np.log(x) + (b - 1) * np.log1p(-x))
+    return density.reshape(duration, _SUBSAMPLES).sum(axis=1)
+
+
+def _pert_weights(duration: int, mode: float, lam: float) -> np.ndarray:
+    mode = min(max(mode, 0.0), 1.0)
+    return _beta_weights(duration, 1 + lam * mode, 1 + lam * (1 - mode))
+
+
+@register_kernel("linear")
+def _linear(duration: int) -> np.ndarray:
+    return np.ones(duration)
+
+
+@register_kernel("s-curve")
+def _s_curve(duration: int) -> np.ndarray:
+    # Logistic over linspace(-5, 5, duration), differenced (the historical distribute_s_curve shape)
+    y = 1 / (1 + np.exp(-np.linspace(-5, 5, duration)))
+    return np.diff(np.concatenate(([0.0], y)))
+
+
+@register_kernel("single")
+def _single(duration: int) -> np.ndarray:
+    weights = np.zeros(duration)
+    weights[0] = 1.0
+    return weights
+
+
+@register_kernel("front-loaded", defaults=(0.2,))
+def _front_loaded(duration: int, mode: float) -> np.ndarray:
+    return _pert_weights(duration, mode, 4.0)
+
+
+@register_kernel("back-loaded", defaults=(0.8,))
+def _back_loaded(duration: int, mode: float) -> np.ndarray:
+    return _pert_weights(duration, mode, 4.0)
+
+
+@register_kernel("beta", defaults=(2.0, 2.0))
+def _beta(duration: int, a: float, b: float) -> np.ndarray:
+    return _beta_weights(duration, a, b)
+
+
+@register_kernel("pert", defaults=(0.5, 4.0))
+def _pert(duration: int, mode: float, lam: float) -> np.ndarray:
+    return _pert_weights(duration, mode, lam)
+
+
+@register_kernel("retention", defaults=(0.10,))
+def _retention(duration: int, holdback: float) -> np.ndarray:
+    holdback = min(max(holdback, 0.0), 1.0)
+    weights = np.full(duration, (1 - holdback) / duration)
+    weights[-1] += holdback
+    return weights
+
+
+@register_kernel("milestone")
+def _milestone(duration: int, *milestone_weights: float) -> np.ndarray:
+    weights = np.zeros(duration)
+    if not milestone_weights:
+        weights[-1] = 1.0
+        return weights
+    n = len(milestone_weights)
+    # Milestone k of n falls at the end of the k-th equal slice of the duration
+    months = np.ceil(np.arange(1, n + 1) * duration / n).astype(np.int64) - 1
+    np.add.at(weights, np.clip(months, 0, duration - 1), milestone_weights)
+    return weights
@@ -1,7 +1,13 @@
+import time
+import json
 import numpy as np
-import numpy_financial as npf
+from irr_solver import solve_irr, STATUS_NAMES, NO_SIGN_CHANGE
+from distribution_kernels import kernel, kernel_bank, parse_curve
+from absorption_models import absorption_data, cumulative_share, durations as absorption_durations, parse_model
+from scenario_inputs import ColumnTable, FLOAT, INT, OBJECT
 from datetime import datetime, date
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import List, Dict, Optional, Sequence
 import math
 
 class FinancialEngine:
@@ -10,20 +16,20 @@ class FinancialEngine:
     Handles complex cash flow projections and viability metrics.
     """
 
+    # Bump whenever the math changes: cached recalculation results are keyed on it.
+    VERSION = "2026.10.9"
+
     @staticmethod
-    def calculate_absorption(total_units: int, velocity: float, start_month: int) -> List[float]:
-        """Calculates units sold per month based on velocity."""
+    def calculate_absorption(total_units: int, velocity: float, start_month: int, model: str = "linear") -> List[float]:
+        """Calculates units sold per month with an absorption model (closed form, see absorption_models.py)."""
         if total_units <= 0: return []
-        
-        months = math.ceil(total_units / velocity) if velocity > 0 else 0
-        absorption = [0.0] * (start_month + months)
-        
-        remaining = total_units
-        for i in range(start_month, start_month + months):
-            sold = min(remaining, velocity)
-            absorption[i] = sold
-            remaining -= sold
-        return absorption
+
+        data = absorption_data([total_units], [velocity], [None], [None])
+        months = int(absorption_durations([model], data)[0])
+        sold_share = cumulative_share([model], np.arange(months + 1), 0, data)
+        absorption = np.zeros(start_month + months)
+        absorption[start_month:] = total_units * np.diff(sold_share)
+        return absorption.tolist()
 
     @staticmethod
     def distribute_s_curve(total_amount: float, duration_months: int, start_month: int) -> List[float]:
@@ -33,46 +39,1176 @@ class FinancialEngine:
         """
         if duration_months <= 0: return []
         
-        curve = [0.0] * (start_month + duration_months)
-        x = np.linspace(-5, 5, duration_months)
-        y = 1 / (1 + np.exp(-x)) # Logistic function
-        
-        # Calculate monthly deltas
-        y_shifted = np.concatenate(([0], y))
-        deltas = np.diff(y_shifted)
-        # Normalize to ensure total_amount is exact
-        normalized_deltas = deltas / np.sum(deltas)
-        
-        for i, val in enumerate(normalized_deltas):
-            curve[start_month + i] = float(val * total_amount)
-            
-        return curve
-
-    @staticmethod
-    def calculate_metrics(cash_flow: List[float]) -> Dict:
-        """Calculates IRR, NPV, and ROI."""
-        if not cash_flow:
-            return {"irr": 0, "npv": 0, "roi": 0}
-            
-        try:
-            irr = npf.irr(cash_flow)
-            # Default to 0 if IRR is NaN or string "NaN"
-            irr = 0 if np.isnan(irr) else irr
-            
-            # Using 10% as default discount rate for NPV
-            npv = npf.npv(0.1 / 12, cash_flow) 
-            
-            total_invested = abs(sum([x for x in cash_flow if x < 0]))
-            total_returned = sum([x for x in cash_flow if x > 0])
-            roi = (total_returned / total_invested) if total_invested > 0 else 0
-            
-            return {
-                "irr": float(irr * 12), # Annualized
+        curve = np.zeros(start_month + duration_months)
+        # Memoized, normalized shape (see distribution_kernels.py) applied in one multiply
+        curve[start_month:] = kernel(parse_curve('s-curve'), duration_months) * total_amount
+        return curve.tolist()
+
+    @staticmethod
+    def _segments(starts: np.ndarray, lengths: np.ndarray):
+        """
+        Expands (start, length) segments into flat month indexes plus the position inside each segment.
+        Returns (row, month, position) arrays ready for np.bincount scatter-adds.
+        """
+        total = int(lengths.sum())
+        row = np.repeat(np.arange(len(lengths)), lengths)
+        seg_begin = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        position = np.arange(total) - seg_begin
+        return row, starts[row] + position, position
+
+    @staticmethod
+    def _column(rows: Sequence[Dict], name: str, default: float = 0.0) -> np.ndarray:
+        """float(row.get(name) or default) of every row; ColumnTables (scenario_inputs.py) are read whole."""
+        if isinstance(rows, ColumnTable):
+            return rows.column(name, default)
+        return np.array([float(r.get(name) or default) for r in rows], dtype=float)
+
+    @staticmethod
+    def _present(rows: Sequence[Dict], name: str) -> np.ndarray:
+        """row.get(name) is not None of every row."""
+        if isinstance(rows, ColumnTable):
+            return rows.present(name)
+        return np.array([r.get(name) is not None for r in rows], dtype=bool)
+
+    @staticmethod
+    def _values(rows: Sequence[Dict], name: str) -> Sequence:
+        """row.get(name) of every row."""
+        if isinstance(rows, ColumnTable):
+            return rows.values(name)
+        return [r.get(name) for r in rows]
+
+    @classmethod
+    def _unit_arrays(cls, units: Sequence[Dict]):
+        """
+        units_mix rows -> (count, velocity, start, price) arrays.
+        A row dated with sale_date (sale_month, see scheduled_units) sells all its units in that month;
+        a row anchored to a schedule phase starts selling sales_start_month_offset months into it.
+        """
+        count = cls._column(units, 'unit_count')
+        dated = cls._present(units, 'sale_month')
+        velocity = cls._column(units, 'sales_velocity_per_month', 1.0)
+        velocity[dated] = count[dated]
+        lag = np.maximum(cls._column(units, 'sales_start_month_offset').astype(np.int64), 0)
+        anchor = cls._column(units, 'anchor_start').astype(np.int64)
+        sale_month = cls._column(units, 'sale_month').astype(np.int64)
+        start = np.where(dated, sale_month, anchor + lag)
+        price = cls._column(units, 'avg_price')
+        return count, velocity, start, price
+
+    @classmethod
+    def _absorption(cls, units: Sequence[Dict], count: np.ndarray, velocity: np.ndarray):
+        """
+        absorption_model specs, model inputs and months of selling of units_mix rows.
+        Dated rows (and manual rows without a curve) sell linearly.
+        """
+        curves = cls._values(units, 'absorption_curve')
+        models = [
+            "linear" if dated or (parse_model(model)[0] == "manual" and not curve) else model or "linear"
+            for model, curve, dated in zip(cls._values(units, 'absorption_model'), curves, cls._present(units, 'sale_month'))
+        ]
+        data = absorption_data(count, velocity, cls._values(units, 'absorption_rate'), curves)
+        return models, data, absorption_durations(models, data)
+
+    @classmethod
+    def _sales(cls, units: Sequence[Dict]):
+        """
+        Units sold per (row, month) for every unit type in one pass:
+        (start, price, sell_months, row, month, sold) with row / month / sold flat over all selling months.
+        """
+        count, velocity, start, price = cls._unit_arrays(units)
+        models, data, sell_months = cls._absorption(units, count, velocity)
+        row, month, position = cls._segments(start, sell_months)
+        sold = count[row] * (
+            cumulative_share(models, position + 1, row, data) - cumulative_share(models, position, row, data)
+        )
+        return start, price, sell_months, row, month, sold
+
+    @classmethod
+    def _cost_arrays(cls, costs: Sequence[Dict]):
+        """
+        cost_line_items rows -> (total, duration, start) arrays plus the distribution_curve values.
+        A line anchored to a schedule phase starts start_month_offset months into it and, without its
+        own duration_months, runs to the end of the phase.
+        """
+        total = cls._column(costs, 'total_estimated')
+        lag = np.maximum(cls._column(costs, 'start_month_offset').astype(np.int64), 0)
+        anchor = cls._column(costs, 'anchor_start').astype(np.int64)
+        spans_phase = cls._present(costs, 'anchor_months') & ~cls._present(costs, 'duration_months')
+        duration = cls._column(costs, 'duration_months', 1).astype(np.int64)
+        phase_months = cls._column(costs, 'anchor_months').astype(np.int64)
+        duration[spans_phase] = np.maximum(phase_months[spans_phase] - lag[spans_phase], 1)
+        curves = [curve or 'linear' for curve in cls._values(costs, 'distribution_curve')]
+        return total, np.maximum(duration, 0), anchor + lag, curves
+
+    # Macro schedule (financial_scenarios, migration 26): phase -> (start offset column, months column).
+    # Offsets count from study_date. pre_construction / construction / closeout run back to back from
+    # month 0 and land is the month of land_purchase_date. Cost lines and unit types with a
+    # schedule_phase are timed from their phase, so a schedule edit re-times all of them at once.
+    SCHEDULE_PHASES = {
+        "incorp_dd": ("incorp_dd_start_offset", "incorp_dd_months"),
+        "incorp_projects": ("incorp_projects_start_offset", "incorp_projects_months"),
+        "incorp_permits": ("incorp_permits_start_offset", "incorp_permits_months"),
+        "incorp_closing": ("incorp_closing_start_offset", "incorp_closing_months"),
+        "financing": ("financing_start_offset", "financing_months"),
+        "construction_pre": ("construction_pre_start_offset", "construction_pre_months"),
+        "construction_main": ("construction_main_start_offset", "construction_main_months"),
+        "sales": ("sales_start_offset", "sales_duration_months"),
+        "delivery": ("delivery_start_offset", "delivery_months"),
+    }
+    SCHEDULE_STAGES = ("pre_construction_months", "construction_months", "closeout_months")
+    SCHEDULE_PHASE_NAMES = ("land", "pre_construction", "construction", "closeout") + tuple(SCHEDULE_PHASES)
+
+    @staticmethod
+    def _months_between(start: date, end: date) -> int:
+        return (end.year - start.year) * 12 + end.month - start.month
+
+    @staticmethod
+    def _json_column(value):
+        return json.loads(value) if isinstance(value, str) else value
+
+    @classmethod
+    def schedule_key(cls, scenario: Optional[Dict]) -> tuple:
+        """Every financial_scenarios value the compiled schedule (and so the scheduled rows) depends on, as a hashable tuple."""
+        scenario = scenario or {}
+        structure = cls._json_column(scenario.get('deposit_structure'))
+        curve = cls._json_column(scenario.get('manual_absorption_curve'))
+        rate = scenario.get('absorption_rate_monthly')
+        base_date = scenario.get('base_date') or datetime.now().date()
+        columns = cls.SCHEDULE_STAGES + tuple(column for pair in cls.SCHEDULE_PHASES.values() for column in pair)
+        return (
+            base_date,
+            scenario.get('study_date') or base_date,
+            scenario.get('land_purchase_date'),
+            tuple(scenario.get(column) for column in columns),
+            json.dumps(structure, sort_keys=True) if structure else None,
+            (
+                scenario.get('absorption_model'),
+                tuple(float(v or 0) for v in curve) if curve else None,
+                float(rate) if rate is not None else None
+            )
+        )
+
+    @classmethod
+    def compile_schedule(cls, scenario: Optional[Dict]) -> Dict:
+        """
+        Resolves the scenario's phase columns into report months (month 0 = base_date).
+        Returns the phase names, start / months arrays, a dense (phases x months) boolean mask,
+        the horizon, the payment_terms and the absorption defaults. Memoized on schedule_key;
+        the result is read-only.
+        """
+        return cls._compile_schedule(cls.schedule_key(scenario))
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _compile_schedule(cls, key: tuple) -> Dict:
+        base_date, study_date, land_purchase_date, values, structure, (absorption_model, curve, rate) = key
+        columns = cls.SCHEDULE_STAGES + tuple(column for pair in cls.SCHEDULE_PHASES.values() for column in pair)
+        value = dict(zip(columns, values))
+        shift = cls._months_between(base_date, study_date)
+
+        pre, build, closeout = (max(int(value[column] or 0), 0) for column in cls.SCHEDULE_STAGES)
+        land = cls._months_between(study_date, land_purchase_date) if land_purchase_date else 0
+        offsets = [land, 0, pre, pre + build]
+        months = [1, pre, build, closeout]
+        for start_column, months_column in cls.SCHEDULE_PHASES.values():
+            offsets.append(int(value[start_column] or 0))
+            months.append(max(int(value[months_column] or 0), 0))
+
+        start = np.maximum(np.array(offsets, dtype=np.int64) + shift, 0)
+        months = np.array(months, dtype=np.int64)
+        horizon = int((start + months).max(initial=1))
+        t = np.arange(horizon)
+        mask = (t[None, :] >= start[:, None]) & (t[None, :] < (start + months)[:, None])
+        for array in (start, months, mask):
+            array.setflags(write=False)
+
+        index = {name: i for i, name in enumerate(cls.SCHEDULE_PHASE_NAMES)}
+        delivery = index["delivery"]
+        has_delivery = value["delivery_start_offset"] is not None
+        return {
+            "phases": cls.SCHEDULE_PHASE_NAMES,
+            "index": index,
+            "start": start,
+            "months": months,
+            "mask": mask,
+            "horizon": horizon,
+            "payment_terms": cls.payment_terms(
+                json.loads(structure) if structure else None,
+                int(start[delivery]) if has_delivery else None,
+                int(months[delivery])
+            ),
+            # Scenario-level absorption defaults (see absorption_models.py)
+            "absorption": {"model": absorption_model or "linear", "curve": curve, "rate": rate}
+        }
+
+    @staticmethod
+    def payment_terms(structure: Optional[Dict], delivery_start: Optional[int], delivery_months: int) -> Optional[Dict]:
+        """
+        deposit_structure (percentages) and the delivery window -> collection shares.
+        None when there is no usable structure: sales are then collected in full when sold.
+        """
+        if not structure:
+            return None
+        shares = [max(float(structure.get(key) or 0), 0.0) for key in ("initial_deposit", "second_deposit", "closing_funding")]
+        total = sum(shares)
+        if total <= 0:
+            return None
+        return {
+            "deposit": shares[0] / total,
+            "installments": shares[1] / total,
+            "closing": shares[2] / total,
+            "delivery_start": delivery_start,
+            "delivery_months": max(delivery_months, 1)
+        }
+
+    @staticmethod
+    def _anchored(row: Dict, schedule: Dict) -> Dict:
+        """Copy of a row with the start / length of its schedule_phase (unknown phases are ignored)."""
+        row = dict(row)
+        phase = schedule['index'].get(row.get('schedule_phase'))
+        if phase is not None:
+            row['anchor_start'] = int(schedule['start'][phase])
+            row['anchor_months'] = int(schedule['months'][phase])
+        return row
+
+    @staticmethod
+    def _anchor_columns(table: ColumnTable, schedule: Dict) -> Dict[str, tuple]:
+        """_anchored for a whole ColumnTable: anchor_start / anchor_months columns (NULL when unanchored)."""
+        phases = [schedule['index'].get(phase) for phase in table.values('schedule_phase')]
+        return {
+            "anchor_start": (INT, [schedule['start'][i] if i is not None else None for i in phases]),
+            "anchor_months": (INT, [schedule['months'][i] if i is not None else None for i in phases])
+        }
+
+    @classmethod
+    def scheduled_units(cls, units: Sequence[Dict], scenario: Optional[Dict]) -> List[Dict]:
+        """
+        Copies of a scenario's units_mix rows carrying what the engine needs from the scenario:
+        its payment_terms and absorption defaults, the anchor of their schedule_phase, and
+        sale_month (months from base_date) for rows with a sale_date.
+        A ColumnTable comes back as a ColumnTable with those columns added.
+        """
+        schedule = cls.compile_schedule(scenario)
+        absorption = schedule['absorption']
+        base_date = cls.schedule_key(scenario)[0]
+        if isinstance(units, ColumnTable):
+            n = len(units)
+            return units.with_columns({
+                **cls._anchor_columns(units, schedule),
+                "payment_terms": (OBJECT, (schedule['payment_terms'],) * n),
+                "absorption_model": (OBJECT, [model or absorption['model'] for model in units.values('absorption_model')]),
+                "absorption_curve": (OBJECT, (absorption['curve'],) * n),
+                "absorption_rate": (FLOAT, [absorption['rate']] * n),
+                "sale_month": (INT, [
+                    max(cls._months_between(base_date, sale_date), 0) if sale_date is not None else None
+                    for sale_date in units.values('sale_date')
+                ])
+            })
+        rows = []
+        for unit in units:
+            row = cls._anchored(unit, schedule)
+            row['payment_terms'] = schedule['payment_terms']
+            row['absorption_model'] = row.get('absorption_model') or absorption['model']
+            row['absorption_curve'] = absorption['curve']
+            row['absorption_rate'] = absorption['rate']
+            sale_date = row.get('sale_date')
+            if sale_date is not None:
+                row['sale_month'] = max(cls._months_between(base_date, sale_date), 0)
+            rows.append(row)
+        return rows
+
+    @classmethod
+    def scheduled_costs(cls, costs: Sequence[Dict], scenario: Optional[Dict]) -> List[Dict]:
+        """Copies of a scenario's cost_line_items rows carrying the anchor of their schedule_phase."""
+        schedule = cls.compile_schedule(scenario)
+        if isinstance(costs, ColumnTable):
+            return costs.with_columns(cls._anchor_columns(costs, schedule))
+        return [cls._anchored(cost, schedule) for cost in costs]
+
+    @classmethod
+    def _payment_arrays(cls, units: Sequence[Dict]):
+        """payment_terms of units_mix rows -> (deposit, installments, closing, delivery_start, delivery_end) arrays."""
+        terms = [t or {} for t in cls._values(units, 'payment_terms')]
+        deposit = np.array([t.get('deposit', 1.0) for t in terms], dtype=float)
+        installments = np.array([t.get('installments', 0.0) for t in terms], dtype=float)
+        closing = np.array([t.get('closing', 0.0) for t in terms], dtype=float)
+        dated = [t.get('delivery_start') is not None for t in terms]
+        delivery_start = np.array([t['delivery_start'] if d else 0 for t, d in zip(terms, dated)], dtype=np.int64)
+        delivery_end = delivery_start + np.array([t['delivery_months'] if d else 0 for t, d in zip(terms, dated)], dtype=np.int64)
+        return deposit, installments, closing, delivery_start, delivery_end
+
+    @classmethod
+    def _collections(cls, units: Sequence[Dict], row: np.ndarray, month: np.ndarray, amount: np.ndarray):
+        """
+        Spreads sales (unit row, sale month, value) over the months the cash comes in: the deposit in
+        the sale month, the second deposit in monthly installments until delivery and the closing across
+        the delivery window (in the sale month itself once delivery has started; installments with no
+        month left are paid at closing). Rows without payment terms collect everything when sold.
+        The kernel depends on the sale month only through the delivery window, so every tranche of every
+        sale is expanded with one _segments call.
+        Returns (source, month, amount) arrays; `source` indexes the input sales.
+        """
+        deposit, installments, closing, delivery_start, delivery_end = cls._payment_arrays(units)
+        close_first = np.maximum(month, delivery_start[row])
+        close_months = np.maximum(month, delivery_end[row] - 1) - close_first + 1
+        install_months = np.maximum(close_first - month - 1, 0)
+        install_share = np.where(install_months > 0, installments[row], 0.0)
+        close_share = closing[row] + installments[row] - install_share
+
+        starts = np.concatenate((month, month + 1, close_first))
+        lengths = np.concatenate((
+            np.where(deposit[row] > 0, 1, 0),
+            np.where(install_share > 0, install_months, 0),
+            np.where(close_share > 0, close_months, 0)
+        )).astype(np.int64)
+        per_month = np.concatenate((
+            amount * deposit[row],
+            amount * install_share / np.maximum(install_months, 1),
+            amount * close_share / close_months
+        ))
+        tranche, collect_month, _ = cls._segments(starts, lengths)
+        return np.tile(np.arange(len(month)), 3)[tranche], collect_month, per_month[tranche]
+
+    @classmethod
+    def build_cash_flow(
+        cls, units: Sequence[Dict], costs: Sequence[Dict], timings: Optional[Dict[str, float]] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Vectorized cash flow assembly for a whole scenario.
+        Takes every units_mix and cost_line_items row at once and scatter-adds absorption income
+        and distributed costs into dense monthly arrays (income, costs, net_flow).
+        """
+        batch = cls.build_cash_flow_batch(
+            units, costs,
+            np.zeros(len(units), dtype=np.int64),
+            np.zeros(len(costs), dtype=np.int64),
+            1,
+            timings
+        )
+        months = int(batch['months'][0])
+        return {key: batch[key][0, :months] for key in ("income", "costs", "net_flow")}
+
+    @classmethod
+    def build_cash_flow_batch(
+        cls,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        unit_group: np.ndarray,
+        cost_group: np.ndarray,
+        n_groups: int,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Portfolio version of build_cash_flow.
+        Rows from many scenarios are tagged with their group index and scattered into
+        (n_groups x horizon) matrices in a single pass. `months` holds each group's own horizon;
+        cells beyond it are zero.
+        When a `timings` dict is given, the seconds spent in each step are stored in it.
+        """
+        clock = time.perf_counter()
+        unit_group = np.asarray(unit_group, dtype=np.int64)
+        cost_group = np.asarray(cost_group, dtype=np.int64)
+
+        # 1. Income: every unit type's absorption model evaluated in closed form in one pass
+        u_start, price, sell_months, u_row, u_month, sold = cls._sales(units)
+        if timings is not None:
+            timings["absorption"], clock = time.perf_counter() - clock, time.perf_counter()
+
+        # Each month's sales value, collected as deposit / installments / closing
+        source, p_month, received = cls._collections(units, u_row, u_month, sold * price[u_row])
+        p_row = u_row[source]
+        if timings is not None:
+            timings["collections"], clock = time.perf_counter() - clock, time.perf_counter()
+
+        # 2. Costs: every line's distribution kernel gathered from one bank of distinct shapes
+        total, duration, c_start, curves = cls._cost_arrays(costs)
+        c_row, c_month, c_pos = cls._segments(c_start, duration)
+        bank, offsets = kernel_bank(curves, duration)
+        weights = bank[offsets[c_row] + c_pos]
+        if timings is not None:
+            timings["cost_distribution"], clock = time.perf_counter() - clock, time.perf_counter()
+
+        # 3. Dense (group x month) matrices over the widest horizon
+        months = np.ones(n_groups, dtype=np.int64)
+        np.maximum.at(months, unit_group, u_start + sell_months)
+        np.maximum.at(months, unit_group[p_row], p_month + 1)
+        np.maximum.at(months, cost_group, c_start + duration)
+        horizon = int(months.max()) if n_groups else 1
+        size = n_groups * horizon
+
+        income = np.bincount(
+            unit_group[p_row] * horizon + p_month, weights=received, minlength=size
+        ).reshape(n_groups, horizon)
+        cost_flow = np.bincount(
+            cost_group[c_row] * horizon + c_month, weights=weights * total[c_row], minlength=size
+        ).reshape(n_groups, horizon)
+        if timings is not None:
+            timings["cash_flow_assembly"] = time.perf_counter() - clock
+
+        return {
+            "income": income,
+            "costs": cost_flow,
+            "net_flow": income - cost_flow,
+            "months": months
+        }
+
+    @classmethod
+    def recalculate(cls, units: Sequence[Dict], costs: Sequence[Dict], financing: Optional[Dict] = None) -> Dict:
+        """
+        Pure numeric pipeline for one scenario: cash flow arrays plus (unlevered) metrics,
+        and levered metrics / loan stats when financing assumptions exist.
+        Self-contained (no I/O) so it can be shipped to a worker process.
+        `timings` reports seconds per step, measured where the work actually runs.
+        """
+        timings = {}
+        flow = cls.build_cash_flow(units, costs, timings)
+        clock = time.perf_counter()
+        flow["metrics"] = cls.calculate_metrics(flow["net_flow"])
+        timings["metrics"], clock = time.perf_counter() - clock, time.perf_counter()
+        flow["financing"] = cls.financing_summary(flow["income"], flow["costs"], financing)
+        timings["financing"] = time.perf_counter() - clock
+        flow["timings"] = timings
+        return flow
+
+    @classmethod
+    def recalculate_batch(
+        cls,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        unit_group: np.ndarray,
+        cost_group: np.ndarray,
+        n_groups: int,
+        financings: Optional[Sequence[Optional[Dict]]] = None
+    ) -> Dict:
+        """Pure numeric pipeline for a portfolio: batched cash flows plus per-scenario metrics."""
+        flows = cls.build_cash_flow_batch(units, costs, unit_group, cost_group, n_groups)
+        # Zero padding past a scenario's horizon changes none of the metrics, so one solve covers all
+        flows["metrics"] = cls._metric_dicts(cls.batch_metrics(flows["net_flow"]))
+        financings = financings or [None] * n_groups
+        flows["financing"] = [
+            cls.financing_summary(flows["income"][group, :int(months)], flows["costs"][group, :int(months)], financing)
+            for group, (months, financing) in enumerate(zip(flows["months"], financings))
+        ]
+        return flows
+
+    @staticmethod
+    def _metric_dicts(batch: Dict[str, np.ndarray]) -> List[Dict]:
+        """batch_metrics arrays -> one calculate_metrics-style dict per flow."""
+        return [
+            {
+                "irr": float(irr) if np.isfinite(irr) else 0.0,
                 "npv": float(npv),
-                "roi": float(roi)
+                "roi": float(roi),
+                "irr_status": STATUS_NAMES[int(status)]
             }
-        except:
-            return {"irr": 0, "npv": 0, "roi": 0}
+            for irr, npv, roi, status in zip(batch['irr'], batch['npv'], batch['roi'], batch['irr_status'])
+        ]
+
+    # Unit mix variants (see the Unit Mix scenarios tab): the optimistic / pessimistic scenario's
+    # variation_percent moves every unit type's price, units_mix.<variant>_variation overrides it per
+    # unit type (NULL = use the scenario's). Prices are multiplied by 1 + percent / 100.
+    PRICE_VARIANTS = ("base", "optimistic", "pessimistic")
+
+    @classmethod
+    def variant_price_factors(cls, units: Sequence[Dict], variation_percent: Dict[str, float]) -> np.ndarray:
+        """(PRICE_VARIANTS x unit rows) price multipliers; the base row is all ones."""
+        factors = np.ones((len(cls.PRICE_VARIANTS), len(units)))
+        for v, variant in enumerate(cls.PRICE_VARIANTS):
+            if variant == "base":
+                continue
+            default = float(variation_percent.get(variant) or 0)
+            overrides = cls._values(units, f"{variant}_variation")
+            factors[v] = 1 + np.array([default if o is None else float(o) for o in overrides], dtype=float) / 100
+        return factors
+
+    @classmethod
+    def compare_variants(
+        cls, units: Sequence[Dict], costs: Sequence[Dict], price_factors: np.ndarray, financing: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Cash flows and metrics of price variants of one scenario, stacked (variants x months).
+        Income is linear in each unit type's price, so the per-row income matrix is built once and
+        every variant is one row of price_factors @ income; costs are shared.
+        """
+        horizon = cls.horizon(units, costs)
+        rows = cls.line_item_flows(units, costs, horizon)
+        income = np.asarray(price_factors, dtype=float) @ rows['units']
+        spend = np.broadcast_to(rows['costs'].sum(axis=0), income.shape)
+        net_flow = income - spend
+        return {
+            "income": income,
+            "costs": spend,
+            "net_flow": net_flow,
+            "months": horizon,
+            "metrics": cls._metric_dicts(cls.batch_metrics(net_flow)),
+            "financing": [cls.financing_summary(income[v], spend[v], financing) for v in range(len(income))]
+        }
+
+    @classmethod
+    def row_contributions(cls, units: Sequence[Dict], costs: Sequence[Dict]) -> Dict[str, List[np.ndarray]]:
+        """
+        Per-row monthly contribution vectors (income per unit type, spend per cost line).
+        Each row is its own group in build_cash_flow_batch, trimmed to the row's own horizon.
+        """
+        unit_flows = cls.build_cash_flow_batch(units, [], np.arange(len(units)), [], len(units))
+        cost_flows = cls.build_cash_flow_batch([], costs, [], np.arange(len(costs)), len(costs))
+        return {
+            "units": [unit_flows['income'][i, :m] for i, m in enumerate(unit_flows['months'])],
+            "costs": [cost_flows['costs'][i, :m] for i, m in enumerate(cost_flows['months'])]
+        }
+
+    @classmethod
+    def absorption_profiles(cls, units: Sequence[Dict], models: Sequence[Optional[str]]) -> Dict[str, np.ndarray]:
+        """
+        Units sold per month of the whole unit mix under each absorption model (None keeps every
+        row's own model). All (model, unit type) pairs are rows of one closed-form evaluation.
+        """
+        rows = [dict(u, absorption_model=model or u.get('absorption_model')) for model in models for u in units]
+        start, _, sell_months, row, month, sold = cls._sales(rows)
+        horizon = int((start + sell_months).max(initial=1))
+        profile = row // max(len(units), 1)
+        matrix = np.bincount(profile * horizon + month, weights=sold, minlength=len(models) * horizon)
+        return {"sold": matrix.reshape(len(models), horizon), "months": horizon}
+
+    @staticmethod
+    def exposure_summary(income: np.ndarray, costs: np.ndarray, net_flow: np.ndarray) -> Dict:
+        """GDV, total costs, peak equity (deepest cumulative deficit) and months to break-even of one flow."""
+        cumulative = np.cumsum(np.asarray(net_flow, dtype=float))
+        negative = np.nonzero(cumulative < 0)[0]
+        if len(negative) == 0:
+            break_even = 0
+        elif negative[-1] == len(cumulative) - 1:
+            break_even = None  # still under water at the end of the horizon
+        else:
+            break_even = int(negative[-1]) + 1
+        return {
+            "total_gdv": float(np.sum(income)),
+            "total_costs": float(np.sum(costs)),
+            "peak_equity": float(max(-cumulative.min(), 0.0)) if len(cumulative) else 0.0,
+            "break_even_month": break_even,
+            "months": len(cumulative)
+        }
+
+    @staticmethod
+    def month_date(base_date: date, offset: int) -> date:
+        """First day of the calendar month `offset` months after base_date's month (report row label)."""
+        months = base_date.year * 12 + base_date.month - 1 + offset
+        return date(months // 12, months % 12 + 1, 1)
+
+    @classmethod
+    def horizon(cls, units: Sequence[Dict], costs: Sequence[Dict]) -> int:
+        """Number of months build_cash_flow would produce, without building the monthly matrices."""
+        u_start, _, sell_months, u_row, u_month, _ = cls._sales(units)
+        _, p_month, _ = cls._collections(units, u_row, u_month, np.zeros(len(u_row)))
+        _, duration, c_start, _ = cls._cost_arrays(costs)
+        return int(max(
+            (u_start + sell_months).max(initial=1), (p_month + 1).max(initial=1), (c_start + duration).max(initial=1)
+        ))
+
+    @classmethod
+    def line_item_flows(cls, units: Sequence[Dict], costs: Sequence[Dict], horizon: int) -> Dict[str, np.ndarray]:
+        """
+        Same per-row vectors as row_contributions, as dense (rows x horizon) matrices.
+        Used to stream ledgers chunk by chunk with a fixed month axis.
+        """
+        unit_flows = cls.build_cash_flow_batch(units, [], np.arange(len(units)), [], len(units))['income']
+        cost_flows = cls.build_cash_flow_batch([], costs, [], np.arange(len(costs)), len(costs))['costs']
+        result = {}
+        for key, matrix in (("units", unit_flows), ("costs", cost_flows)):
+            padded = np.zeros((matrix.shape[0], horizon))
+            width = min(matrix.shape[1], horizon)
+            padded[:, :width] = matrix[:, :width]
+            result[key] = padded
+        return result
+
+    @classmethod
+    def calculate_metrics(cls, cash_flow: List[float], irr_guess: Optional[float] = None) -> Dict:
+        """
+        Calculates IRR, NPV, and ROI.
+        irr stays 0 when the flow has no IRR, but irr_status says why instead of hiding it.
+        """
+        if len(cash_flow) == 0:
+            return {"irr": 0, "npv": 0, "roi": 0, "irr_status": STATUS_NAMES[NO_SIGN_CHANGE]}
+
+        batch = cls.batch_metrics(np.asarray(cash_flow, dtype=float)[None, :], irr_guess=irr_guess)
+        irr = batch['irr'][0]
+        return {
+            "irr": float(irr) if np.isfinite(irr) else 0.0,  # Annualized
+            "npv": float(batch['npv'][0]),
+            "roi": float(batch['roi'][0]),
+            "irr_status": STATUS_NAMES[int(batch['irr_status'][0])]
+        }
+
+    @staticmethod
+    def batch_metrics(
+        flows: np.ndarray,
+        discount_rate: float = 0.1,
+        irr_guess: Optional[np.ndarray] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        IRR, NPV and ROI for a whole (paths x months) matrix of cash flows at once.
+        IRR comes from irr_solver.solve_irr (annualized as monthly * 12); `irr_guess` is an
+        annualized warm start. Rows without a solution get NaN and a non-zero irr_status.
+        """
+        flows = np.atleast_2d(np.asarray(flows, dtype=float))
+        t = np.arange(flows.shape[1])
+
+        # Using 10% as default discount rate for NPV
+        npv = flows @ (1 + discount_rate / 12) ** -t
+        invested = -np.where(flows < 0, flows, 0).sum(axis=1)
+        returned = np.where(flows > 0, flows, 0).sum(axis=1)
+        roi = np.divide(returned, invested, out=np.zeros_like(returned), where=invested > 0)
+
+        guess = None if irr_guess is None else np.asarray(irr_guess, dtype=float) / 12
+        solved = solve_irr(flows, guess=guess)
+
+        return {
+            "irr": solved['rate'] * 12,
+            "npv": npv,
+            "roi": roi,
+            "irr_status": solved['status']
+        }
+
+    @staticmethod
+    def financing_terms(financing: Optional[Dict]) -> Optional[Dict]:
+        """financing_assumptions row (percent columns) -> decimal terms, or None when unlevered."""
+        if not financing:
+            return None
+        return {
+            "ltc": float(financing.get('loan_to_cost_ratio') or 0) / 100,
+            "rate_annual": float(financing.get('interest_rate_annual') or 0) / 100,
+            "origination_fee": float(financing.get('origination_fee') or 0) / 100,
+            "repayment_trigger": financing.get('repayment_start_trigger') or 'first_sale'
+        }
+
+    @staticmethod
+    def apply_financing(
+        income: np.ndarray,
+        costs: np.ndarray,
+        terms: Dict,
+        tol: float = 0.01,
+        max_iter: int = 100
+    ) -> Dict[str, np.ndarray]:
+        """
+        Construction loan with capitalized interest, for one flow or a (K x months) stack.
+        Equity funds costs first up to (1 - LTC) of total uses, then the loan draws; the origination
+        fee and all interest are capitalized. From the repayment trigger on, sales proceeds sweep the
+        balance and any remainder is repaid from equity in the last month.
+
+        Interest depends on the balance, which depends on interest (and LTC sizing on total interest),
+        so the interest vector is solved by fixed-point iteration. Each pass is pure array math: the
+        balance under a sweep is a Lindley recursion, B = S - min(0, running_min(S)) with S = cumsum(flows).
+        """
+        income = np.atleast_2d(np.asarray(income, dtype=float))
+        costs = np.atleast_2d(np.asarray(costs, dtype=float))
+        n_rows, horizon = costs.shape
+        t = np.arange(horizon)
+        rate = terms['rate_annual'] / 12
+        ltc = min(max(terms['ltc'], 0.0), 1.0)
+
+        # Sweep starts at the trigger month (per row)
+        if terms['repayment_trigger'] == 'completion':
+            last_cost = horizon - 1 - np.argmax((costs > 0)[:, ::-1], axis=1)
+            trigger = np.where((costs > 0).any(axis=1), last_cost + 1, 0)
+        elif terms['repayment_trigger'] == 'maturity':
+            trigger = np.full(n_rows, horizon - 1)
+        else:  # first_sale
+            trigger = np.where((income > 0).any(axis=1), np.argmax(income > 0, axis=1), horizon - 1)
+        sweep = np.where(t[None, :] >= trigger[:, None], income, 0.0)
+
+        total_costs = costs.sum(axis=1)
+        cumulative_costs = np.cumsum(costs, axis=1)
+        interest = np.zeros((n_rows, horizon))
+        converged = False
+        iterations = 0
+
+        for iterations in range(1, max_iter + 1):
+            # Size the loan on total uses (costs + fee + interest); fee = pct of commitment
+            total_interest = interest.sum(axis=1)
+            commitment = ltc * (total_costs + total_interest) / (1 - ltc * terms['origination_fee'])
+            fee = terms['origination_fee'] * commitment
+            equity = np.maximum(total_costs + fee + total_interest - commitment, 0.0)
+
+            cost_draws = np.diff(np.maximum(cumulative_costs - equity[:, None], 0.0), axis=1, prepend=0.0)
+            first_draw = np.argmax(cost_draws > 0, axis=1)
+            fee_flow = np.zeros((n_rows, horizon))
+            fee_flow[np.arange(n_rows), first_draw] = np.where(cost_draws.any(axis=1), fee, 0.0)
+
+            # Balance after each month's draws, capitalized interest and sweep (floored at zero)
+            walk = np.cumsum(cost_draws + fee_flow + interest - sweep, axis=1)
+            balance = walk - np.minimum(np.minimum.accumulate(walk, axis=1), 0.0)
+
+            new_interest = np.zeros_like(interest)
+            new_interest[:, 1:] = rate * balance[:, :-1]
+            change = np.abs(new_interest - interest).max() if interest.size else 0.0
+            interest = new_interest
+            if change <= tol:
+                converged = True
+                break
+
+        # Recompute the balance with the converged interest
+        walk = np.cumsum(cost_draws + fee_flow + interest - sweep, axis=1)
+        balance = walk - np.minimum(np.minimum.accumulate(walk, axis=1), 0.0)
+        previous = np.concatenate((np.zeros((n_rows, 1)), balance[:, :-1]), axis=1)
+        repayment = previous + cost_draws + fee_flow + interest - balance
+        repayment[:, -1] += balance[:, -1]  # balloon from equity at the end of the horizon
+        balance[:, -1] = 0.0
+
+        # Equity view: pays the costs the loan does not, receives proceeds net of debt service
+        levered = income - repayment - (costs - cost_draws)
+        return {
+            "levered_net_flow": levered,
+            "draws": cost_draws + fee_flow + interest,
+            "interest": interest,
+            "repayment": repayment,
+            "balance": balance,
+            "commitment": commitment,
+            "origination_fee": fee,
+            "equity_required": equity,
+            "converged": converged,
+            "iterations": iterations
+        }
+
+    @classmethod
+    def financing_summary(cls, income: np.ndarray, costs: np.ndarray, financing: Optional[Dict]) -> Optional[Dict]:
+        """Levered metrics and loan stats for one scenario (None when it has no financing assumptions)."""
+        terms = cls.financing_terms(financing)
+        if terms is None:
+            return None
+        loan = cls.apply_financing(income, costs, terms)
+        balance = loan['balance'][0]
+        return {
+            "levered_metrics": cls.calculate_metrics(loan['levered_net_flow'][0]),
+            "loan_commitment": float(loan['commitment'][0]),
+            "origination_fee": float(loan['origination_fee'][0]),
+            "total_interest": float(loan['interest'][0].sum()),
+            "peak_balance": float(balance.max()) if len(balance) else 0.0,
+            "equity_required": float(loan['equity_required'][0]),
+            "converged": bool(loan['converged']),
+            "iterations": int(loan['iterations'])
+        }
+
+    # Default uncertainty model for simulate(): relative std-devs and mean schedule slip
+    SIMULATION_DEFAULTS = {
+        "velocity_sigma": 0.20,       # lognormal spread of sales velocity
+        "price_sigma": 0.08,          # normal spread of avg_price
+        "cost_overrun_mean": 0.05,    # expected overrun over budget
+        "cost_overrun_sigma": 0.10,
+        "slip_mean_months": 2.0,      # Poisson mean delay of the sales start
+        "discount_rate": 0.10
+    }
+
+    @classmethod
+    def simulate_paths(
+        cls,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        n_paths: int,
+        seed=None,
+        params: Optional[Dict] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        One chunk of the Monte Carlo: samples n_paths market/cost/schedule draws and builds every
+        cash flow path as a single (paths x months) matrix.
+        Absorption follows each unit type's model in closed form (see perturbed_flows).
+        """
+        p = {**cls.SIMULATION_DEFAULTS, **(params or {})}
+        rng = np.random.default_rng(seed)
+
+        velocity_factor = rng.lognormal(0.0, p['velocity_sigma'], n_paths)
+        price_factor = np.maximum(rng.normal(1.0, p['price_sigma'], n_paths), 0.0)
+        cost_factor = np.maximum(1 + rng.normal(p['cost_overrun_mean'], p['cost_overrun_sigma'], n_paths), 0.0)
+        slip = rng.poisson(p['slip_mean_months'], n_paths) if p['slip_mean_months'] > 0 else np.zeros(n_paths, dtype=np.int64)
+
+        flows = cls.perturbed_flows(units, costs, velocity_factor, price_factor, cost_factor, slip)
+        return cls.batch_metrics(flows, p['discount_rate'])
+
+    @classmethod
+    def perturbed_flows(
+        cls,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        velocity_factor: np.ndarray,
+        price_factor: np.ndarray,
+        cost_factor: np.ndarray,
+        sales_delay: np.ndarray,
+        hard_cost_factor: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Builds K variants of a scenario as one (K x months) net flow matrix.
+        Each variant scales velocity, price and costs (all lines, plus HARD_COSTS lines via
+        hard_cost_factor) and delays the sales start by whole months.
+        Absorption uses each unit type's closed-form cumulative curve at velocity_factor * months_selling;
+        sales are then collected through the unit type's payment kernel (see _collections).
+        """
+        velocity_factor = np.asarray(velocity_factor, dtype=float)
+        price_factor = np.asarray(price_factor, dtype=float)
+        cost_factor = np.asarray(cost_factor, dtype=float)
+        sales_delay = np.asarray(sales_delay, dtype=np.int64)
+        n_variants = len(velocity_factor)
+
+        # Deterministic cost profiles, scaled per variant
+        is_hard = np.array([(c.get('category') or '').upper() == 'HARD_COSTS' for c in costs], dtype=bool)
+        hard_costs = cls.build_cash_flow([], [c for c, h in zip(costs, is_hard) if h])['costs']
+        other_costs = cls.build_cash_flow([], [c for c, h in zip(costs, is_hard) if not h])['costs']
+        if hard_cost_factor is None:
+            hard_cost_factor = np.ones(n_variants)
+
+        count, velocity, u_start, price = cls._unit_arrays(units)
+        models, data, sell_months = cls._absorption(units, count, velocity)
+        # Dated sales (sale_date) keep their month and sell at once: no slip, no velocity draw
+        dated = cls._present(units, 'sale_month')
+        active = (sell_months > 0) & (velocity_factor.min() > 0)
+        if active.any():
+            # A velocity factor f stretches selling time by 1 / f
+            slowest = np.where(dated, 1.0, velocity_factor.min())
+            longest_sale = np.ceil(sell_months[active] / slowest[active])
+            sales_end = int((u_start[active] + longest_sale).max() + max(sales_delay.max(), 0))
+        else:
+            sales_end = 0
+        _, _, _, _, delivery_end = cls._payment_arrays(units)
+        horizon = max(len(hard_costs), len(other_costs), sales_end, int(delivery_end[active].max(initial=0)), 1)
+
+        t = np.arange(horizon)
+        flows = np.zeros((n_variants, horizon))
+        # Sales value per distinct payment terms; each group is collected with one matrix product
+        sales_by_terms, terms_units = {}, {}
+        for i in np.flatnonzero(active):
+            delay = 0 if dated[i] else sales_delay
+            factor = np.ones(n_variants) if dated[i] else velocity_factor
+            start = np.maximum(u_start[i] + delay, 0) * np.ones(n_variants, dtype=np.int64)
+            months_selling = np.maximum(t[None, :] - start[:, None] + 1, 0) * factor[:, None]
+            row_data = {key: value[i:i + 1] for key, value in data.items()}
+            cumulative = count[i] * cumulative_share([models[i]], months_selling, 0, row_data)
+            sold = np.diff(cumulative, axis=1, prepend=0.0)
+            terms = units[i].get('payment_terms')
+            key = tuple(sorted(terms.items())) if terms else None
+            if key not in sales_by_terms:
+                sales_by_terms[key] = np.zeros((n_variants, horizon))
+                terms_units[key] = units[i]
+            sales_by_terms[key] += sold * (price[i] * price_factor[:, None])
+
+        for key, sales in sales_by_terms.items():
+            if key is None:
+                flows += sales
+                continue
+            # (sale month x collection month) kernel of these terms
+            source, month, share = cls._collections(
+                [terms_units[key]], np.zeros(horizon, dtype=np.int64), t, np.ones(horizon)
+            )
+            schedule = np.bincount(source * horizon + month, weights=share, minlength=horizon * horizon)
+            flows += sales @ schedule.reshape(horizon, horizon)
+
+        flows[:, :len(other_costs)] -= cost_factor[:, None] * other_costs[None, :]
+        flows[:, :len(hard_costs)] -= (cost_factor * hard_cost_factor)[:, None] * hard_costs[None, :]
+        return flows
+
+    # Sensitivity drivers: relative changes (0.1 = +10%), except sales_delay in whole months
+    SENSITIVITY_PARAMETERS = ("price", "velocity", "hard_costs", "total_costs", "sales_delay")
+
+    @classmethod
+    def sensitivity_cases(
+        cls,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        cases: Sequence[Dict[str, float]],
+        discount_rate: float = 0.1
+    ) -> Dict[str, np.ndarray]:
+        """
+        Metrics for many what-if cases in one pass: every case becomes a row of a stacked
+        perturbed_flows matrix and all IRRs are solved together, warm-started from the base case.
+        """
+        def factors(name, relative=True):
+            values = np.array([float(case.get(name, 0.0)) for case in cases])
+            return 1 + values if relative else values
+
+        flows = cls.perturbed_flows(
+            units, costs,
+            velocity_factor=factors("velocity"),
+            price_factor=factors("price"),
+            cost_factor=factors("total_costs"),
+            sales_delay=np.round(factors("sales_delay", relative=False)).astype(np.int64),
+            hard_cost_factor=factors("hard_costs")
+        )
+        base = cls.calculate_metrics(cls.build_cash_flow(units, costs)['net_flow'])
+        guess = base['irr'] if base['irr_status'] == STATUS_NAMES[0] else None
+        return cls.batch_metrics(flows, discount_rate, irr_guess=guess)
+
+    @staticmethod
+    def _metric_lists(metrics: Dict[str, np.ndarray], shape=None) -> Dict:
+        def clean(values):
+            values = np.where(np.isfinite(values), values, np.nan)
+            values = values.reshape(shape) if shape else values
+            return [[None if np.isnan(v) else float(v) for v in row] for row in values] if shape \
+                else [None if np.isnan(v) else float(v) for v in values]
+        return {key: clean(metrics[key]) for key in ("irr", "npv", "roi")}
+
+    @classmethod
+    def tornado(
+        cls,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        ranges: Dict[str, Sequence[float]],
+        discount_rate: float = 0.1
+    ) -> Dict:
+        """1-D sensitivity: each driver moved alone through its values; rows sorted by IRR swing around the base."""
+        cases = [{}] + [{name: value} for name, values in ranges.items() for value in values]
+        metrics = cls._metric_lists(cls.sensitivity_cases(units, costs, cases, discount_rate))
+        base = {key: metrics[key][0] for key in metrics}
+
+        rows, position = [], 1
+        for name, values in ranges.items():
+            points = []
+            for value in values:
+                points.append({"value": value, **{key: metrics[key][position] for key in metrics}})
+                position += 1
+            irrs = [p['irr'] for p in points + [base] if p['irr'] is not None]
+            rows.append({
+                "parameter": name,
+                "points": points,
+                "irr_swing": (max(irrs) - min(irrs)) if irrs else None
+            })
+        rows.sort(key=lambda r: r['irr_swing'] or 0, reverse=True)
+        return {"base": base, "tornado": rows}
+
+    @classmethod
+    def data_table(
+        cls,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        x_name: str,
+        x_values: Sequence[float],
+        y_name: str,
+        y_values: Sequence[float],
+        discount_rate: float = 0.1
+    ) -> Dict:
+        """2-D sensitivity (Excel-style data table): metrics[y][x] for every combination."""
+        cases = [{x_name: x, y_name: y} for y in y_values for x in x_values]
+        metrics = cls.sensitivity_cases(units, costs, cases, discount_rate)
+        return {
+            "x": {"parameter": x_name, "values": list(x_values)},
+            "y": {"parameter": y_name, "values": list(y_values)},
+            **cls._metric_lists(metrics, shape=(len(y_values), len(x_values)))
+        }
+
+    # Goal-seek free variables: which rows they live on and whether they are whole months
+    GOAL_SEEK_VARIABLES = {
+        "total_estimated": ("costs", False),
+        "start_month_offset": ("costs", True),
+        "avg_price": ("units", False),
+        "sales_velocity_per_month": ("units", False),
+        "sales_start_month_offset": ("units", True),
+    }
+    GOAL_SEEK_METRICS = ("irr", "npv", "roi")
+    # Points of the initial bracketing scan (all solved as one batch)
+    GOAL_SEEK_SCAN_POINTS = 33
+    # Widest whole-month range scanned exhaustively
+    GOAL_SEEK_MAX_MONTHS = 600
+
+    @classmethod
+    def goal_seek_bounds(cls, variable: str, current: float):
+        """Default search interval around the current value when the caller gives none."""
+        if cls.GOAL_SEEK_VARIABLES[variable][1]:
+            return 0.0, float(current + 120)
+        if variable == "sales_velocity_per_month":
+            # Velocity must stay positive: it divides the unit count
+            return max(current * 0.05, 0.01), max(current * 10, 1.0)
+        return 0.0, max(current * 10, 1.0)
+
+    @classmethod
+    def goal_seek(
+        cls,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        variable: str,
+        row_index: int,
+        target_metric: str,
+        target_value: float,
+        lower: Optional[float] = None,
+        upper: Optional[float] = None,
+        discount_rate: float = 0.1,
+        max_iter: int = 60
+    ) -> Dict:
+        """
+        Value of one row's `variable` that makes `target_metric` (irr / npv / roi) hit `target_value`.
+        Everything but the free row is assembled once; each trial only rebuilds that row's vector.
+        A batched scan over [lower, upper] brackets the root (the crossing nearest the current value
+        wins when there are several), then Illinois regula falsi refines it. Whole-month variables
+        are scanned exhaustively and return the nearest month on the target's side.
+        """
+        kind, integer = cls.GOAL_SEEK_VARIABLES[variable]
+        rows = units if kind == "units" else costs
+        row = dict(rows[row_index])
+        others = [r for i, r in enumerate(rows) if i != row_index]
+        fixed = cls.build_cash_flow(others, costs) if kind == "units" else cls.build_cash_flow(units, others)
+
+        current = float(row.get(variable) or 0)
+        default_lower, default_upper = cls.goal_seek_bounds(variable, current)
+        lower = default_lower if lower is None else float(lower)
+        upper = default_upper if upper is None else float(upper)
+        if variable == "sales_velocity_per_month":
+            lower = max(lower, 1e-6)
+        if upper < lower:
+            lower, upper = upper, lower
+
+        def metrics_of(net_flow: np.ndarray, irr_guess=None) -> Dict:
+            solved = cls.batch_metrics(net_flow, discount_rate, irr_guess=irr_guess)
+            irr = solved['irr'][0]
+            return {
+                "irr": float(irr) if np.isfinite(irr) else 0.0,
+                "npv": float(solved['npv'][0]),
+                "roi": float(solved['roi'][0]),
+                "irr_status": STATUS_NAMES[int(solved['irr_status'][0])]
+            }
+
+        base = metrics_of(cls.build_cash_flow(units, costs)['net_flow'])
+        irr_guess = base['irr'] if base['irr_status'] == STATUS_NAMES[0] else None
+        evaluations = 0
+
+        def flows_for(values: np.ndarray) -> Dict[str, np.ndarray]:
+            candidates = [{**row, variable: int(v) if integer else float(v)} for v in values]
+            group = np.arange(len(candidates))
+            if kind == "units":
+                trial = cls.build_cash_flow_batch(candidates, [], group, [], len(candidates))
+            else:
+                trial = cls.build_cash_flow_batch([], candidates, [], group, len(candidates))
+            horizon = max(trial['income'].shape[1], len(fixed['net_flow']))
+            income = np.zeros((len(candidates), horizon))
+            spend = np.zeros((len(candidates), horizon))
+            income[:, :trial['income'].shape[1]] += trial['income']
+            spend[:, :trial['costs'].shape[1]] += trial['costs']
+            income[:, :len(fixed['income'])] += fixed['income']
+            spend[:, :len(fixed['costs'])] += fixed['costs']
+            months = np.maximum(trial['months'], len(fixed['net_flow']))
+            return {"income": income, "costs": spend, "net_flow": income - spend, "months": months}
+
+        def gap(values) -> np.ndarray:
+            nonlocal evaluations
+            values = np.atleast_1d(np.asarray(values, dtype=float))
+            evaluations += len(values)
+            # Trailing zero padding changes none of the metrics, so every trial shares one matrix
+            metrics = cls.batch_metrics(flows_for(values)['net_flow'], discount_rate, irr_guess=irr_guess)
+            return metrics[target_metric] - target_value
+
+        # 1. Bracket
+        if integer:
+            lo, hi = int(math.ceil(lower)), int(math.floor(upper))
+            hi = min(hi, lo + cls.GOAL_SEEK_MAX_MONTHS)
+            scan = np.arange(lo, hi + 1, dtype=float)
+        else:
+            scan = np.linspace(lower, upper, cls.GOAL_SEEK_SCAN_POINTS)
+        f = gap(scan)
+        finite = np.isfinite(f)
+        crossing = finite[:-1] & finite[1:] & (np.sign(f[:-1]) * np.sign(f[1:]) <= 0)
+        candidates = np.nonzero(crossing)[0]
+
+        iterations = 0
+        if len(candidates) == 0:
+            # Unreachable inside the bounds: report the scan point that gets closest
+            status = "no_solution"
+            best = int(np.nanargmin(np.abs(f))) if finite.any() else 0
+            value, bracket = float(scan[best]), None
+        else:
+            status = "solved"
+            i = int(candidates[np.argmin(np.abs(scan[candidates] - current))])
+            a, b, fa, fb = scan[i], scan[i + 1], f[i], f[i + 1]
+            bracket = [float(a), float(b)]
+            if integer:
+                # Side of the crossing that meets the target (metric >= target)
+                value = float(a if fa >= 0 else b)
+            elif fa == 0 or fb == 0:
+                value = float(a if fa == 0 else b)
+            else:
+                # 2. Illinois regula falsi: secant steps that always keep the root bracketed
+                ftol = 1e-2 if target_metric == "npv" else 1e-9
+                side = 0
+                value = float(a)
+                for iterations in range(1, max_iter + 1):
+                    value = float((a * fb - b * fa) / (fb - fa))
+                    fv = float(gap(value)[0])
+                    if not np.isfinite(fv):
+                        value = float((a + b) / 2)
+                        fv = float(gap(value)[0])
+                    if abs(fv) <= ftol or abs(b - a) <= 1e-9 * max(1.0, abs(value)):
+                        break
+                    if np.sign(fv) == np.sign(fb):
+                        b, fb = value, fv
+                        if side == -1:
+                            fa /= 2
+                        side = -1
+                    else:
+                        a, fa = value, fv
+                        if side == 1:
+                            fb /= 2
+                        side = 1
+
+        flow = flows_for(np.array([value]))
+        months = int(flow['months'][0])
+        net_flow = flow['net_flow'][0, :months]
+        return {
+            "status": status,
+            "variable": variable,
+            "original_value": current,
+            "value": int(value) if integer else value,
+            "bounds": [lower, upper],
+            "bracket": bracket,
+            "iterations": iterations,
+            "evaluations": evaluations,
+            "original_metrics": base,
+            # Same warm start as the search, so flows with several IRRs report the root that was solved
+            "metrics": metrics_of(net_flow, irr_guess),
+            "achievable": [float(np.min(f[finite])) + target_value, float(np.max(f[finite])) + target_value]
+                if finite.any() else None,
+            "income": flow['income'][0, :months],
+            "costs": flow['costs'][0, :months],
+            "net_flow": net_flow
+        }
+
+    @staticmethod
+    def summarize_simulation(chunks: Sequence[Dict[str, np.ndarray]]) -> Dict:
+        """Merges simulate_paths chunks into percentile tables and downside probabilities."""
+        merged = {k: np.concatenate([c[k] for c in chunks]) for k in ("irr", "npv", "roi")}
+        percentiles = [5, 10, 25, 50, 75, 90, 95]
+
+        summary = {"paths": int(len(merged['npv']))}
+        for key, values in merged.items():
+            finite = values[np.isfinite(values)]
+            summary[key] = {
+                "mean": float(finite.mean()) if len(finite) else None,
+                "std": float(finite.std()) if len(finite) else None,
+                "percentiles": {
+                    f"p{q}": float(v) for q, v in zip(percentiles, np.percentile(finite, percentiles))
+                } if len(finite) else {}
+            }
+        summary["irr"]["unsolved_paths"] = int((~np.isfinite(merged['irr'])).sum())
+        summary["probability_negative_npv"] = float((merged['npv'] < 0).mean())
+        summary["probability_irr_below_zero"] = float((merged['irr'] < 0).mean())
+        return summary
+
+    @classmethod
+    def simulate(
+        cls,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        n_paths: int = 10000,
+        seed: Optional[int] = None,
+        params: Optional[Dict] = None,
+        chunk_size: int = 5000
+    ) -> Dict:
+        """
+        Monte Carlo risk simulation over velocity, price, cost overruns and schedule slips.
+        Paths are generated in chunks to bound memory; each chunk gets an independent child seed,
+        so the result is the same whether chunks run here or spread over a process pool.
+        """
+        sizes = cls.simulation_chunks(n_paths, chunk_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        chunks = [cls.simulate_paths(units, costs, size, child, params) for size, child in zip(sizes, seeds)]
+        return cls.summarize_simulation(chunks)
+
+    @staticmethod
+    def simulation_chunks(n_paths: int, chunk_size: int) -> List[int]:
+        full, rest = divmod(n_paths, chunk_size)
+        return [chunk_size] * full + ([rest] if rest else [])
 
     @classmethod
     def compare_viability_vs_monitoring(cls, projected_flow: Dict[int, float], actual_flow: Dict[int, float], current_month: int) -> Dict:
@@ -99,11 +1235,138 @@ class FinancialEngine:
         # Real-time Metrics (Actuals + Remaining Projections)
         real_time_metrics = cls.calculate_metrics(combined_flow)
         
+        # Cash position to date: what was planned for the elapsed months vs what actually happened
+        projected_to_date = sum(projected_flow.get(m, 0.0) for m in range(min(current_month, max_month + 1)))
+        actual_to_date = sum(combined_flow[:current_month])
+
         return {
+            "current_month": current_month,
             "original_projections": orig_metrics,
             "real_time_performance": real_time_metrics,
             "variance": {
                 "irr_delta": real_time_metrics["irr"] - orig_metrics["irr"],
-                "npv_delta": real_time_metrics["npv"] - orig_metrics["npv"]
+                "npv_delta": real_time_metrics["npv"] - orig_metrics["npv"],
+                "projected_to_date": projected_to_date,
+                "actual_to_date": actual_to_date,
+                "cash_delta_to_date": actual_to_date - projected_to_date
             }
         }
+
+
+class IncrementalCashFlow:
+    """
+    Keeps a scenario's per-row contribution vectors so an edit only re-derives the rows it touches:
+    the old vector is subtracted from the running totals and the new one added.
+    """
+
+    # Re-sum the totals from the stored vectors every N deltas so float drift never accumulates
+    RESUM_EVERY = 256
+
+    def __init__(self, units: Sequence[Dict], costs: Sequence[Dict], contributions: Dict[str, List[np.ndarray]]):
+        self.checksum = None
+        self.schedule_key = None  # FinancialEngine.schedule_key the rows were anchored with
+        self.last_irr = None  # warm start for the next IRR solve
+        self.unit_rows = {str(u['id']): dict(u) for u in units}
+        self.cost_rows = {str(c['id']): dict(c) for c in costs}
+        self._unit_vectors = {str(u['id']): v for u, v in zip(units, contributions['units'])}
+        self._cost_vectors = {str(c['id']): v for c, v in zip(costs, contributions['costs'])}
+        self._deltas = 0
+        self._resum()
+
+    @staticmethod
+    def _sum(vectors: Dict[str, np.ndarray], horizon: int) -> np.ndarray:
+        total = np.zeros(horizon)
+        for vector in vectors.values():
+            total[:len(vector)] += vector
+        return total
+
+    def _horizon(self) -> int:
+        lengths = [len(v) for v in self._unit_vectors.values()] + [len(v) for v in self._cost_vectors.values()]
+        return max(lengths + [1])
+
+    def _resum(self):
+        horizon = self._horizon()
+        self.income = self._sum(self._unit_vectors, horizon)
+        self.costs = self._sum(self._cost_vectors, horizon)
+        self._deltas = 0
+
+    @staticmethod
+    def _swap(total: np.ndarray, old: Optional[np.ndarray], new: Optional[np.ndarray]) -> np.ndarray:
+        if new is not None and len(new) > len(total):
+            total = np.concatenate((total, np.zeros(len(new) - len(total))))
+        if old is not None:
+            total[:len(old)] -= old
+        if new is not None:
+            total[:len(new)] += new
+        return total
+
+    def apply(
+        self,
+        units: Sequence[Dict] = (),
+        costs: Sequence[Dict] = (),
+        deleted_unit_ids: Sequence[str] = (),
+        deleted_cost_ids: Sequence[str] = ()
+    ):
+        """Applies changed/inserted rows and deletions. Only the touched rows are re-derived."""
+        contributions = FinancialEngine.row_contributions(units, costs)
+
+        for row, vector in zip(units, contributions['units']):
+            row_id = str(row['id'])
+            self.income = self._swap(self.income, self._unit_vectors.get(row_id), vector)
+            self._unit_vectors[row_id] = vector
+            self.unit_rows[row_id] = dict(row)
+        for row, vector in zip(costs, contributions['costs']):
+            row_id = str(row['id'])
+            self.costs = self._swap(self.costs, self._cost_vectors.get(row_id), vector)
+            self._cost_vectors[row_id] = vector
+            self.cost_rows[row_id] = dict(row)
+
+        for row_id in map(str, deleted_unit_ids):
+            self.income = self._swap(self.income, self._unit_vectors.pop(row_id, None), None)
+            self.unit_rows.pop(row_id, None)
+        for row_id in map(str, deleted_cost_ids):
+            self.costs = self._swap(self.costs, self._cost_vectors.pop(row_id, None), None)
+            self.cost_rows.pop(row_id, None)
+
+        self._deltas += len(units) + len(costs) + len(deleted_unit_ids) + len(deleted_cost_ids)
+        if self._deltas >= self.RESUM_EVERY:
+            self._resum()
+
+    def cash_flow(self) -> Dict[str, np.ndarray]:
+        """Current income, costs and net flow, trimmed to the live horizon."""
+        horizon = self._horizon()
+        income = np.zeros(horizon)
+        costs = np.zeros(horizon)
+        income[:min(horizon, len(self.income))] = self.income[:horizon]
+        costs[:min(horizon, len(self.costs))] = self.costs[:horizon]
+        return {"income": income, "costs": costs, "net_flow": income - costs}
+
+    @classmethod
+    def patch(
+        cls,
+        state: Optional["IncrementalCashFlow"],
+        scenario: Dict,
+        units: Sequence[Dict],
+        costs: Sequence[Dict],
+        deleted_unit_ids: Sequence[str] = (),
+        deleted_cost_ids: Sequence[str] = (),
+        financing: Optional[Dict] = None
+    ) -> tuple:
+        """
+        One line-item edit, end to end, so it can run on the engine pool: applies the changed rows
+        to `state`, or builds the state from the scenario's full `units` / `costs` when state is None,
+        then derives the cash flow, metrics and financing summary.
+        Returns (state, flow); in a worker process the state is a copy, so callers keep the returned one.
+        """
+        units = FinancialEngine.scheduled_units(units, scenario)
+        costs = FinancialEngine.scheduled_costs(costs, scenario)
+        if state is None:
+            state = cls(units, costs, FinancialEngine.row_contributions(units, costs))
+        else:
+            state.apply(units, costs, deleted_unit_ids, deleted_cost_ids)
+
+        flow = state.cash_flow()
+        flow["financing"] = FinancialEngine.financing_summary(flow["income"], flow["costs"], financing)
+        flow["metrics"] = FinancialEngine.calculate_metrics(flow["net_flow"], irr_guess=state.last_irr)
+        state.last_irr = flow["metrics"]["irr"] if flow["metrics"]["irr_status"] == "converged" else None
+        return state, flow
@@ -0,0 +1,118 @@
+import numpy as np
+from typing import Dict, Optional, Union
+
+# Batched IRR solver.
+# Replaces numpy_financial.irr (companion-matrix eigenvalues, O(n^3) per flow, one flow per call)
+# with a safeguarded Newton iteration that solves a whole (flows x months) matrix at once:
+#   1. bracket: NPV is evaluated on a fixed rate grid for every row; every grid interval where it
+#      changes sign holds a root.
+#   2. refine: Newton steps on NPV(r) in every bracket at once; any step leaving its bracket falls
+#      back to bisection, so every bracket converges.
+#   3. select: per row, the converged root closest to the target (0, or the warm-start guess), like
+#      npf.irr's "root closest to zero". Development flows often have several IRRs (costs that
+#      outlast sales leave a negative tail). Roots outside the grid, or two roots inside one grid
+#      interval (no sign change), are not seen.
+# Rates are monthly, like the engine's cash flows.
+
+CONVERGED = 0
+NO_SIGN_CHANGE = 1      # NPV never crosses zero on the grid: no IRR exists (or it is extreme)
+MAX_ITERATIONS = 2
+
+STATUS_NAMES = {
+    CONVERGED: "converged",
+    NO_SIGN_CHANGE: "no_sign_change",
+    MAX_ITERATIONS: "max_iterations",
+}
+
+# Monthly rate grid used to bracket roots (-50% .. +1000% per month)
+RATE_GRID = np.array([
+    -0.5, -0.25, -0.1, -0.05, -0.02, -0.005, 0.0, 0.005, 0.01, 0.02,
+    0.04, 0.08, 0.15, 0.3, 0.6, 1.2, 2.5, 5.0, 10.0
+])
+
+
+def _npv_and_derivative(flows: np.ndarray, rate: np.ndarray, t: np.ndarray):
+    discount = np.exp(-t[None, :] * np.log1p(rate)[:, None])
+    npv = (flows * discount).sum(axis=1)
+    derivative = -(flows * t[None, :] * discount).sum(axis=1) / (1 + rate)
+    return npv, derivative
+
+
+def solve_irr(
+    flows: np.ndarray,
+    guess: Optional[Union[float, np.ndarray]] = None,
+    tol: float = 1e-10,
+    max_iter: int = 50
+) -> Dict[str, np.ndarray]:
+    """
+    Monthly IRR for every row of `flows`.
+    `guess` (scalar or per-row) warm-starts Newton and picks which root to return when a flow
+    has several (e.g. the previous solution in a sensitivity sweep).
+    Returns {"rate", "status", "iterations"}; rate is NaN wherever status != CONVERGED.
+    """
+    flows = np.atleast_2d(np.asarray(flows, dtype=float))
+    n_rows, n_months = flows.shape
+    t = np.arange(n_months, dtype=float)
+    target = np.broadcast_to(np.asarray(0.0 if guess is None else guess, dtype=float), (n_rows,)).copy()
+    target = np.where(np.isfinite(target), target, 0.0)
+
+    # 1. Bracket: sign changes of NPV on the grid, one (row, interval) pair per candidate root
+    with np.errstate(over="ignore", invalid="ignore"):
+        grid_npv = flows @ np.exp(-np.outer(np.log1p(RATE_GRID), t)).T
+    sign = np.sign(grid_npv)
+    crosses = (sign[:, :-1] * sign[:, 1:] <= 0) & np.isfinite(grid_npv[:, :-1]) & np.isfinite(grid_npv[:, 1:])
+    crosses &= (np.abs(flows).sum(axis=1) > 0)[:, None]
+    owner, interval = np.nonzero(crosses)
+    bracketed = crosses.any(axis=1)
+
+    lo = RATE_GRID[interval].copy()
+    hi = RATE_GRID[interval + 1].copy()
+    f_lo = grid_npv[owner, interval]
+    pair_target = target[owner]
+
+    # 2. Safeguarded Newton from the guess (or the bracket midpoint when the guess is outside it)
+    rate = np.where((pair_target > lo) & (pair_target < hi), pair_target, (lo + hi) / 2)
+    pair_status = np.full(len(owner), MAX_ITERATIONS)
+    pair_iterations = np.zeros(len(owner), dtype=np.int64)
+    scale = np.maximum(np.abs(flows).max(axis=1), 1.0)[owner]
+
+    active = np.ones(len(owner), dtype=bool)
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        pairs = np.flatnonzero(active)
+        r = rate[pairs]
+        npv, derivative = _npv_and_derivative(flows[owner[pairs]], r, t)
+
+        # Shrink the bracket around the root using the sign at r
+        same_as_lo = np.sign(npv) == np.sign(f_lo[pairs])
+        lo[pairs] = np.where(same_as_lo, r, lo[pairs])
+        f_lo[pairs] = np.where(same_as_lo, npv, f_lo[pairs])
+        hi[pairs] = np.where(same_as_lo, hi[pairs], r)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = r - npv / derivative
+        in_bracket = np.isfinite(newton) & (newton > lo[pairs]) & (newton < hi[pairs])
+        step = np.where(in_bracket, newton, (lo[pairs] + hi[pairs]) / 2)
+
+        # Converged when NPV at r is ~0 (keep r) or the step no longer moves the rate (take the step)
+        on_root = np.abs(npv) <= tol * scale[pairs]
+        done = on_root | (np.abs(step - r) <= tol * (1 + np.abs(r)))
+        rate[pairs] = np.where(on_root, r, step)
+        pair_iterations[pairs] += 1
+        pair_status[pairs[done]] = CONVERGED
+        active[pairs[done]] = False
+
+    # 3. Per row, the converged root closest to the target (pairs are grouped by row, sorted by distance)
+    distance = np.where(pair_status == CONVERGED, np.abs(rate - pair_target), np.inf)
+    order = np.lexsort((distance, owner))
+    best = order[np.unique(owner[order], return_index=True)[1]]
+    converged = best[pair_status[best] == CONVERGED]
+
+    status = np.where(bracketed, MAX_ITERATIONS, NO_SIGN_CHANGE)
+    status[owner[converged]] = CONVERGED
+    solved = np.full(n_rows, np.nan)
+    solved[owner[converged]] = rate[converged]
+    # Newton steps spent on the row, over all of its brackets
+    iterations = np.bincount(owner, weights=pair_iterations, minlength=n_rows).astype(np.int64)
+    return {"rate": solved, "status": status, "iterations": iterations}
@@ -0,0 +1,39 @@
+"""
+Standalone recalculation worker.
+Drains public.recalculation_jobs without serving HTTP, so workers scale separately from API nodes:
+
+    JOB_QUEUE_BACKEND=postgres JOB_WORKERS=4 python job_worker.py
+"""
+
+import asyncio
+import signal
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from api_finance import run_recalculation, analysis_dispatcher
+from recalc_jobs import job_queue, JOB_QUEUE_BACKEND, JOB_WORKERS
+from workers import shutdown_executors
+
+
+async def main():
+    if JOB_QUEUE_BACKEND != "postgres":
+        raise SystemExit("job_worker.py needs JOB_QUEUE_BACKEND=postgres (the memory queue lives inside the API process)")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await job_queue.start(run_recalculation, max(JOB_WORKERS, 1))
+    await stop.wait()
+    await job_queue.stop()
+    await analysis_dispatcher.stop()
+    print("👋 Recalculation worker shutting down")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    finally:
+        shutdown_executors()
@@ -0,0 +1,197 @@
+import os
+import io
+import csv
+import tempfile
+import numpy as np
+from typing import Dict, Iterator, List, Tuple
+from finance_engine import FinancialEngine
+
+# Line-item x month ledger exports (CSV / Parquet / XLSX).
+# Cash flows are rebuilt from the engine LEDGER_CHUNK_LINES lines at a time, so memory stays
+# bounded by one (chunk x horizon) matrix no matter how many lines or scenarios are exported.
+# CSV is streamed as it is produced; Parquet and XLSX are container formats with a footer /
+# zip directory, so they are spooled to a temp file and then streamed from disk.
+# pyarrow / openpyxl are optional (requirements-export.txt); CSV works without them.
+LEDGER_CHUNK_LINES = int(os.getenv("LEDGER_CHUNK_LINES", "250"))
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+LEDGER_LAYOUTS = ("long", "wide")
+
+IDENTITY_COLUMNS = ["scenario_id", "scenario_name", "line_type", "line_id", "category", "item_name"]
+LONG_COLUMNS = IDENTITY_COLUMNS + ["month_index", "month_date", "amount"]
+
+XLSX_MAX_ROWS = 1_048_576
+STREAM_BLOCK_BYTES = 1 << 20
+
+# (column names, {column: values}) for one chunk of the ledger
+Chunk = Tuple[List[str], Dict[str, list]]
+
+
+def missing_dependency(fmt: str):
+    """Name of the optional package a format needs when it is not installed, else None."""
+    module = {"parquet": "pyarrow", "xlsx": "openpyxl"}.get(fmt)
+    if module is None:
+        return None
+    try:
+        __import__(module)
+    except ImportError:
+        return module
+    return None
+
+
+def _month_dates(base_date, horizon: int) -> list:
+    # Same month labelling as the monthly_cashflow_report rows
+    return [FinancialEngine.month_date(base_date, m) for m in range(horizon)]
+
+
+def _identity(scenario: Dict, line_type: str, row: Dict) -> tuple:
+    if line_type == "revenue":
+        category, name = "Sales", row.get('model_name') or "Unit type"
+    else:
+        category, name = row.get('category'), row.get('item_name')
+    return (
+        str(scenario['scenario']['id']), scenario['scenario'].get('name'), line_type,
+        str(row['id']) if row.get('id') is not None else None, category, name
+    )
+
+
+def iter_ledger_chunks(scenarios: List[Dict], layout: str, base_date_default) -> Iterator[Chunk]:
+    """
+    Yields the ledger chunk by chunk. Amounts are signed: revenue positive, costs negative,
+    so every month's column sums to the scenario's net flow.
+    long: one row per non-zero (line, month). wide: one row per line, one column per month
+    (month dates for a single scenario, month indexes plus base_date for a portfolio).
+    """
+    horizons = [
+        FinancialEngine.horizon(
+            FinancialEngine.scheduled_units(s['units'], s['scenario']), FinancialEngine.scheduled_costs(s['costs'], s['scenario'])
+        )
+        for s in scenarios
+    ]
+    wide_horizon = max(horizons, default=1)
+    single = len(scenarios) == 1
+
+    for scenario, horizon in zip(scenarios, horizons):
+        base_date = scenario['scenario'].get('base_date') or base_date_default
+        dates = _month_dates(base_date, wide_horizon if layout == "wide" else horizon)
+        if layout == "wide":
+            month_columns = [d.isoformat() for d in dates] if single else [f"month_{m}" for m in range(wide_horizon)]
+            columns = IDENTITY_COLUMNS + ([] if single else ["base_date"]) + month_columns
+        else:
+            columns = LONG_COLUMNS
+
+        lines = (
+            [("revenue", u) for u in FinancialEngine.scheduled_units(scenario['units'], scenario['scenario'])]
+            + [("cost", c) for c in FinancialEngine.scheduled_costs(scenario['costs'], scenario['scenario'])]
+        )
+        for begin in range(0, len(lines), LEDGER_CHUNK_LINES):
+            block = lines[begin:begin + LEDGER_CHUNK_LINES]
+            units = [dict(row) for kind, row in block if kind == "revenue"]
+            costs = [dict(row) for kind, row in block if kind == "cost"]
+            flows = FinancialEngine.line_item_flows(units, costs, wide_horizon if layout == "wide" else horizon)
+            matrix = np.round(np.vstack([flows['units'], -flows['costs']]), 2)
+            # vstack put revenue rows first; keep the identities in the same order
+            identities = [_identity(scenario, "revenue", u) for u in units] + [_identity(scenario, "cost", c) for c in costs]
+
+            if layout == "wide":
+                values = {name: [identity[i] for identity in identities] for i, name in enumerate(IDENTITY_COLUMNS)}
+                if not single:
+                    values["base_date"] = [base_date] * len(identities)
+                for m, name in enumerate(month_columns):
+                    values[name] = matrix[:, m].tolist()
+            else:
+                rows, months = np.nonzero(matrix)
+                values = {
+                    name: [identities[r][i] for r in rows.tolist()] for i, name in enumerate(IDENTITY_COLUMNS)
+                }
+                values["month_index"] = months.tolist()
+                values["month_date"] = [dates[m] for m in months.tolist()]
+                values["amount"] = matrix[rows, months].tolist()
+            yield columns, values
+
+
+def _chunk_rows(columns: List[str], values: Dict[str, list]):
+    return zip(*(values[name] for name in columns))
+
+
+def _stream_file(handle) -> Iterator[bytes]:
+    handle.seek(0)
+    while True:
+        block = handle.read(STREAM_BLOCK_BYTES)
+        if not block:
+            return
+        yield block
+
+
+def iter_csv(chunks: Iterator[Chunk]) -> Iterator[bytes]:
+    header_written = None
+    for columns, values in chunks:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if columns != header_written:
+            # Every chunk of one export has the same columns, so this writes a single header
+            writer.writerow(columns)
+            header_written = columns
+        writer.writerows(_chunk_rows(columns, values))
+        yield buffer.getvalue().encode()
+
+
+def iter_parquet(chunks: Iterator[Chunk]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def column_type(name: str):
+        if name in IDENTITY_COLUMNS:
+            return pa.string()
+        if name in ("month_date", "base_date"):
+            return pa.date32()
+        if name == "month_index":
+            return pa.int32()
+        return pa.float64()
+
+    with tempfile.TemporaryFile() as handle:
+        writer = None
+        for columns, values in chunks:
+            # Explicit schema: a chunk whose category is all NULL must not change the file's types
+            schema = pa.schema([(name, column_type(name)) for name in columns])
+            table = pa.table({name: values[name] for name in columns}, schema=schema)
+            if writer is None:
+                writer = pq.ParquetWriter(handle, schema, compression="zstd")
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+        yield from _stream_file(handle)
+
+
+def iter_xlsx(chunks: Iterator[Chunk]) -> Iterator[bytes]:
+    from openpyxl import Workbook
+
+    # write_only: rows go straight to the sheet's temp XML instead of a cell tree in memory
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows, header = None, 0, None
+    for columns, values in chunks:
+        for row in _chunk_rows(columns, values):
+            if sheet is None or sheet_rows >= XLSX_MAX_ROWS or columns != header:
+                sheet = workbook.create_sheet(f"Ledger {len(workbook.worksheets) + 1}")
+                sheet.append(columns)
+                sheet_rows, header = 1, columns
+            sheet.append(row)
+            sheet_rows += 1
+    if sheet is None:
+        workbook.create_sheet("Ledger 1")
+
+    with tempfile.TemporaryFile() as handle:
+        workbook.save(handle)
+        yield from _stream_file(handle)
+
+
+WRITERS = {"csv": iter_csv, "parquet": iter_parquet, "xlsx": iter_xlsx}
+
+
+def iter_ledger_export(scenarios: List[Dict], fmt: str, layout: str, base_date_default) -> Iterator[bytes]:
+    """Synchronous byte stream of the export (StreamingResponse runs it in a worker thread)."""
+    return WRITERS[fmt](iter_ledger_chunks(scenarios, layout, base_date_default))
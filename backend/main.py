@@ -5,30 +5,35 @@ ISO 27001 compliant security configuration
 
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 import os
+import hmac
 import time
-from typing import Optional
 
 # Rate limiting
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
-# JWT validation
-import jwt
-
 # Internal Modules
-from api_finance import router as finance_router
+from api_finance import router as finance_router, run_recalculation, analysis_dispatcher
+from api_portfolio import router as portfolio_router
+from auth import get_current_user, get_optional_user
+from recalc_jobs import job_queue
+from actuals_monitor import actuals_reconciler
+from telemetry import (
+    begin_request_timings, server_timing_header, render_metrics, http_request_seconds,
+    start_profiler, finish_profiler, PROFILE_HEADER, PROFILING_ENABLED, METRICS_TOKEN
+)
+from workers import shutdown_executors
 
 load_dotenv()
 
 # Environment configuration
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL", "")
-SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 
 # Allowed origins for CORS
@@ -55,8 +60,14 @@ async def lifespan(app: FastAPI):
     # Startup
     print(f"🚀 Brixaurea API starting in {ENVIRONMENT} mode")
     print(f"📡 Allowed CORS origins: {ALLOWED_ORIGINS}")
+    await job_queue.start(run_recalculation)
+    await actuals_reconciler.start()
     yield
     # Shutdown
+    await actuals_reconciler.stop()
+    await job_queue.stop()
+    await analysis_dispatcher.stop()
+    shutdown_executors()
     print("👋 Brixaurea API shutting down")
 
 
@@ -78,8 +89,9 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=[
+        PROFILE_HEADER,
         "Authorization",
         "Content-Type",
         "Accept",
@@ -90,6 +102,8 @@ app.add_middleware(
         "X-RateLimit-Limit",
         "X-RateLimit-Remaining",
         "X-RateLimit-Reset",
+        "X-Process-Time",
+        "Server-Timing",
     ],
     max_age=600,  # Cache preflight for 10 minutes
 )
@@ -118,71 +132,30 @@ async def add_security_headers(request: Request, call_next):
 # Request timing middleware (for monitoring)
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
-    """Track request processing time"""
+    """
+    Track request processing time.
+    Stage timers recorded while handling the request come back in Server-Timing; with
+    PROFILING_ENABLED=true an X-Debug-Profile header profiles the request with cProfile.
+    """
+    timings = begin_request_timings()
+    profiler = None
+    if PROFILING_ENABLED and request.headers.get(PROFILE_HEADER):
+        profiler = start_profiler()
+
     start_time = time.time()
     response = await call_next(request)
     process_time = time.time() - start_time
+
+    route = request.scope.get("route")
+    http_request_seconds.observe(f"{request.method} {route.path if route else 'unmatched'}", process_time)
     response.headers["X-Process-Time"] = str(round(process_time * 1000, 2))
+    timings.append(("total", process_time))
+    response.headers["Server-Timing"] = server_timing_header(timings)
+    if profiler is not None:
+        response.headers["X-Profile-File"] = finish_profiler(profiler, f"{request.method} {request.url.path}")
     return response
 
 
-# JWT Token validation
-def verify_jwt(token: str) -> Optional[dict]:
-    """Verify Supabase JWT token"""
-    if not SUPABASE_JWT_SECRET:
-        return None
-    
-    try:
-        payload = jwt.decode(
-            token,
-            SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
-            audience="authenticated",
-        )
-        return payload
-    except jwt.InvalidTokenError as e:
-        print(f"JWT Validation Error: {e}")
-        return None
-    except Exception as e:
-        print(f"Unexpected JWT Error: {e}")
-        return None
-
-
-# Authentication dependency
-async def get_current_user(request: Request) -> dict:
-    """Extract and validate user from Authorization header"""
-    auth_header = request.headers.get("Authorization")
-    
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(
-            status_code=401,
-            detail="Missing or invalid authorization header"
-        )
-    
-    token = auth_header.split(" ")[1]
-    payload = verify_jwt(token)
-    
-    if not payload:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid or expired token"
-        )
-    
-    return payload
-
-
-# Optional authentication (for endpoints that work with or without auth)
-async def get_optional_user(request: Request) -> Optional[dict]:
-    """Extract user if token present, otherwise None"""
-    auth_header = request.headers.get("Authorization")
-    
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return None
-    
-    token = auth_header.split(" ")[1]
-    return verify_jwt(token)
-
-
 # ============================================
 # Public Endpoints
 # ============================================
@@ -206,11 +179,22 @@ async def health_check(request: Request):
     }
 
 
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus scrape endpoint (per-process stage and request histograms), for METRICS_TOKEN bearers only"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 # ============================================
 # Protected Endpoints (require authentication)
 # ============================================
 
 app.include_router(finance_router)
+app.include_router(portfolio_router)
 
 @app.get("/api/v1/me")
 @limiter.limit("30/minute")
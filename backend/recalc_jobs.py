@@ -0,0 +1,268 @@
+import os
+import uuid
+import socket
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from db_utils import (
+    enqueue_recalculation_job,
+    count_queued_recalculation_jobs,
+    claim_recalculation_job,
+    update_recalculation_job,
+    fetch_recalculation_job,
+    recover_stale_recalculation_jobs,
+)
+from workers import run_db
+
+# Asynchronous recalculation jobs.
+# - memory: in-process asyncio queue (single API node, dev). Jobs are lost on restart.
+# - postgres: public.recalculation_jobs, claimed with FOR UPDATE SKIP LOCKED, so workers can run
+#   on dedicated nodes (python job_worker.py) and scale independently of the API.
+# Pending jobs coalesce per scenario; JOB_QUEUE_MAX bounds the backlog (enqueue fails when full).
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory").lower()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1.0"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+# Running jobs are touched this often, so a long stage is not mistaken for a lost worker
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_STALE_SECONDS / 5)))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Finished jobs kept in memory for status polling (memory backend only)
+JOB_HISTORY_SIZE = 1000
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+# handler(scenario_id, force, progress) -> result dict, or None when the scenario does not exist
+JobHandler = Callable[..., Awaitable[Optional[Dict]]]
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class _JobQueue:
+    """Worker loop shared by both backends; subclasses implement storage."""
+
+    def __init__(self):
+        self.handler: Optional[JobHandler] = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = []
+
+    async def enqueue(self, scenario_id: str, force: bool = False) -> Tuple[Dict, bool]:
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def _next(self) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def _update(self, job: Dict, **fields):
+        raise NotImplementedError
+
+    async def _release(self, job: Dict):
+        pass
+
+    async def start(self, handler: JobHandler, workers: int = JOB_WORKERS):
+        self.handler = handler
+        for i in range(workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        if workers:
+            print(f"⚙️ Recalculation job workers started: {workers} ({JOB_QUEUE_BACKEND})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._next()
+            if job is None:
+                continue
+            await self._run(job)
+
+    async def _heartbeat(self, job: Dict):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await self._update(job)
+            except Exception as e:
+                print(f"Recalculation Job Heartbeat Error ({job['id']}): {e}")
+
+    async def _run(self, job: Dict):
+        async def progress(stage: str):
+            await self._update(job, stage=stage)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await self.handler(str(job['scenario_id']), job['force'], progress)
+            if result is None:
+                await self._update(job, status="failed", stage="done", error="Scenario not found")
+            else:
+                await self._update(job, status="succeeded", stage="done", result=result)
+        except asyncio.CancelledError:
+            # Shutdown mid-job: memory jobs are lost, postgres jobs are recovered by the stale sweep
+            raise
+        except Exception as e:
+            print(f"Recalculation Job Error ({job['id']}): {e}")
+            try:
+                await self._update(job, status="failed", error=str(e))
+            except Exception as update_error:
+                print(f"Recalculation Job Update Error ({job['id']}): {update_error}")
+        finally:
+            heartbeat.cancel()
+            await self._release(job)
+
+
+class LocalJobQueue(_JobQueue):
+    """In-process queue: jobs live in this worker's memory."""
+
+    def __init__(self, max_pending: int = JOB_QUEUE_MAX):
+        super().__init__()
+        self._queue: asyncio.Queue = None
+        self._max_pending = max_pending
+        self._jobs: Dict[str, Dict] = {}
+        self._pending: Dict[str, str] = {}           # scenario_id -> queued job id
+        self._finished = OrderedDict()               # job id -> None, oldest first
+        self._scenario_locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+
+    def _get_queue(self) -> asyncio.Queue:
+        # Created lazily so it binds to the running loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_pending)
+        return self._queue
+
+    async def enqueue(self, scenario_id: str, force: bool = False) -> Tuple[Dict, bool]:
+        pending_id = self._pending.get(scenario_id)
+        if pending_id is not None:
+            job = self._jobs[pending_id]
+            job['force'] = job['force'] or force
+            return dict(job), True
+
+        queue = self._get_queue()
+        if queue.full():
+            raise QueueFull(f"{queue.qsize()} recalculation jobs already queued")
+
+        job = {
+            "id": str(uuid.uuid4()),
+            "scenario_id": scenario_id,
+            "status": "queued",
+            "stage": None,
+            "force": force,
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "worker_id": None,
+            "created_at": _now(),
+            "started_at": None,
+            "heartbeat_at": None,
+            "finished_at": None,
+        }
+        self._jobs[job['id']] = job
+        self._pending[scenario_id] = job['id']
+        queue.put_nowait(job['id'])
+        return dict(job), False
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def _next(self) -> Optional[Dict]:
+        job = self._jobs[await self._get_queue().get()]
+        scenario_id = job['scenario_id']
+        # One scenario never runs twice at once; the job stays coalescable until it holds the lock
+        lock = self._scenario_locks.setdefault(scenario_id, asyncio.Lock())
+        self._lock_users[scenario_id] = self._lock_users.get(scenario_id, 0) + 1
+        await lock.acquire()
+        if self._pending.get(scenario_id) == job['id']:
+            del self._pending[scenario_id]
+        job.update(status="running", stage="claimed", worker_id=self.worker_id, started_at=_now())
+        job['attempts'] += 1
+        return job
+
+    async def _update(self, job: Dict, **fields):
+        job.update(fields, heartbeat_at=_now())
+        if job['status'] in TERMINAL_STATUSES:
+            job['finished_at'] = _now()
+            self._finished[job['id']] = None
+            while len(self._finished) > JOB_HISTORY_SIZE:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
+
+    async def _release(self, job: Dict):
+        scenario_id = job['scenario_id']
+        self._scenario_locks[scenario_id].release()
+        self._lock_users[scenario_id] -= 1
+        if not self._lock_users[scenario_id]:
+            del self._lock_users[scenario_id]
+            del self._scenario_locks[scenario_id]
+
+
+class PostgresJobQueue(_JobQueue):
+    """Durable queue on public.recalculation_jobs, shared by every API and worker node."""
+
+    def __init__(self):
+        super().__init__()
+        self._last_sweep = 0.0
+
+    async def enqueue(self, scenario_id: str, force: bool = False) -> Tuple[Dict, bool]:
+        if await run_db(count_queued_recalculation_jobs) >= JOB_QUEUE_MAX:
+            raise QueueFull(f"{JOB_QUEUE_MAX} recalculation jobs already queued")
+        return await run_db(enqueue_recalculation_job, scenario_id, force)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await run_db(fetch_recalculation_job, job_id)
+
+    async def _next(self) -> Optional[Dict]:
+        try:
+            loop = asyncio.get_running_loop()
+            if loop.time() - self._last_sweep > JOB_STALE_SECONDS / 2:
+                self._last_sweep = loop.time()
+                recovered = await run_db(recover_stale_recalculation_jobs, JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+                if recovered:
+                    print(f"Recovered {recovered} stale recalculation jobs")
+            job = await run_db(claim_recalculation_job, self.worker_id)
+        except Exception as e:
+            print(f"Recalculation Job Claim Error: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(JOB_POLL_INTERVAL_SECONDS)
+        return job
+
+    async def _update(self, job: Dict, **fields):
+        await run_db(update_recalculation_job, job['id'], **fields)
+
+
+def _create_queue() -> _JobQueue:
+    if JOB_QUEUE_BACKEND == "postgres":
+        return PostgresJobQueue()
+    if JOB_QUEUE_BACKEND != "memory":
+        raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {JOB_QUEUE_BACKEND}")
+    return LocalJobQueue()
+
+
+job_queue = _create_queue()
+
+
+def job_view(job: Dict) -> Dict:
+    """Public representation of a job (status endpoint and SSE events)."""
+    return {
+        "job_id": str(job['id']),
+        "scenario_id": str(job['scenario_id']),
+        "status": job['status'],
+        "stage": job['stage'],
+        "attempts": job['attempts'],
+        "created_at": job['created_at'].isoformat() if job['created_at'] else None,
+        "started_at": job['started_at'].isoformat() if job['started_at'] else None,
+        "finished_at": job['finished_at'].isoformat() if job['finished_at'] else None,
+        "result": job['result'],
+        "error": job['error'],
+    }
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+from finance_engine import FinancialEngine
+from db_utils import fetch_cached_result, store_cached_result, delete_cached_results
+from workers import run_db
+
+# Content-addressed cache for scenario recalculations.
+# Tier 1: in-process LRU (per uvicorn worker). Tier 2 (optional): public.scenario_result_cache,
+# shared by every worker/node. Enable with RESULT_CACHE_SHARED=true.
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+RESULT_CACHE_SHARED = os.getenv("RESULT_CACHE_SHARED", "false").lower() == "true"
+# Incremental engine state (per-row contribution vectors) kept for recently edited scenarios
+CONTRIBUTION_CACHE_SIZE = int(os.getenv("CONTRIBUTION_CACHE_SIZE", "256"))
+
+# Columns that change as a side effect of a recalculation or of the actuals reconciler
+# (monitoring_*), or never matter to the math
+_VOLATILE_COLUMNS = {
+    "created_at", "updated_at", "health_score", "strategic_analysis", "report_input_hash",
+    "monitoring_metrics", "monitoring_updated_at"
+}
+
+
+def _normalize(value):
+    if isinstance(value, Decimal):
+        # normalize() so 10.0 and 10.00 hash the same
+        return str(value.normalize())
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _normalize_row(row: Dict) -> Dict:
+    return {k: _normalize(v) for k, v in row.items() if k not in _VOLATILE_COLUMNS}
+
+
+def scenario_fingerprint(scenario: Dict, units: List[Dict], costs: List[Dict], financing: Optional[Dict] = None) -> str:
+    """Stable SHA-256 of everything a recalculation depends on."""
+    document = {
+        "engine": FinancialEngine.VERSION,
+        "scenario": _normalize_row(scenario),
+        "financing": _normalize_row(financing) if financing else None,
+        "units": sorted((_normalize_row(u) for u in units), key=lambda r: str(r.get("id"))),
+        "costs": sorted((_normalize_row(c) for c in costs), key=lambda r: str(r.get("id"))),
+    }
+    encoded = json.dumps(document, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU with per-entry TTL, indexed by scenario for explicit invalidation."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # input_hash -> (expires_at, scenario_id, payload)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, input_hash: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(input_hash)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[input_hash]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(input_hash)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, scenario_id: str, input_hash: str, payload: Dict):
+        with self._lock:
+            self._entries[input_hash] = (time.monotonic() + self.ttl_seconds, scenario_id, payload)
+            self._entries.move_to_end(input_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, scenario_id: str) -> int:
+        with self._lock:
+            stale = [h for h, (_, sid, _) in self._entries.items() if sid == scenario_id]
+            for input_hash in stale:
+                del self._entries[input_hash]
+            return len(stale)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class ScenarioStateCache:
+    """Small LRU of live per-scenario engine state (IncrementalCashFlow), keyed by scenario id."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, scenario_id: str):
+        with self._lock:
+            state = self._entries.get(scenario_id)
+            if state is not None:
+                self._entries.move_to_end(scenario_id)
+            return state
+
+    def put(self, scenario_id: str, state):
+        with self._lock:
+            self._entries[scenario_id] = state
+            self._entries.move_to_end(scenario_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, scenario_id: str) -> int:
+        with self._lock:
+            return 1 if self._entries.pop(scenario_id, None) is not None else 0
+
+
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_SECONDS)
+contribution_cache = ScenarioStateCache(CONTRIBUTION_CACHE_SIZE)
+
+
+async def lookup(input_hash: str) -> Optional[Dict]:
+    payload = result_cache.get(input_hash)
+    if payload is None and RESULT_CACHE_SHARED:
+        payload = await run_db(fetch_cached_result, input_hash)
+        if payload is not None:
+            # Promote shared hits into the local tier (scenario id is inside the payload)
+            result_cache.put(payload.get("scenario_id"), input_hash, payload)
+    return payload
+
+
+async def store(scenario_id: str, input_hash: str, payload: Dict):
+    result_cache.put(scenario_id, input_hash, payload)
+    if RESULT_CACHE_SHARED:
+        await run_db(store_cached_result, scenario_id, input_hash, payload, RESULT_CACHE_TTL_SECONDS)
+
+
+async def invalidate(scenario_id: str) -> int:
+    removed = result_cache.invalidate(scenario_id) + contribution_cache.invalidate(scenario_id)
+    if RESULT_CACHE_SHARED:
+        removed += await run_db(delete_cached_results, scenario_id)
+    return removed
@@ -0,0 +1,204 @@
+import itertools
+import numpy as np
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterable, List, Optional
+
+# Compact, columnar in-memory form of a scenario's cost_line_items / units_mix rows.
+# fetch_scenario_data selects only the columns below through a plain tuple cursor. Each numeric
+# column becomes one float64 array (NULL -> NaN, NUMERIC Decimals converted in a single np.array
+# call instead of float() per field), every other column stays a tuple. The engine reads whole
+# columns (FinancialEngine._column); indexing a table yields Row views, read-only mappings over
+# the columns, so code written against dict rows (row.get, dict(row), {**row}) keeps working.
+
+FLOAT, INT, OBJECT = "float", "int", "object"
+
+# Columns the engine and its callers (reports, ledgers, AI analysis, change feed) read
+COST_COLUMNS = {
+    "id": OBJECT,
+    "category": OBJECT,
+    "item_name": OBJECT,
+    "calculation_method": OBJECT,
+    "input_value": FLOAT,
+    "total_estimated": FLOAT,
+    "distribution_curve": OBJECT,
+    "start_month_offset": INT,
+    "duration_months": INT,
+    "schedule_phase": OBJECT,
+    "is_impact_fee": OBJECT,
+    "display_order": INT,
+}
+UNIT_COLUMNS = {
+    "id": OBJECT,
+    "model_name": OBJECT,
+    "unit_count": INT,
+    "area_sqft": FLOAT,
+    "avg_price": FLOAT,
+    "sales_start_month_offset": INT,
+    "sales_velocity_per_month": FLOAT,
+    "optimistic_variation": FLOAT,
+    "pessimistic_variation": FLOAT,
+    "sale_date": OBJECT,
+    "schedule_phase": OBJECT,
+    "absorption_model": OBJECT,
+    "display_order": INT,
+}
+
+
+def _convert(kind: str, values: Iterable) -> Any:
+    if kind == OBJECT:
+        return tuple(values)
+    return np.array(values if isinstance(values, (list, tuple)) else list(values), dtype=float)
+
+
+class ColumnTable(Sequence):
+    """Rows of one table stored column by column; `kinds` maps column -> FLOAT / INT / OBJECT."""
+
+    __slots__ = ("kinds", "columns", "length")
+
+    def __init__(self, kinds: Dict[str, str], columns: Dict[str, Any], length: int):
+        self.kinds = kinds
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def from_rows(cls, kinds: Dict[str, str], rows: List[tuple]) -> "ColumnTable":
+        """Table from tuple-cursor rows whose fields are in `kinds` order."""
+        values = list(zip(*rows)) if rows else [()] * len(kinds)
+        return cls(kinds, {name: _convert(kind, column) for (name, kind), column in zip(kinds.items(), values)}, len(rows))
+
+    @classmethod
+    def concat(cls, parts: Sequence[Sequence]) -> Sequence:
+        """
+        One table from many (e.g. every scenario of a batch).
+        Parts that are not ColumnTables with the same columns are chained into a list of rows instead.
+        """
+        if not parts or any(not isinstance(p, ColumnTable) or p.kinds != parts[0].kinds for p in parts):
+            return [row for part in parts for row in part]
+        kinds = parts[0].kinds
+        columns = {
+            name: tuple(itertools.chain.from_iterable(p.columns[name] for p in parts)) if kind == OBJECT
+            else np.concatenate([p.columns[name] for p in parts])
+            for name, kind in kinds.items()
+        }
+        return cls(kinds, columns, sum(p.length for p in parts))
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            begin, end, step = index.indices(self.length)
+            columns = {name: column[index] for name, column in self.columns.items()}
+            return ColumnTable(self.kinds, columns, len(range(begin, end, step)))
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return Row(self, index)
+
+    def __iter__(self):
+        return (Row(self, i) for i in range(self.length))
+
+    def __repr__(self) -> str:
+        return f"ColumnTable({self.length} rows, {', '.join(self.kinds)})"
+
+    def value(self, name: str, index: int):
+        """One cell as the Python value a dict row would hold (None for NULL)."""
+        kind = self.kinds[name]
+        value = self.columns[name][index]
+        if kind == OBJECT:
+            return value
+        if np.isnan(value):
+            return None
+        return int(value) if kind == INT else float(value)
+
+    def values(self, name: str) -> Sequence:
+        """Whole column as Python values, like [row.get(name) for row in rows]."""
+        if name not in self.kinds:
+            return (None,) * self.length
+        kind = self.kinds[name]
+        if kind == OBJECT:
+            return self.columns[name]
+        cast = int if kind == INT else float
+        return [None if v != v else cast(v) for v in self.columns[name].tolist()]
+
+    def column(self, name: str, default: float = 0.0) -> np.ndarray:
+        """Numeric column with `row.get(name) or default` semantics (NULL and 0 become default)."""
+        if name not in self.kinds:
+            return np.full(self.length, default, dtype=float)
+        values = self.columns[name]
+        return np.where(np.isnan(values) | (values == 0), default, values)
+
+    def present(self, name: str) -> np.ndarray:
+        """Boolean mask of the rows where `name` is not NULL."""
+        if name not in self.kinds:
+            return np.zeros(self.length, dtype=bool)
+        if self.kinds[name] == OBJECT:
+            return np.array([v is not None for v in self.columns[name]], dtype=bool)
+        return ~np.isnan(self.columns[name])
+
+    def with_columns(self, added: Dict[str, tuple]) -> "ColumnTable":
+        """Copy sharing the existing columns plus `added` {name: (kind, values)} (replacing same-named ones)."""
+        kinds = {**self.kinds, **{name: kind for name, (kind, _) in added.items()}}
+        columns = {**self.columns, **{name: _convert(kind, values) for name, (kind, values) in added.items()}}
+        return ColumnTable(kinds, columns, self.length)
+
+    def split(self, name: str) -> Dict[str, "ColumnTable"]:
+        """Sub-tables per value of column `name` (str keys); rows must be sorted by it."""
+        parts, begin = {}, 0
+        for value, run in itertools.groupby(self.columns[name]):
+            end = begin + sum(1 for _ in run)
+            parts[str(value)] = self[begin:end]
+            begin = end
+        return parts
+
+
+class Row(Mapping):
+    """Read-only view of one ColumnTable row."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: ColumnTable, index: int):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, name: str):
+        if name not in self._table.kinds:
+            raise KeyError(name)
+        return self._table.value(name, self._index)
+
+    def __iter__(self):
+        return iter(self._table.kinds)
+
+    def __len__(self) -> int:
+        return len(self._table.kinds)
+
+    def __repr__(self) -> str:
+        return f"Row({dict(self)!r})"
+
+
+class ScenarioInputs(Mapping):
+    """
+    What fetch_scenario_data returns: the scenario and financing rows (dicts) plus the costs and
+    units as ColumnTables. Reads like the {"costs", "units", "scenario", "financing"} dict.
+    """
+
+    __slots__ = ("scenario", "financing", "costs", "units")
+    KEYS = ("costs", "units", "scenario", "financing")
+
+    def __init__(self, scenario: Optional[Dict], financing: Optional[Dict], costs: Sequence, units: Sequence):
+        self.scenario = scenario
+        self.financing = financing
+        self.costs = costs
+        self.units = units
+
+    def __getitem__(self, key: str):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
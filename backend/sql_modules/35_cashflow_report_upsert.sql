@@ -0,0 +1,20 @@
+-- 35_cashflow_report_upsert.sql
+-- Purpose: Let the backend merge monthly_cashflow_report in place (COPY + ON CONFLICT)
+--          instead of DELETE + re-INSERT, so actual_* columns survive recalculations.
+-- Date: 2026-10-18
+
+-- 1. Remove duplicate months left behind by concurrent recalculations (keep the newest row)
+DELETE FROM public.monthly_cashflow_report r
+USING public.monthly_cashflow_report newer
+WHERE r.scenario_id = newer.scenario_id
+  AND r.project_month_index = newer.project_month_index
+  AND (r.updated_at, r.id) < (newer.updated_at, newer.id);
+
+-- 2. One row per scenario month (required by ON CONFLICT)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cashflow_report_scenario_month
+ON public.monthly_cashflow_report(scenario_id, project_month_index);
+
+-- 3. Leave room on each page for HOT updates of changed months
+ALTER TABLE public.monthly_cashflow_report SET (fillfactor = 90);
+
+COMMENT ON INDEX public.idx_cashflow_report_scenario_month IS 'Natural key used by the diff-based cash flow report writer.';
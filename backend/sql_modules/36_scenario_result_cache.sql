@@ -0,0 +1,20 @@
+-- 36_scenario_result_cache.sql
+-- Purpose: Shared tier of the recalculation result cache (see backend/scenario_cache.py).
+--          Keyed by a SHA-256 of the normalized scenario inputs + engine version.
+-- Date: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS public.scenario_result_cache (
+    input_hash CHAR(64) PRIMARY KEY,
+    scenario_id UUID REFERENCES public.financial_scenarios(id) ON DELETE CASCADE,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_result_cache_scenario ON public.scenario_result_cache(scenario_id);
+CREATE INDEX IF NOT EXISTS idx_result_cache_expires ON public.scenario_result_cache(expires_at);
+
+-- Backend-only table: RLS on, no policies (service role bypasses RLS)
+ALTER TABLE public.scenario_result_cache ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE public.scenario_result_cache IS 'Content-addressed cache of scenario recalculation results (metrics, health score, AI analysis).';
@@ -0,0 +1,37 @@
+-- 37_recalculation_jobs.sql
+-- Purpose: Durable queue for asynchronous scenario recalculations (see backend/recalc_jobs.py).
+--          Workers claim rows with FOR UPDATE SKIP LOCKED; identical pending jobs coalesce.
+-- Date: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS public.recalculation_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    scenario_id UUID NOT NULL REFERENCES public.financial_scenarios(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    stage VARCHAR(20),
+    force BOOLEAN NOT NULL DEFAULT FALSE,
+    result JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id VARCHAR(100),
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+-- At most one pending job per scenario: new requests coalesce into it (ON CONFLICT target)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_recalc_jobs_pending_scenario
+ON public.recalculation_jobs(scenario_id) WHERE status = 'queued';
+
+-- Claim order for workers
+CREATE INDEX IF NOT EXISTS idx_recalc_jobs_queued
+ON public.recalculation_jobs(created_at) WHERE status = 'queued';
+
+-- Stale-job sweep and per-scenario exclusivity
+CREATE INDEX IF NOT EXISTS idx_recalc_jobs_running
+ON public.recalculation_jobs(scenario_id, heartbeat_at) WHERE status = 'running';
+
+-- Backend-only table: RLS on, no policies (service role bypasses RLS)
+ALTER TABLE public.recalculation_jobs ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE public.recalculation_jobs IS 'Asynchronous recalculation jobs: status, current stage and result payload.';
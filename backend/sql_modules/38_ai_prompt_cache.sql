@@ -0,0 +1,24 @@
+-- 38_ai_prompt_cache.sql
+-- Purpose: Persistent prompt -> response cache for the IntelligenceBrain (see backend/ai_intelligence.py).
+--          Keyed by a SHA-256 of the model name + canonical prompt (metrics bucketed), so
+--          recalculations that change nothing material reuse the previous analysis.
+-- Date: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS public.ai_prompt_cache (
+    prompt_hash CHAR(64) PRIMARY KEY,
+    model VARCHAR(100) NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    last_hit_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Age- and size-based eviction scan the oldest entries first
+CREATE INDEX IF NOT EXISTS idx_ai_prompt_cache_created ON public.ai_prompt_cache(created_at);
+CREATE INDEX IF NOT EXISTS idx_ai_prompt_cache_last_hit ON public.ai_prompt_cache(last_hit_at);
+
+-- Backend-only table: RLS on, no policies (service role bypasses RLS)
+ALTER TABLE public.ai_prompt_cache ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE public.ai_prompt_cache IS 'Memoized AI strategic analyses keyed by canonical prompt.';
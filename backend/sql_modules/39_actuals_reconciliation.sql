@@ -0,0 +1,52 @@
+-- 39_actuals_reconciliation.sql
+-- Purpose: Incremental actuals reconciliation (see reconcile_actuals in backend/db_utils.py).
+--          A trigger records which (project, month) pairs gained, lost or changed actual entries;
+--          the backend re-aggregates only those months into monthly_cashflow_report.actual_*.
+-- Date: 2026-10-18
+
+-- 1. Months waiting to be re-aggregated
+CREATE TABLE IF NOT EXISTS public.actual_cashflow_dirty_months (
+    project_id UUID NOT NULL, -- no FK: deleting a project cascades to its entries, whose trigger still marks months
+    month_date DATE NOT NULL, -- first day of the month
+    marked_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (project_id, month_date)
+);
+
+-- Backend-only table: RLS on, no policies (service role bypasses RLS)
+ALTER TABLE public.actual_cashflow_dirty_months ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE public.actual_cashflow_dirty_months IS 'Project months whose actual entries changed since the last reconciliation.';
+
+-- 2. Mark the old and the new month of every changed entry
+CREATE OR REPLACE FUNCTION public.mark_actual_month_dirty()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.project_id IS NOT NULL THEN
+        INSERT INTO public.actual_cashflow_dirty_months (project_id, month_date)
+        VALUES (OLD.project_id, date_trunc('month', OLD.month_date)::date)
+        ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.project_id IS NOT NULL THEN
+        INSERT INTO public.actual_cashflow_dirty_months (project_id, month_date)
+        VALUES (NEW.project_id, date_trunc('month', NEW.month_date)::date)
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS trg_actual_entries_dirty ON public.actual_cashflow_entries;
+CREATE TRIGGER trg_actual_entries_dirty
+AFTER INSERT OR UPDATE OF project_id, month_date, type, amount OR DELETE ON public.actual_cashflow_entries
+FOR EACH ROW EXECUTE FUNCTION public.mark_actual_month_dirty();
+
+-- 3. Report rows are matched to actual months by month_date
+CREATE INDEX IF NOT EXISTS idx_cashflow_report_scenario_date
+ON public.monthly_cashflow_report(scenario_id, month_date);
+
+-- 4. Latest feasibility-vs-monitoring snapshot per scenario
+ALTER TABLE public.financial_scenarios
+ADD COLUMN IF NOT EXISTS monitoring_metrics JSONB,
+ADD COLUMN IF NOT EXISTS monitoring_updated_at TIMESTAMPTZ;
+
+COMMENT ON COLUMN public.financial_scenarios.monitoring_metrics IS 'Projected vs actuals-to-date IRR/NPV and cash variance (FinancialEngine.compare_viability_vs_monitoring).';
@@ -0,0 +1,235 @@
+-- 40_portfolio_rollups.sql
+-- Purpose: Portfolio analytics rollups per scenario, project and organization (served by /api/v1/portfolio).
+--          Summary tables rather than materialized views so they refresh incrementally: every
+--          recalculation upserts its scenario row and re-rolls only that project and organization.
+-- Date: 2026-10-18
+
+-- 1. Latest engine results per scenario (written by the backend after each recalculation)
+CREATE TABLE IF NOT EXISTS public.scenario_portfolio_summary (
+    scenario_id UUID PRIMARY KEY REFERENCES public.financial_scenarios(id) ON DELETE CASCADE,
+    project_id UUID NOT NULL REFERENCES public.projects(id) ON DELETE CASCADE,
+    irr DOUBLE PRECISION,
+    npv DECIMAL(18,2),
+    roi DOUBLE PRECISION,
+    irr_status VARCHAR(30),
+    health_score INTEGER,
+    total_gdv DECIMAL(18,2),          -- gross sales over the horizon
+    total_costs DECIMAL(18,2),
+    peak_equity DECIMAL(18,2),        -- deepest cumulative cash deficit (unlevered)
+    equity_required DECIMAL(18,2),    -- levered equity, NULL without financing (or after a line-item delta edit)
+    break_even_month INTEGER,         -- months until cumulative cash stays >= 0, NULL if it never does
+    months INTEGER,
+    engine_version VARCHAR(20),
+    calculated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_scenario_portfolio_project ON public.scenario_portfolio_summary(project_id);
+
+-- 2. One row per project: identity columns kept in sync by trigger, metrics from its primary scenario
+--    (the 'base' scenario, else the most recently calculated one)
+CREATE TABLE IF NOT EXISTS public.project_portfolio_summary (
+    project_id UUID PRIMARY KEY REFERENCES public.projects(id) ON DELETE CASCADE,
+    organization_id UUID,
+    user_id UUID,
+    name VARCHAR(255),
+    status VARCHAR(50),
+    deleted_at TIMESTAMPTZ,
+    scenario_count INTEGER NOT NULL DEFAULT 0,
+    primary_scenario_id UUID,
+    irr DOUBLE PRECISION,
+    npv DECIMAL(18,2),
+    roi DOUBLE PRECISION,
+    health_score INTEGER,
+    total_gdv DECIMAL(18,2),
+    total_costs DECIMAL(18,2),
+    peak_equity DECIMAL(18,2),
+    break_even_month INTEGER,
+    irr_min DOUBLE PRECISION,         -- spread across the project's scenarios
+    irr_max DOUBLE PRECISION,
+    calculated_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Keyset pagination: one index per sortable column, scoped to the organization (active projects only)
+CREATE INDEX IF NOT EXISTS idx_project_portfolio_org_calculated
+ON public.project_portfolio_summary(organization_id, calculated_at DESC NULLS LAST, project_id DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_project_portfolio_org_irr
+ON public.project_portfolio_summary(organization_id, irr DESC NULLS LAST, project_id DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_project_portfolio_org_health
+ON public.project_portfolio_summary(organization_id, health_score DESC NULLS LAST, project_id DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_project_portfolio_org_gdv
+ON public.project_portfolio_summary(organization_id, total_gdv DESC NULLS LAST, project_id DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_project_portfolio_org_equity
+ON public.project_portfolio_summary(organization_id, peak_equity DESC NULLS LAST, project_id DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_project_portfolio_user_calculated
+ON public.project_portfolio_summary(user_id, calculated_at DESC NULLS LAST, project_id DESC) WHERE deleted_at IS NULL;
+
+-- 3. One row per organization, over its active projects
+CREATE TABLE IF NOT EXISTS public.organization_portfolio_summary (
+    organization_id UUID PRIMARY KEY REFERENCES public.organizations(id) ON DELETE CASCADE,
+    project_count INTEGER NOT NULL DEFAULT 0,
+    calculated_project_count INTEGER NOT NULL DEFAULT 0,
+    total_gdv DECIMAL(18,2) DEFAULT 0,
+    total_costs DECIMAL(18,2) DEFAULT 0,
+    total_peak_equity DECIMAL(18,2) DEFAULT 0,
+    weighted_irr DOUBLE PRECISION,    -- IRR weighted by GDV
+    avg_health_score DOUBLE PRECISION,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Backend-only tables: RLS on, no policies (service role bypasses RLS)
+ALTER TABLE public.scenario_portfolio_summary ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.project_portfolio_summary ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.organization_portfolio_summary ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE public.scenario_portfolio_summary IS 'Latest recalculation results per scenario (portfolio rollup source).';
+COMMENT ON TABLE public.project_portfolio_summary IS 'Per-project portfolio rollup: primary scenario metrics, exposure and IRR spread.';
+COMMENT ON TABLE public.organization_portfolio_summary IS 'Per-organization portfolio totals over active projects.';
+
+-- 4. Incremental refresh functions
+CREATE OR REPLACE FUNCTION public.refresh_project_portfolio(p_project_id UUID)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO public.project_portfolio_summary AS s (
+        project_id, organization_id, user_id, name, status, deleted_at, scenario_count,
+        primary_scenario_id, irr, npv, roi, health_score, total_gdv, total_costs, peak_equity,
+        break_even_month, irr_min, irr_max, calculated_at, updated_at
+    )
+    SELECT p.id, p.organization_id, p.user_id, p.name, p.status, p.deleted_at,
+           (SELECT COUNT(*) FROM public.financial_scenarios fs WHERE fs.project_id = p.id),
+           pick.scenario_id, pick.irr, pick.npv, pick.roi, pick.health_score, pick.total_gdv, pick.total_costs,
+           pick.peak_equity, pick.break_even_month, spread.irr_min, spread.irr_max, pick.calculated_at, NOW()
+    FROM public.projects p
+    LEFT JOIN LATERAL (
+        SELECT ss.*
+        FROM public.scenario_portfolio_summary ss
+        JOIN public.financial_scenarios fs ON fs.id = ss.scenario_id
+        WHERE ss.project_id = p.id
+        ORDER BY (fs.scenario_type = 'base') DESC NULLS LAST, ss.calculated_at DESC
+        LIMIT 1
+    ) pick ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT MIN(irr) AS irr_min, MAX(irr) AS irr_max
+        FROM public.scenario_portfolio_summary WHERE project_id = p.id
+    ) spread ON TRUE
+    WHERE p.id = p_project_id
+    ON CONFLICT (project_id) DO UPDATE SET
+        organization_id = EXCLUDED.organization_id,
+        user_id = EXCLUDED.user_id,
+        name = EXCLUDED.name,
+        status = EXCLUDED.status,
+        deleted_at = EXCLUDED.deleted_at,
+        scenario_count = EXCLUDED.scenario_count,
+        primary_scenario_id = EXCLUDED.primary_scenario_id,
+        irr = EXCLUDED.irr,
+        npv = EXCLUDED.npv,
+        roi = EXCLUDED.roi,
+        health_score = EXCLUDED.health_score,
+        total_gdv = EXCLUDED.total_gdv,
+        total_costs = EXCLUDED.total_costs,
+        peak_equity = EXCLUDED.peak_equity,
+        break_even_month = EXCLUDED.break_even_month,
+        irr_min = EXCLUDED.irr_min,
+        irr_max = EXCLUDED.irr_max,
+        calculated_at = EXCLUDED.calculated_at,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.refresh_organization_portfolio(p_organization_id UUID)
+RETURNS VOID AS $$
+BEGIN
+    IF p_organization_id IS NULL
+       OR NOT EXISTS (SELECT 1 FROM public.organizations WHERE id = p_organization_id) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO public.organization_portfolio_summary AS o (
+        organization_id, project_count, calculated_project_count, total_gdv, total_costs,
+        total_peak_equity, weighted_irr, avg_health_score, updated_at
+    )
+    SELECT p_organization_id,
+           COUNT(*),
+           COUNT(s.calculated_at),
+           COALESCE(SUM(s.total_gdv), 0),
+           COALESCE(SUM(s.total_costs), 0),
+           COALESCE(SUM(s.peak_equity), 0),
+           SUM(s.irr * s.total_gdv) / NULLIF(SUM(s.total_gdv) FILTER (WHERE s.irr IS NOT NULL), 0),
+           AVG(s.health_score),
+           NOW()
+    -- Joined to projects: a project being deleted is already gone there while its summary row may linger
+    FROM public.project_portfolio_summary s
+    JOIN public.projects p ON p.id = s.project_id
+    WHERE s.organization_id = p_organization_id AND p.deleted_at IS NULL
+    ON CONFLICT (organization_id) DO UPDATE SET
+        project_count = EXCLUDED.project_count,
+        calculated_project_count = EXCLUDED.calculated_project_count,
+        total_gdv = EXCLUDED.total_gdv,
+        total_costs = EXCLUDED.total_costs,
+        total_peak_equity = EXCLUDED.total_peak_equity,
+        weighted_irr = EXCLUDED.weighted_irr,
+        avg_health_score = EXCLUDED.avg_health_score,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- 5. Keep the rollups in step with project / scenario edits that do not go through a recalculation
+CREATE OR REPLACE FUNCTION public.sync_project_portfolio()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM public.refresh_organization_portfolio(OLD.organization_id);
+        RETURN NULL;
+    END IF;
+
+    PERFORM public.refresh_project_portfolio(NEW.id);
+    -- Renames and status changes do not move the organization totals
+    IF TG_OP = 'INSERT'
+       OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at
+       OR OLD.organization_id IS DISTINCT FROM NEW.organization_id THEN
+        PERFORM public.refresh_organization_portfolio(NEW.organization_id);
+        IF TG_OP = 'UPDATE' AND OLD.organization_id IS DISTINCT FROM NEW.organization_id THEN
+            PERFORM public.refresh_organization_portfolio(OLD.organization_id);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS trg_projects_portfolio ON public.projects;
+CREATE TRIGGER trg_projects_portfolio
+AFTER INSERT OR UPDATE OF name, status, deleted_at, organization_id, user_id OR DELETE ON public.projects
+FOR EACH ROW EXECUTE FUNCTION public.sync_project_portfolio();
+
+CREATE OR REPLACE FUNCTION public.sync_scenario_portfolio()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_project_id UUID;
+BEGIN
+    FOREACH v_project_id IN ARRAY ARRAY[
+        CASE WHEN TG_OP IN ('UPDATE', 'DELETE') THEN OLD.project_id END,
+        CASE WHEN TG_OP IN ('INSERT', 'UPDATE') THEN NEW.project_id END
+    ] LOOP
+        -- Skipped for projects that are being deleted (their own trigger refreshes the organization)
+        IF v_project_id IS NOT NULL AND EXISTS (SELECT 1 FROM public.projects WHERE id = v_project_id) THEN
+            PERFORM public.refresh_project_portfolio(v_project_id);
+            -- A new scenario has no results yet: only the project's scenario_count moves
+            IF TG_OP <> 'INSERT' THEN
+                PERFORM public.refresh_organization_portfolio(
+                    (SELECT organization_id FROM public.projects WHERE id = v_project_id)
+                );
+            END IF;
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS trg_scenarios_portfolio ON public.financial_scenarios;
+CREATE TRIGGER trg_scenarios_portfolio
+AFTER INSERT OR UPDATE OF project_id, scenario_type OR DELETE ON public.financial_scenarios
+FOR EACH ROW EXECUTE FUNCTION public.sync_scenario_portfolio();
+
+-- 6. Backfill: one row per existing project and organization (metrics arrive with the next recalculation)
+SELECT public.refresh_project_portfolio(id) FROM public.projects;
+SELECT public.refresh_organization_portfolio(id) FROM public.organizations;
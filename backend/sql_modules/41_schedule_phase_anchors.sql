@@ -0,0 +1,23 @@
+-- 41_schedule_phase_anchors.sql
+-- Purpose: Anchor cost lines and unit types to a macro schedule phase (see FinancialEngine.compile_schedule).
+--          An anchored row's start offset counts from the start of its phase instead of month 0, so
+--          editing the phase columns of financial_scenarios (migration 26) re-times every row anchored to it.
+-- Date: 2026-10-18
+
+ALTER TABLE public.cost_line_items
+ADD COLUMN IF NOT EXISTS schedule_phase VARCHAR(30) CHECK (schedule_phase IN (
+    'land', 'pre_construction', 'construction', 'closeout',
+    'incorp_dd', 'incorp_projects', 'incorp_permits', 'incorp_closing', 'financing',
+    'construction_pre', 'construction_main', 'sales', 'delivery'
+));
+
+ALTER TABLE public.units_mix
+ADD COLUMN IF NOT EXISTS schedule_phase VARCHAR(30) CHECK (schedule_phase IN (
+    'land', 'pre_construction', 'construction', 'closeout',
+    'incorp_dd', 'incorp_projects', 'incorp_permits', 'incorp_closing', 'financing',
+    'construction_pre', 'construction_main', 'sales', 'delivery'
+));
+
+COMMENT ON COLUMN public.cost_line_items.schedule_phase IS 'Macro schedule phase the line is timed from: start_month_offset counts from the phase start; with duration_months NULL the line runs to the end of the phase.';
+COMMENT ON COLUMN public.units_mix.schedule_phase IS 'Macro schedule phase the unit type is timed from: sales_start_month_offset counts from the phase start.';
+COMMENT ON COLUMN public.financial_scenarios.delivery_start_offset IS 'Months from study_date to the first deliveries; closings are collected across the delivery window.';
@@ -0,0 +1,16 @@
+-- 42_absorption_models.sql
+-- Purpose: Selectable sales absorption models (see backend/absorption_models.py).
+--          units_mix.absorption_model overrides the scenario default; both accept `name` or `name:params`
+--          (linear, bell[:spread], logistic[:k], manual, inventory[:rate]). NULL means linear.
+--          manual reads manual_absorption_curve and inventory defaults to absorption_rate_monthly.
+-- Date: 2026-10-18
+
+ALTER TABLE public.financial_scenarios
+ADD COLUMN IF NOT EXISTS absorption_model VARCHAR(50);
+
+ALTER TABLE public.units_mix
+ADD COLUMN IF NOT EXISTS absorption_model VARCHAR(50);
+
+COMMENT ON COLUMN public.financial_scenarios.absorption_model IS 'Default absorption model of the unit types: linear (velocity), bell[:spread], logistic[:k], manual (manual_absorption_curve) or inventory[:rate %].';
+COMMENT ON COLUMN public.units_mix.absorption_model IS 'Absorption model of this unit type; NULL uses the scenario default.';
+COMMENT ON COLUMN public.financial_scenarios.manual_absorption_curve IS 'Percent of the units sold in each month from the sales start (absorption_model = manual).';
@@ -0,0 +1,10 @@
+-- 43_report_input_hash.sql
+-- Purpose: Remember which inputs a scenario's monthly_cashflow_report / portfolio rows were last written from.
+--          run_recalculation serves unchanged inputs from the result cache; a cache hit still rewrites the
+--          report when it was last written from other inputs (an edit, a revert, the change feed, a batch).
+-- Date: 2026-10-18
+
+ALTER TABLE public.financial_scenarios
+ADD COLUMN IF NOT EXISTS report_input_hash VARCHAR(64);
+
+COMMENT ON COLUMN public.financial_scenarios.report_input_hash IS 'scenario_fingerprint of the inputs the stored report was computed from; NULL when unknown (delta recalculations).';
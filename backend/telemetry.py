@@ -0,0 +1,132 @@
+import os
+import io
+import re
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Lightweight, dependency-free instrumentation.
+# - Histograms in the Prometheus text format, served by GET /metrics (per process) to scrapers
+#   presenting METRICS_TOKEN; without a token the endpoint is off.
+# - Per-request stage timings, returned in the Server-Timing header.
+# - Opt-in cProfile of a single request (X-Debug-Profile header), only with PROFILING_ENABLED=true.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/brixaurea-profiles")
+PROFILE_HEADER = "X-Debug-Profile"
+
+# Seconds; spans sub-millisecond NumPy stages up to slow model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a single label, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, description: str, label: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self._series: Dict[str, List] = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, series in sorted(self._series.items()):
+                label = f'{self.label}="{value}"'
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-1]}')
+                lines.append(f"{self.name}_sum{{{label}}} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{{{label}}} {series[-1]}")
+        return lines
+
+
+recalc_stage_seconds = Histogram(
+    "brixaurea_recalc_stage_seconds", "Duration of recalculation pipeline stages.", "stage"
+)
+http_request_seconds = Histogram(
+    "brixaurea_http_request_seconds", "HTTP request duration by route.", "route"
+)
+
+# (stage, seconds) pairs collected for the current request; None outside a request
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def begin_request_timings() -> List[Tuple[str, float]]:
+    """Starts collecting stage timings for the current request and returns the (shared) list."""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, seconds: float):
+    recalc_stage_seconds.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Server-Timing value (durations in ms); repeated stages are summed."""
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
+
+
+def render_metrics() -> str:
+    lines = recalc_stage_seconds.render() + http_request_seconds.render()
+    return "\n".join(lines) + "\n"
+
+
+def start_profiler() -> Optional[cProfile.Profile]:
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another request is already being profiled (one profiler per interpreter)
+        return None
+    return profiler
+
+
+def finish_profiler(profiler: cProfile.Profile, label: str, top: int = 25) -> str:
+    """
+    Stops the profiler, writes a .prof file (open with snakeviz / pstats) and logs the hottest calls.
+    Only the event-loop thread is profiled: engine work in the process pool shows up as waiting.
+    """
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")[:80]
+    path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{safe_label}.prof")
+    profiler.dump_stats(path)
+
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(top)
+    print(f"🔬 Profile {label} -> {path}\n{report.getvalue()}")
+    return path
@@ -0,0 +1,58 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from db_utils import DB_POOL_MAX
+
+# Executors that keep blocking work off the asyncio event loop.
+# - DB: one thread per pooled psycopg2 connection, so a query never waits on a thread
+#   and threads never outnumber connections (ThreadedConnectionPool raises when exhausted).
+# - Engine: a bounded process pool so NumPy / IRR math runs on every core, not on the loop.
+#   ENGINE_WORKERS=0 runs the engine in a thread instead (useful on tiny instances and in dev).
+ENGINE_WORKERS = int(os.getenv("ENGINE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="brix-db")
+_engine_executor = None
+
+def get_engine_executor():
+    global _engine_executor
+    if _engine_executor is None:
+        if ENGINE_WORKERS > 0:
+            # spawn: children only import the engine, never inherit the loop or the DB pool
+            _engine_executor = ProcessPoolExecutor(
+                max_workers=ENGINE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            _engine_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="brix-engine")
+    return _engine_executor
+
+async def run_db(fn, *args, **kwargs):
+    """Runs a synchronous db_utils call on the DB executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, partial(fn, *args, **kwargs))
+
+async def run_engine(fn, *args, **kwargs):
+    """
+    Runs a CPU-bound FinancialEngine call on the engine pool.
+    `fn` and its arguments must be picklable (module-level functions / classmethods, plain dicts).
+    """
+    global _engine_executor
+    loop = asyncio.get_running_loop()
+    executor = get_engine_executor()
+    try:
+        return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        # A crashed worker poisons the whole pool; drop it so the next call starts a fresh one
+        if _engine_executor is executor:
+            _engine_executor = None
+        raise
+
+def shutdown_executors():
+    global _engine_executor
+    if _engine_executor is not None:
+        _engine_executor.shutdown(wait=True, cancel_futures=True)
+        _engine_executor = None
+    _db_executor.shutdown(wait=True, cancel_futures=True)